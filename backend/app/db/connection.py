@@ -1,25 +1,220 @@
-import os
+import time
 
-from contextlib import contextmanager
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from contextlib import asynccontextmanager
+from typing import Any, Optional
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
 
-connection_url = os.getenv("POSTGRES_URL")
-if not connection_url:
-    raise ValueError("POSTGRES_URL environment variable is not set")
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Connection pool recording how long checkouts wait for a connection.
 
-engine = create_engine(connection_url)
+    The wait covers the whole checkout: waiting for a connection to be
+    checked in, opening a new one within the overflow, and the pre-ping.
+    Durations are also observed as the `db_acquire` stage. Only checkouts
+    finding neither an idle connection nor room to open one count as
+    `waiting` while they last.
+    """
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+        self.acquired = 0
+        self.acquire_timeouts = 0
+        self.acquire_seconds = 0.0
 
-@contextmanager
-def get_db():
-    db = SessionLocal()
+    def connect(self):
+        from app.services.metrics import metrics
+
+        started = time.monotonic()
+        waiting = self.checkedin() == 0 and 0 <= self._max_overflow <= self.overflow()
+        self.waiting += waiting
+
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self.acquire_timeouts += 1
+            raise
+        finally:
+            self.waiting -= waiting
+            elapsed = time.monotonic() - started
+            self.acquire_seconds += elapsed
+            metrics.observe("db_acquire", elapsed)
+
+        self.acquired += 1
+
+        return connection
+
+class DatabaseSettings(BaseSettings):
+    """
+    Database connection and pool settings, read from the environment.
+
+    Pool settings are per engine and per worker process, so the database
+    must accept `workers * (pool_size + max_overflow)` connections for the
+    primary, and as many for the replica when one is set.
+    """
+
+    model_config = SettingsConfigDict(env_prefix="DB_", extra="ignore")
+
+    url: Optional[str] = Field(None, validation_alias="POSTGRES_URL")
+    replica_url: Optional[str] = Field(None, validation_alias="POSTGRES_REPLICA_URL")
+    pool_size: int = 10
+    max_overflow: int = 10
+    pool_timeout: float = 10
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    statement_timeout_ms: int = 30000
+    idle_in_transaction_timeout_ms: int = 60000
+
+    def engine_options(self, url: str) -> dict[str, Any]:
+        """
+        Get the engine keyword arguments for a database URL.
+
+        Args:
+            url: Database connection URL
+
+        Returns:
+            dict[str, Any]: Pool options, and server-side timeouts for Postgres
+        """
+
+        if make_url(url).get_backend_name() != "postgresql":
+            return { "pool_pre_ping": self.pool_pre_ping }
+
+        return {
+            "poolclass": TimedQueuePool,
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_timeout": self.pool_timeout,
+            "pool_recycle": self.pool_recycle,
+            "pool_pre_ping": self.pool_pre_ping,
+            "connect_args": {
+                "options": (
+                    f"-c statement_timeout={self.statement_timeout_ms} "
+                    f"-c idle_in_transaction_session_timeout={self.idle_in_transaction_timeout_ms}"
+                )
+            }
+        }
+
+def get_async_url(url: str) -> str:
+    """
+    Get the SQLAlchemy URL using the async psycopg driver for a Postgres URL.
+
+    Args:
+        url: Database connection URL
+
+    Returns:
+        str: The same URL with the `postgresql+psycopg` driver
+    """
+
+    database_url = make_url(url)
+
+    if database_url.get_backend_name() == "postgresql":
+        database_url = database_url.set(drivername="postgresql+psycopg")
+
+    return database_url.render_as_string(hide_password=False)
+
+_settings: Optional[DatabaseSettings] = None
+_engines: dict[str, AsyncEngine] = {}
+
+def get_settings() -> DatabaseSettings:
+    """
+    Get the database settings, read from the environment on first use.
+    """
+
+    global _settings
+
+    if _settings is None:
+        _settings = DatabaseSettings()
+
+    return _settings
+
+def get_engine(readonly: bool = False) -> AsyncEngine:
+    """
+    Get a database engine, creating it on first use.
+
+    Args:
+        readonly: Whether to get the read replica engine. The primary engine
+            is returned when no replica is configured.
+
+    Returns:
+        AsyncEngine: Engine connected to POSTGRES_URL, or POSTGRES_REPLICA_URL for reads
+
+    Raises:
+        ValueError: If POSTGRES_URL is not set
+    """
+
+    settings = get_settings()
+    name = "replica" if readonly and settings.replica_url else "primary"
+
+    if name not in _engines:
+        url = settings.replica_url if name == "replica" else settings.url
+
+        if not url:
+            raise ValueError("POSTGRES_URL environment variable is not set")
+
+        _engines[name] = create_async_engine(get_async_url(url), **settings.engine_options(url))
+
+    return _engines[name]
+
+async def dispose_engine():
+    """
+    Close the connections of the database engines that were created.
+    """
+
+    while _engines:
+        _, engine = _engines.popitem()
+        await engine.dispose()
+
+def get_pool_stats() -> dict[str, dict]:
+    """
+    Get the connection pool utilization of every created engine.
+
+    Returns:
+        dict[str, dict]: Pool size, checked in, checked out and overflow
+        connections, checkouts waiting for a connection, and the number,
+        timeouts and total seconds of checkouts, keyed by `primary` or `replica`
+    """
+
+    stats = {}
+
+    for name, engine in _engines.items():
+        pool = engine.pool
+        stats[name] = {
+            "size": pool.size() if hasattr(pool, "size") else 0,
+            "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else 0,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else 0,
+            "overflow": max(pool.overflow(), 0) if hasattr(pool, "overflow") else 0,
+            "waiting": getattr(pool, "waiting", 0),
+            "acquired": getattr(pool, "acquired", 0),
+            "acquire_timeouts": getattr(pool, "acquire_timeouts", 0),
+            "acquire_seconds": round(getattr(pool, "acquire_seconds", 0.0), 6),
+        }
+
+    return stats
+
+SessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+@asynccontextmanager
+async def get_db(readonly: bool = False):
+    """
+    Open a database session, committed on success and rolled back on error.
+
+    Args:
+        readonly: Whether the session only reads, so it can use the read replica.
+            Replicas lag behind the primary, so reads that must see the latest
+            writes should use the primary.
+    """
+
+    db = SessionLocal(bind=get_engine(readonly))
     try:
         yield db
-        db.commit()
+        await db.commit()
     except:
-        db.rollback()
+        await db.rollback()
         raise
     finally:
-        db.close()
+        await db.close()
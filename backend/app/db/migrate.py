@@ -0,0 +1,169 @@
+"""
+Database schema migration.
+
+Creates missing tables, then adds the columns and indexes that were added
+to the models after an existing table was created. Columns are never
+dropped or altered. On Postgres the migration holds an advisory lock, so
+containers starting together apply it one after the other, and the indexes
+of existing tables are built with CREATE INDEX CONCURRENTLY once the rest
+of the migration is committed, so writes to those tables aren't blocked
+while they are built.
+
+The production server runs it before starting its workers.
+
+Usage:
+    python -m app.db.migrate
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import re
+import asyncio
+import logging
+
+from typing import Optional
+from sqlalchemy import Index, inspect, text
+from sqlalchemy.engine import Connection, Dialect
+from sqlalchemy.schema import CreateIndex
+
+from app.db.connection import get_engine, dispose_engine
+from app.db.models import Base
+
+logger = logging.getLogger("app.db.migrate")
+
+# Key of the Postgres advisory lock serializing concurrent migrations
+LOCK_KEY = 0x656c6f71
+
+def upgrade(connection: Connection, deferred: Optional[list[Index]] = None) -> list[str]:
+    """
+    Bring the database schema up to date with the models.
+
+    Args:
+        connection: Database connection, inside a transaction
+        deferred: If set, the missing indexes of existing tables are appended
+            to it instead of being created
+
+    Returns:
+        list[str]: Description of every applied change
+    """
+
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SELECT pg_advisory_xact_lock({LOCK_KEY})")
+
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    changes = []
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            table.create(connection)
+            changes.append(f"create table {table.name}")
+            continue
+
+        existing_columns = { column["name"] for column in inspector.get_columns(table.name) }
+
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+            changes.append(f"add column {table.name}.{column.name}")
+
+        existing_indexes = { index["name"] for index in inspector.get_indexes(table.name) }
+
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+
+            if deferred is not None:
+                deferred.append(index)
+            else:
+                connection.execute(CreateIndex(index))
+                changes.append(f"create index {index.name}")
+
+    return changes
+
+def create_index_concurrently_sql(index: Index, dialect: Dialect) -> str:
+    """
+    Get the Postgres statement building an index without blocking writes to its table.
+    """
+
+    statement = str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect))
+
+    return re.sub(r"^CREATE (UNIQUE )?INDEX", r"CREATE \1INDEX CONCURRENTLY", statement)
+
+def create_indexes_concurrently(connection: Connection, indexes: list[Index]) -> list[str]:
+    """
+    Build indexes on Postgres without blocking writes, one after the other.
+
+    Args:
+        connection: Database connection in autocommit mode
+        indexes: Indexes to create
+
+    Returns:
+        list[str]: Description of every applied change
+    """
+
+    changes = []
+
+    connection.exec_driver_sql(f"SELECT pg_advisory_lock({LOCK_KEY})")
+
+    try:
+        for index in indexes:
+            # A concurrent build that was interrupted leaves an invalid index behind
+            invalid = connection.execute(
+                text("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+                { "name": index.name }
+            ).scalar()
+
+            if invalid:
+                connection.exec_driver_sql(f'DROP INDEX CONCURRENTLY "{index.name}"')
+
+            connection.exec_driver_sql(create_index_concurrently_sql(index, connection.dialect))
+            changes.append(f"create index {index.name} concurrently")
+
+    finally:
+        connection.exec_driver_sql(f"SELECT pg_advisory_unlock({LOCK_KEY})")
+
+    return changes
+
+async def migrate() -> list[str]:
+    """
+    Apply the schema changes in a single transaction, then build the
+    indexes of existing tables concurrently on Postgres.
+
+    Returns:
+        list[str]: Description of every applied change
+    """
+
+    engine = get_engine()
+    deferred: Optional[list[Index]] = [] if engine.dialect.name == "postgresql" else None
+
+    async with engine.begin() as connection:
+        changes = await connection.run_sync(upgrade, deferred)
+
+    if deferred:
+        async with engine.connect() as connection:
+            connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+            changes += await connection.run_sync(create_indexes_concurrently, deferred)
+
+    return changes
+
+async def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    try:
+        changes = await migrate()
+    finally:
+        await dispose_engine()
+
+    for change in changes:
+        logger.info(change)
+
+    logger.info("Schema up to date, %d changes applied", len(changes))
+
+if __name__ == "__main__":
+    asyncio.run(main())
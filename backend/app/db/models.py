@@ -1,14 +1,15 @@
-from sqlalchemy import Column, ForeignKey, Integer, UUID, JSON, DateTime, String, func
+from sqlalchemy import Column, ForeignKey, Index, Integer, UUID, JSON, DateTime, String, Text, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import deferred
 
-Db = Session
+Db = AsyncSession
 
 Base = declarative_base()
 
 class User(Base):
     __tablename__ = 'users'
-    id = Column(UUID, primary_key=True, index=True)
+    id = Column(UUID(as_uuid=False), primary_key=True, index=True)
     username = Column(String, unique=True, nullable=False)
     email = Column(String, unique=True, nullable=False)
     password_hash = Column(String, nullable=False)
@@ -16,14 +17,24 @@ class User(Base):
 
 class Session(Base):
     __tablename__ = 'sessions'
-    id = Column(UUID, primary_key=True, index=True)
+    id = Column(UUID(as_uuid=False), primary_key=True, index=True)
     title = Column(String, nullable=False)
-    user_id = Column(UUID, ForeignKey('users.id'), nullable=False)
+    user_id = Column(UUID(as_uuid=False), ForeignKey('users.id'), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    
+    summary = deferred(Column(Text, nullable=True))
+    summarized_until = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index('ix_sessions_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
+
 class ChatHistory(Base):
     __tablename__ = 'chat_history'
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(UUID, ForeignKey('sessions.id'), nullable=False)
+    session_id = Column(UUID(as_uuid=False), ForeignKey('sessions.id'), nullable=False)
     message = Column(JSON, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_chat_history_session_id_id', 'session_id', 'id'),
+    )
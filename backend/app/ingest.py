@@ -0,0 +1,436 @@
+"""
+Knowledge base ingestion pipeline.
+
+Streams source documents, splits them into chunks, embeds the chunks in
+batches and upserts them into the knowledge base index. Chunk IDs are
+content hashes, so chunks already present in the index are skipped and
+re-ingesting the same sources only embeds what changed. Running servers
+notice the new index within KNOWLEDGE_BASE_CHECK_SECONDS and drop the
+contexts and answers they cached from the old one.
+
+Usage:
+    python -m app.ingest data/faq.jsonl docs/ --target local --local-path data/index
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import argparse
+import numpy as np
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Iterable, Iterator
+from pinecone import Pinecone
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+from app.services.embeddings import EMBEDDING_MODEL, Embedder
+from app.services.retrievers import LocalRetriever, PineconeRetriever
+
+logger = logging.getLogger("app.ingest")
+
+Chunk = dict[str, str]
+
+def read_documents(paths: Iterable[str]) -> Iterator[dict]:
+    """
+    Stream source documents from files and directories.
+
+    `.jsonl` files hold one document per line with `text` and optional
+    `category` and `question` fields. `.md` and `.txt` files are single
+    documents whose category is the file name.
+
+    Args:
+        paths: Files or directories to read
+
+    Yields:
+        dict: Documents with `text`, `category`, `source` and the path of their `file`
+    """
+
+    for path in paths:
+        path = Path(os.path.normpath(path))
+        files = sorted(path.rglob("*")) if path.is_dir() else [path]
+
+        for file in files:
+            if file.suffix == ".jsonl":
+                with open(file) as lines:
+                    for number, line in enumerate(lines):
+                        if not line.strip():
+                            continue
+
+                        document = json.loads(line)
+
+                        yield {
+                            "text": document["text"],
+                            "category": document.get("category") or document.get("question") or file.stem,
+                            "source": f"{file}:{number + 1}",
+                            "file": file.as_posix()
+                        }
+
+            elif file.suffix in (".md", ".txt"):
+                yield {
+                    "text": file.read_text(),
+                    "category": file.stem.replace("-", " ").replace("_", " "),
+                    "source": str(file),
+                    "file": file.as_posix()
+                }
+
+def chunk_document(document: dict, chunk_size: int, chunk_overlap: int) -> Iterator[Chunk]:
+    """
+    Split a document into chunks along paragraph boundaries.
+
+    Args:
+        document: Document with `text`, `category`, `source` and `file`
+        chunk_size: Maximum number of characters in a chunk
+        chunk_overlap: Number of trailing characters repeated at the start of the next chunk,
+            smaller than `chunk_size`
+
+    Yields:
+        Chunk: Chunks with an `id` made of the file path and a content hash,
+        `text`, `category` and `source`
+    """
+
+    paragraphs = [paragraph.strip() for paragraph in document["text"].split("\n\n") if paragraph.strip()]
+    pieces = []
+
+    for paragraph in paragraphs:
+        while len(paragraph) > chunk_size:
+            pieces.append(paragraph[:chunk_size])
+            paragraph = paragraph[chunk_size - chunk_overlap:]
+        pieces.append(paragraph)
+
+    text = ""
+
+    for piece in pieces:
+        if text and len(text) + len(piece) + 2 > chunk_size:
+            yield _make_chunk(document, text)
+
+            # Only as much of the overlap as still fits next to the piece
+            overlap = min(chunk_overlap, chunk_size - len(piece) - 2)
+            text = text[-overlap:] if overlap > 0 else ""
+
+        text = f"{text}\n\n{piece}" if text else piece
+
+    if text:
+        yield _make_chunk(document, text)
+
+def _make_chunk(document: dict, text: str) -> Chunk:
+    digest = hashlib.sha256(f"{EMBEDDING_MODEL}\0{document['category']}\0{text}".encode()).hexdigest()
+
+    return {
+        "id": f"{document['file']}#{digest[:32]}",
+        "text": text,
+        "category": document["category"],
+        "source": document["source"]
+    }
+
+def id_prefix(path: str) -> str:
+    """
+    Get the prefix shared by the ids of every chunk read from a path.
+
+    Args:
+        path: File or directory passed to the pipeline
+
+    Returns:
+        str: `<file>#` for a file, `<directory>/` for a directory
+    """
+
+    path = Path(os.path.normpath(path))
+
+    return f"{path.as_posix()}/" if path.is_dir() else f"{path.as_posix()}#"
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+
+    for item in items:
+        batch.append(item)
+
+        if len(batch) == size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+class PineconeSink:
+    """
+    Writes chunks to the remote Pinecone index.
+
+    When anything changed, the version record read by PineconeRetriever is
+    updated on close, so running servers drop their cached retrievals.
+    Listing chunk ids by prefix requires a serverless index.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.dimension = 0
+        self.changed = False
+
+    def existing_ids(self, ids: list[str]) -> set[str]:
+        return set(self.index.fetch(ids=ids).vectors.keys())
+
+    def list_ids(self, prefix: str) -> Iterator[str]:
+        for ids in self.index.list(prefix=prefix):
+            yield from ids
+
+    def upsert(self, chunks: list[Chunk], embeddings: list[list]):
+        self.dimension = len(embeddings[0]) if embeddings else self.dimension
+        self.changed = True
+        self.index.upsert(vectors=[
+            {
+                "id": chunk["id"],
+                "values": embedding,
+                "metadata": chunk
+            }
+            for chunk, embedding in zip(chunks, embeddings)
+        ])
+
+    def delete(self, ids: list[str]):
+        self.index.delete(ids=ids)
+        self.changed = True
+
+    def close(self):
+        if not self.changed:
+            return
+
+        dimension = self.dimension or self.index.describe_index_stats()["dimension"]
+
+        self.index.upsert(
+            vectors=[{
+                "id": PineconeRetriever.VERSION_ID,
+                "values": [1.0] + [0.0] * (dimension - 1),
+                "metadata": { "version": str(time.time_ns()) }
+            }],
+            namespace=PineconeRetriever.VERSION_NAMESPACE
+        )
+
+class LocalSink:
+    """
+    Writes chunks to a local index directory read by LocalRetriever.
+
+    Existing vectors are loaded up front and, when anything changed, the
+    files are rewritten atomically when the sink is closed. LocalRetriever
+    reloads them once it sees the new files.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.changed = False
+        self.dimension = 0
+        self.vectors: dict[str, np.ndarray] = {}
+        self.metadata: dict[str, Chunk] = {}
+
+        if os.path.exists(os.path.join(path, LocalRetriever.METADATA_FILE)):
+            index = LocalRetriever(path)
+
+            self.dimension = index.vectors.shape[1]
+
+            for row, metadata in enumerate(index.metadata):
+                self.vectors[metadata["id"]] = np.array(index.vectors[row])
+                self.metadata[metadata["id"]] = metadata
+
+    def existing_ids(self, ids: list[str]) -> set[str]:
+        return { id for id in ids if id in self.metadata }
+
+    def list_ids(self, prefix: str) -> Iterator[str]:
+        for id, metadata in list(self.metadata.items()):
+            if "#" not in id:
+                # Ids from before they were prefixed with their file
+                id = re.sub(r":\d+$", "", metadata.get("source", "")) + "#"
+
+            if id.startswith(prefix):
+                yield metadata["id"]
+
+    def delete(self, ids: list[str]):
+        for id in ids:
+            self.vectors.pop(id, None)
+            self.metadata.pop(id, None)
+
+        self.changed = True
+
+    def upsert(self, chunks: list[Chunk], embeddings: list[list]):
+        for chunk, embedding in zip(chunks, embeddings):
+            vector = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+
+            self.vectors[chunk["id"]] = vector / norm if norm else vector
+            self.metadata[chunk["id"]] = chunk
+            self.dimension = len(vector)
+            self.changed = True
+
+    def close(self):
+        ids = list(self.metadata)
+
+        if not self.changed:
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+
+        vectors_path = os.path.join(self.path, LocalRetriever.VECTORS_FILE)
+        metadata_path = os.path.join(self.path, LocalRetriever.METADATA_FILE)
+
+        with open(f"{vectors_path}.tmp", "wb") as file:
+            np.save(file, np.stack([self.vectors[id] for id in ids]).astype(np.float32) if ids else np.empty((0, self.dimension), dtype=np.float32))
+
+        with open(f"{metadata_path}.tmp", "w") as file:
+            json.dump([self.metadata[id] for id in ids], file)
+
+        os.replace(f"{vectors_path}.tmp", vectors_path)
+        os.replace(f"{metadata_path}.tmp", metadata_path)
+
+def ingest(
+    paths: list[str],
+    embedder: Embedder,
+    sink,
+    batch_size: int,
+    workers: int,
+    chunk_size: int,
+    chunk_overlap: int
+) -> dict:
+    """
+    Chunk, embed and upsert source documents, skipping unchanged chunks.
+
+    Chunks under the given paths that weren't produced by this run, from
+    edited or deleted documents, are deleted from the index afterwards.
+
+    Args:
+        paths: Files or directories to ingest
+        embedder: Embedding client
+        sink: PineconeSink or LocalSink receiving the chunks
+        batch_size: Number of chunks embedded and upserted together
+        workers: Number of batches upserted in parallel
+        chunk_size: Maximum number of characters in a chunk
+        chunk_overlap: Number of characters shared by consecutive chunks
+
+    Returns:
+        dict: Number of chunks read, skipped, written and deleted, elapsed seconds and throughput
+
+    Raises:
+        ValueError: If the chunk overlap isn't smaller than the chunk size
+    """
+
+    if not 0 <= chunk_overlap < chunk_size:
+        raise ValueError("chunk_overlap must be at least 0 and smaller than chunk_size")
+
+    retrying = retry(
+        stop=stop_after_attempt(5),
+        wait=wait_exponential(multiplier=0.5, max=30),
+        reraise=True
+    )
+    existing_ids = retrying(sink.existing_ids)
+    embed = retrying(embedder.embed)
+    upsert = retrying(sink.upsert)
+    delete = retrying(sink.delete)
+
+    def write(chunks: list[Chunk], embeddings: list[list]) -> int:
+        upsert(chunks, embeddings)
+        return len(chunks)
+
+    stats = { "read": 0, "skipped": 0, "written": 0, "deleted": 0 }
+    started = time.monotonic()
+    pending: set[Future] = set()
+    seen: set[str] = set()
+
+    chunks = (
+        chunk
+        for document in read_documents(paths)
+        for chunk in chunk_document(document, chunk_size, chunk_overlap)
+    )
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upsert") as executor:
+        for batch in batched(chunks, batch_size):
+            batch = list({ chunk["id"]: chunk for chunk in batch }.values())
+            seen.update(chunk["id"] for chunk in batch)
+            existing = existing_ids([chunk["id"] for chunk in batch])
+            changed = [chunk for chunk in batch if chunk["id"] not in existing]
+
+            stats["read"] += len(batch)
+            stats["skipped"] += len(batch) - len(changed)
+
+            if changed:
+                embeddings = embed([chunk["text"] for chunk in changed], input_type="passage")
+
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                    for future in done:
+                        stats["written"] += future.result()
+
+                pending.add(executor.submit(write, changed, embeddings))
+
+            elapsed = time.monotonic() - started
+            logger.info("%d chunks read, %d skipped, %.1f chunks/s", stats["read"], stats["skipped"], stats["read"] / elapsed)
+
+        for future in wait(pending).done:
+            stats["written"] += future.result()
+
+    stale = [
+        id
+        for prefix in dict.fromkeys(id_prefix(path) for path in paths)
+        for id in sink.list_ids(prefix)
+        if id not in seen
+    ]
+
+    for ids in batched(stale, 1000):
+        delete(ids)
+        stats["deleted"] += len(ids)
+
+    if stale:
+        logger.info("%d stale chunks deleted", len(stale))
+
+    sink.close()
+
+    elapsed = time.monotonic() - started
+
+    return {
+        **stats,
+        "seconds": round(elapsed, 3),
+        "chunks_per_second": round(stats["read"] / elapsed, 1) if elapsed else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest documents into the knowledge base index.")
+    parser.add_argument("paths", nargs="+", help="Source files or directories (.jsonl, .md, .txt)")
+    parser.add_argument("--target", choices=["pinecone", "local"], default=os.getenv("RETRIEVER_BACKEND", "pinecone"))
+    parser.add_argument("--local-path", default=os.getenv("LOCAL_INDEX_PATH", "data/index"))
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("INGEST_BATCH_SIZE", "96")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INGEST_WORKERS", "4")))
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    args = parser.parse_args()
+
+    if not 0 <= args.chunk_overlap < args.chunk_size:
+        parser.error("--chunk-overlap must be at least 0 and smaller than --chunk-size")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    pinecone = Pinecone(
+        api_key=os.getenv("PINECONE_API_KEY"),
+        environment=os.getenv("PINECONE_ENV")
+    )
+
+    if args.target == "local":
+        sink = LocalSink(args.local_path)
+    else:
+        sink = PineconeSink(pinecone.Index(os.getenv("PINECONE_INDEX_NAME")))
+
+    stats = ingest(
+        args.paths,
+        Embedder(pinecone, EMBEDDING_MODEL),
+        sink,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap
+    )
+
+    print(json.dumps(stats))
+
+if __name__ == "__main__":
+    main()
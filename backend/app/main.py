@@ -2,22 +2,56 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.db.connection import engine
-from app.db.models import Base
+from app.db.connection import dispose_engine, get_pool_stats
 from app.routers import healthcheck, chat, auth
+from app.services.metrics import metrics
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await chat.chat_service.start()
+    try:
+        yield
+    finally:
+        await chat.chat_service.writer.stop()
+        await dispose_engine()
+        chat.chat_service.close()
+        auth.auth_service.close()
 
-Base.metadata.create_all(bind=engine)
+app = FastAPI(lifespan=lifespan)
+
+metrics.gauge(
+    "db_pool_connections",
+    "Connections of the database pools by state.",
+    lambda: [
+        ({ "engine": engine, "state": state }, pool[state])
+        for engine, pool in get_pool_stats().items()
+        for state in ("size", "checked_in", "checked_out", "overflow")
+    ]
+)
+
+metrics.gauge(
+    "db_pool_waiting",
+    "Checkouts waiting for a connection of the database pools.",
+    lambda: [({ "engine": engine }, pool["waiting"]) for engine, pool in get_pool_stats().items()]
+)
+
+metrics.gauge(
+    "db_pool_acquire_timeouts",
+    "Checkouts that timed out waiting for a connection of the database pools.",
+    lambda: [({ "engine": engine }, pool["acquire_timeouts"]) for engine, pool in get_pool_stats().items()]
+)
 
 origins = [
     "http://localhost:3000",
     "https://localhost:3000",
 ]
 
+app.state.origins = origins
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
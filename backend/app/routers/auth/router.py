@@ -6,7 +6,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 
 from app.db.connection import get_db
 from app.services.auth import AuthService
-from app.schemas.auth import UserCreate, UserValidate
+from app.schemas.auth import PasswordChange, UserCreate, UserValidate
 
 auth_service = AuthService()
 
@@ -20,35 +20,33 @@ async def register(user_data: UserCreate, response: Response):
     Register a new user and get authentication tokens.
     """
     try:
-        with get_db() as db:
-            token_response = auth_service.create_user(
-                username=user_data.username,
-                email=user_data.email,
-                password=user_data.password,
-                db=db
-            )
-        
-            # response.set_cookie(
-            #     key="refresh_token",
-            #     value=token_response.refresh_token,
-            #     httponly=True,
-            #     secure=False,
-            #     samesite="lax",
-            #     max_age=60 * 60 * 24 * os.getenv("REFRESH_TOKEN_EXPIRE_DAYS"),
-            #     path="/"
-            # )
-
-            response.set_cookie(
-                key="access_token",
-                value=token_response.access_token,
-                httponly=True,
-                secure=False,
-                samesite="lax",
-                max_age=60 * os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"),
-                path="/"
-            )
+        token_response = await auth_service.create_user(
+            username=user_data.username,
+            email=user_data.email,
+            password=user_data.password
+        )
+    
+        # response.set_cookie(
+        #     key="refresh_token",
+        #     value=token_response.refresh_token,
+        #     httponly=True,
+        #     secure=False,
+        #     samesite="lax",
+        #     max_age=60 * 60 * 24 * os.getenv("REFRESH_TOKEN_EXPIRE_DAYS"),
+        #     path="/"
+        # )
+
+        response.set_cookie(
+            key="access_token",
+            value=token_response.access_token,
+            httponly=True,
+            secure=False,
+            samesite="lax",
+            max_age=60 * os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"),
+            path="/"
+        )
 
-            return UserValidate(user_id=token_response.user_id)
+        return UserValidate(user_id=token_response.user_id)
     
     except ValueError as error:
         raise HTTPException(
@@ -62,34 +60,32 @@ async def login(response: Response, form_data: OAuth2PasswordRequestForm = Depen
     Authenticate a user and get new tokens.
     """
     try:
-        with get_db() as db:
-            token_response = auth_service.authenticate_user(
-                email=form_data.username,
-                password=form_data.password,
-                db=db
-            )
-
-            # response.set_cookie(
-            #     key="refresh_token",
-            #     value=token_response.refresh_token,
-            #     httponly=True,
-            #     secure=False,
-            #     samesite="lax",
-            #     max_age=60 * 60 * 24 * os.getenv("REFRESH_TOKEN_EXPIRE_DAYS"),
-            #     path="/"
-            # )
+        token_response = await auth_service.authenticate_user(
+            email=form_data.username,
+            password=form_data.password
+        )
 
-            response.set_cookie(
-                key="access_token",
-                value=token_response.access_token,
-                httponly=True,
-                secure=False,
-                samesite="lax",
-                max_age=60 * os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"),
-                path="/"
-            )
+        # response.set_cookie(
+        #     key="refresh_token",
+        #     value=token_response.refresh_token,
+        #     httponly=True,
+        #     secure=False,
+        #     samesite="lax",
+        #     max_age=60 * 60 * 24 * os.getenv("REFRESH_TOKEN_EXPIRE_DAYS"),
+        #     path="/"
+        # )
+
+        response.set_cookie(
+            key="access_token",
+            value=token_response.access_token,
+            httponly=True,
+            secure=False,
+            samesite="lax",
+            max_age=60 * os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"),
+            path="/"
+        )
 
-            return UserValidate(user_id=token_response.user_id)
+        return UserValidate(user_id=token_response.user_id)
     
     except ValueError as error:
         raise HTTPException(
@@ -131,8 +127,8 @@ async def refresh_token(request: Request, response: Response):
         if not refresh_token:
             raise HTTPException(status_code=401, detail="Refresh token missing")
     
-        with get_db() as db:
-            refresh_token_response = auth_service.refresh_token(refresh_token, db)
+        async with get_db() as db:
+            refresh_token_response = await auth_service.refresh_token(refresh_token, db)
 
             response.set_cookie(
                 key="access_token",
@@ -152,3 +148,53 @@ async def refresh_token(request: Request, response: Response):
             detail=str(error),
             headers={ "WWW-Authenticate": "Bearer" }
         )
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(request: Request, response: Response):
+    """
+    Revoke the tokens of the current user and clear its cookies.
+    """
+    access_token = request.cookies.get("access_token")
+    refresh_token = request.cookies.get("refresh_token")
+
+    if access_token:
+        auth_service.revoke_token(access_token)
+
+    if refresh_token:
+        auth_service.revoke_token(refresh_token, is_refresh_token=True)
+
+    response.delete_cookie(key="access_token", path="/")
+    response.delete_cookie(key="refresh_token", path="/")
+
+@router.post("/password", response_model=UserValidate)
+async def change_password(password_data: PasswordChange, request: Request, response: Response):
+    """
+    Change the password of the current user, signing out its other sessions.
+    """
+    try:
+        user_id = auth_service.validate_token(request.cookies.get("access_token"))
+
+        token_response = await auth_service.change_password(
+            user_id=user_id,
+            current_password=password_data.current_password,
+            new_password=password_data.new_password
+        )
+
+        response.set_cookie(
+            key="access_token",
+            value=token_response.access_token,
+            httponly=True,
+            secure=False,
+            samesite="lax",
+            max_age=60 * os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"),
+            path="/"
+        )
+
+        return UserValidate(user_id=token_response.user_id)
+
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=str(error),
+            headers={ "WWW-Authenticate": "Bearer" }
+        )
@@ -1,12 +1,19 @@
-from uuid import uuid4
+import os
 
-from fastapi import APIRouter, HTTPException, Request
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket, status
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from langchain_core.messages import messages_from_dict
 
 from app.db.connection import get_db
 from app.services import ChatService
-from app.schemas import Prompt, Message, ChatHistory, Session, User
+from app.services.sessions import encode_session_cursor, decode_session_cursor
+from app.schemas import Prompt, Message, ChatHistory, Session, SessionPage, User
 from app.routers.auth import auth_service
+from app.services.metrics import metrics
+from app.routers.chat.socket import ChatSocket
 
 chat_service = ChatService()
 
@@ -15,62 +22,148 @@ router = APIRouter(prefix="/chat", tags=["chat"])
 @router.post("/completion")
 async def chat_completion(prompt: Prompt, request: Request):
 
+    trace = metrics.trace()
+
     access_token = request.cookies.get("access_token")
 
-    user_id = auth_service.validate_token(access_token)
+    with trace.stage("auth"):
+        user_id = auth_service.validate_token(access_token)
 
-    embedding = chat_service.generate_embedding(prompt.content)
+    # Admitted first, so requests shed under load don't create a session
+    with trace.stage("admission"):
+        admission = await chat_service.admission.acquire(user_id)
+
+    try:
+        await chat_service.ensure_session(prompt.sessionId, user_id, prompt.content)
+    except BaseException:
+        admission.release()
+        raise
 
     return StreamingResponse(
-        chat_service.stream_chat_response(
+        admission.wrap(chat_service.stream_chat_response(
             prompt.sessionId, 
             user_id, 
-            prompt.content, 
-            embedding
-        ),
-        media_type='text/event-stream'
+            prompt.content,
+            use_cache=not prompt.noCache
+        )),
+        media_type='text/event-stream',
+        headers={ "Server-Timing": trace.server_timing() } if metrics.enabled else None,
+        background=BackgroundTask(admission.release)
     )
 
-@router.get("/sessions", response_model=list[Session])
-async def get_sessions(request: Request):
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+
+    # Browsers send the session cookie on cross-site handshakes and CORS doesn't apply to them
+    if websocket.headers.get("origin") not in websocket.app.state.origins:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    access_token = websocket.cookies.get("access_token")
+
+    try:
+        user_id = auth_service.validate_token(access_token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+
+    await ChatSocket(
+        websocket,
+        chat_service,
+        user_id,
+        access_token,
+        max_streams=int(os.getenv("WS_MAX_STREAMS", "8")),
+        max_pending=int(os.getenv("WS_MAX_PENDING_MESSAGES", "64"))
+    ).serve()
+
+@router.get("/sessions", response_model=SessionPage)
+async def get_sessions(
+    request: Request,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None
+):
 
     access_token = request.cookies.get("access_token")
 
     user_id = auth_service.validate_token(access_token)
+
+    try:
+        cursor = decode_session_cursor(before) if before else None
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
     
-    with get_db() as db:
-        sessions = chat_service.sessions.get_sessions(user_id, db)
+    async with get_db(readonly=True) as db:
+        sessions = await chat_service.sessions.get_sessions(user_id, limit + 1, cursor, db)
+
+    page = sessions[:limit]
 
-        return [
+    return SessionPage(
+        sessions=[
             Session(
                 id=session.id, 
                 title=session.title,
                 created_at=session.created_at
             ) 
-            for session in sessions
-        ]
+            for session in page
+        ],
+        next_cursor=encode_session_cursor(page[-1].created_at, page[-1].id) if len(sessions) > limit else None
+    )
 
 
 @router.get("/history/{session_id}", response_model=ChatHistory)
-async def get_chat_history(session_id: str, request: Request):
+async def get_chat_history(
+    session_id: str,
+    request: Request,
+    limit: int = Query(100, ge=1, le=500),
+    before: Optional[int] = None
+):
 
     access_token = request.cookies.get("access_token")
 
-    auth_service.validate_token(access_token)
-    
-    history = chat_service.sessions.get_message_history(session_id)
+    user_id = auth_service.validate_token(access_token)
+
+    await chat_service.authorize_session(session_id, user_id)
+
+    # Unwritten turns are read before the database, see MessageWriter.pending
+    pending = chat_service.writer.pending(session_id) if before is None else []
+
+    # Read from the primary, the replica may lag behind the turn just streamed
+    async with get_db() as db:
+        rows = await chat_service.sessions.get_recent_messages(session_id, limit + 1, db, before=before)
 
-    if not history:
-        raise HTTPException(status_code=404, detail="Session history not found")
+    messages = messages_from_dict([row.message for row in rows])
+    written = { message.id for message in messages }
+
+    # Unwritten messages are the newest ones and count against the limit
+    unwritten = [message for message in pending if message.id not in written][-limit:]
+    kept = limit - len(unwritten)
+    page = list(zip(rows, messages))[max(len(rows) - kept, 0):] if kept else []
+
+    if len(rows) <= kept:
+        next_cursor = None
+    elif page:
+        next_cursor = str(page[0][0].id)
+    else:
+        next_cursor = str(rows[-1].id + 1)
 
     return ChatHistory(
         messages = [
             Message(
-                id=str(uuid4()),
+                id=str(row.id),
+                content=message.content,
+                type=message.type
+            ) for row, message in page
+        ] + [
+            # Row ids are only assigned once written
+            Message(
+                id=None,
                 content=message.content,
                 type=message.type
-            ) for message in history.messages
-        ]
+            ) for message in unwritten
+        ],
+        next_cursor=next_cursor
     )
 
 @router.get("/user", response_model=User)
@@ -80,8 +173,8 @@ async def get_user(request: Request):
 
     user_id = auth_service.validate_token(access_token)
 
-    with get_db() as db:
-        user = auth_service.users.get_user_by_id(user_id, db)
+    async with get_db() as db:
+        user = await auth_service.users.get_user_by_id(user_id, db)
         
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
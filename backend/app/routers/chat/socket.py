@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import orjson
+
+from typing import Any, Optional
+from fastapi import HTTPException, WebSocket
+from pydantic import ValidationError
+
+from app.schemas import Prompt
+from app.services import ChatService
+from app.routers.auth import auth_service
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class ChatSocket:
+    """
+    A WebSocket connection multiplexing the completion streams of a user.
+
+    The user is authenticated once, when the connection opens, and handshakes
+    from origins other than the allowed CORS origins are refused. Clients send
+    JSON messages, each completion carrying an `id` chosen by the client:
+
+        { "type": "completion", "id": "1", "sessionId": "...", "content": "...", "noCache": false }
+        { "type": "cancel", "id": "1" }
+
+    Every server message carries the `id` of its completion next to the
+    event, as sent on the SSE endpoint. A stream ends with
+    `on_chat_model_end` and `timing`, with `cancelled` once it was
+    cancelled, or with `error` carrying the HTTP status it would have had.
+
+    Messages are sent from a bounded queue, so streams stop pulling
+    generated tokens while the client reads slower than they're produced.
+    """
+
+    def __init__(self, websocket: WebSocket, chat_service: ChatService, user_id: str, access_token: str, max_streams: int, max_pending: int):
+        """
+        Args:
+            websocket: The accepted connection
+            chat_service: Service generating the completions
+            user_id: The identifier of the authenticated user
+            access_token: The token the connection was authenticated with
+            max_streams: Maximum number of completions streamed at once on the connection
+            max_pending: Maximum number of messages queued ahead of the client
+        """
+
+        self.websocket = websocket
+        self.chat_service = chat_service
+        self.user_id = user_id
+        self.access_token = access_token
+        self.max_streams = max_streams
+        self.streams: dict[str, asyncio.Task] = {}
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+
+    async def serve(self):
+        """
+        Handle the messages of the client until it disconnects, then cancel its streams.
+        """
+
+        sender = asyncio.create_task(self._send())
+
+        try:
+            while True:
+                message = await self.websocket.receive()
+
+                if message["type"] == "websocket.disconnect":
+                    break
+
+                try:
+                    data = orjson.loads(message.get("text") or message.get("bytes") or b"")
+                except orjson.JSONDecodeError:
+                    await self._error(None, 400, "Invalid JSON message")
+                    continue
+
+                await self._handle(data if isinstance(data, dict) else {})
+
+        finally:
+            tasks = [*self.streams.values(), sender]
+
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _handle(self, message: dict[str, Any]):
+        stream_id = message.get("id")
+
+        if not isinstance(stream_id, str) or not stream_id:
+            await self._error(None, 422, "Messages must have a string id")
+            return
+
+        if message.get("type") == "cancel":
+            task = self.streams.pop(stream_id, None)
+
+            if task is not None and not task.done():
+                task.cancel()
+                await self.outbox.put({ "id": stream_id, "event": "cancelled" })
+
+            return
+
+        if message.get("type") != "completion":
+            await self._error(stream_id, 422, "Unknown message type")
+            return
+
+        try:
+            prompt = Prompt.model_validate(message)
+        except ValidationError:
+            await self._error(stream_id, 422, "Invalid completion message")
+            return
+
+        if stream_id in self.streams:
+            await self._error(stream_id, 409, "A completion with this id is already streaming")
+            return
+
+        if len(self.streams) >= self.max_streams:
+            await self._error(stream_id, 429, "Too many completions streaming on this connection")
+            return
+
+        task = asyncio.create_task(self._stream(stream_id, prompt))
+        task.add_done_callback(lambda done: self._remove(stream_id, done))
+        self.streams[stream_id] = task
+
+    async def _stream(self, stream_id: str, prompt: Prompt):
+        trace = metrics.trace()
+        admission = None
+
+        try:
+            with trace.stage("auth"):
+                auth_service.validate_token(self.access_token)
+
+            with trace.stage("admission"):
+                admission = await self.chat_service.admission.acquire(self.user_id)
+
+            await self.chat_service.ensure_session(prompt.sessionId, self.user_id, prompt.content)
+
+            events = self.chat_service.stream_chat_events(
+                prompt.sessionId,
+                self.user_id,
+                prompt.content,
+                use_cache=not prompt.noCache
+            )
+
+            async for event in self.chat_service.encoder.coalesce(events):
+                if event is not None:
+                    await self.outbox.put({ "id": stream_id, **event })
+
+        except HTTPException as error:
+            await self._error(stream_id, error.status_code, error.detail, error.headers)
+
+        except Exception:
+            logger.exception("Completion %s failed", stream_id)
+            await self._error(stream_id, 500, "Completion failed")
+
+        finally:
+            if admission is not None:
+                admission.release()
+
+    async def _send(self):
+        while True:
+            message = await self.outbox.get()
+            await self.websocket.send_text(orjson.dumps(message).decode())
+
+    async def _error(self, stream_id: Optional[str], status_code: int, detail: str, headers: Optional[dict] = None):
+        error = { "id": stream_id, "event": "error", "status": status_code, "detail": detail }
+
+        if headers and "Retry-After" in headers:
+            error["retryAfter"] = int(headers["Retry-After"])
+
+        await self.outbox.put(error)
+
+    def _remove(self, stream_id: str, task: asyncio.Task):
+        if self.streams.get(stream_id) is task:
+            del self.streams[stream_id]
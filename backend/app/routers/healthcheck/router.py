@@ -1,7 +1,39 @@
-from fastapi import APIRouter, Request, Response
+import os
+
+from fastapi import APIRouter, Request, Response, status
+from fastapi.responses import PlainTextResponse
+
+from app.db.connection import get_pool_stats
+from app.routers.chat import chat_service
+from app.routers.auth import auth_service
+from app.services.metrics import metrics
 
 router = APIRouter()
 
 @router.get("/")
 def health_check(request: Request, response: Response):
-    return { "status": "OK!" }
+    if chat_service.admission.draining:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return { "status": "Draining", "pid": os.getpid() }
+
+    return { "status": "OK!", "pid": os.getpid() }
+
+@router.get("/stats")
+def stats(request: Request, response: Response):
+    return {
+        "db_pool": get_pool_stats(),
+        "message_writer": chat_service.writer.stats(),
+        "embedding_cache": chat_service.embedding_cache.stats(),
+        "embedding_batcher": chat_service.embedding_batcher.stats(),
+        "context_cache": chat_service.context_cache.stats(),
+        "answer_cache": chat_service.answer_cache.stats(),
+        "single_flight": chat_service.flights.stats(),
+        "prompt_cache": chat_service.prompt_cache_usage,
+        "admission": chat_service.admission.stats(),
+        **auth_service.cache_stats(),
+        "password_hasher": auth_service.hasher.stats()
+    }
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics(request: Request, response: Response):
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
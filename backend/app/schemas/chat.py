@@ -1,24 +1,32 @@
 from uuid import UUID
 from datetime import datetime
+from typing import Optional
 from pydantic import BaseModel
 
 class Prompt(BaseModel):
     content: str
     sessionId: str
+    noCache: bool = False
 
 class Message(BaseModel):
-    id: UUID
+    # None until the message is written
+    id: Optional[str] = None
     content: str
     type: str
 
 class ChatHistory(BaseModel):
     messages: list[Message]
+    next_cursor: Optional[str] = None
 
 class Session(BaseModel):
     id: UUID
     title: str
     created_at: datetime
 
+class SessionPage(BaseModel):
+    sessions: list[Session]
+    next_cursor: Optional[str] = None
+
 class User(BaseModel):
     id: UUID
     email: str
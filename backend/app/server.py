@@ -0,0 +1,334 @@
+"""
+Production server.
+
+Upgrades the database schema unless `migrate` is disabled, binds the
+listening socket and imports the application once, then forks worker
+processes serving it with uvicorn, using uvloop and httptools when they
+are installed. Clients and connection pools are created by each worker
+on startup, so nothing that can't cross a fork exists before it.
+Caches, metrics and token revocations live in the memory of each worker:
+/metrics reports the worker that answered it, under a `worker` label, and
+a revoked token is only rejected by the worker that revoked it.
+
+The supervisor restarts workers that exit or whose event loop stops
+reporting heartbeats. On SIGTERM or SIGINT every worker stops admitting
+completions, reports itself unhealthy, and exits once its streams have
+finished or `drain_timeout` seconds have passed. A second signal exits
+right away.
+
+Usage:
+    python -m app.server
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import os
+import sys
+import time
+import asyncio
+import signal
+import socket
+import logging
+import multiprocessing
+
+from types import FrameType
+from typing import Any, Optional
+
+import uvicorn
+
+from uvicorn.importer import import_from_string
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+logger = logging.getLogger("app.server")
+
+APP = "app.main:app"
+
+class ServerSettings(BaseSettings):
+    """
+    Server settings, read from the environment.
+
+    `drain_timeout` plus `shutdown_timeout` must stay below the time the
+    orchestrator waits after SIGTERM before killing the container.
+    """
+
+    model_config = SettingsConfigDict(env_prefix="SERVER_", extra="ignore")
+
+    host: str = "0.0.0.0"
+    port: int = 8000
+    workers: Optional[int] = None
+    preload: bool = True
+    migrate: bool = True
+    backlog: int = 2048
+    keepalive_timeout: int = 5
+    drain_timeout: float = 30
+    shutdown_timeout: float = 5
+    heartbeat_timeout: float = 30
+    log_level: str = "info"
+
+def available_cpus() -> int:
+    """
+    Get the number of CPUs the process may use.
+
+    Container CPU limits are read from the cgroup quota, which the CPU
+    count of the host doesn't reflect.
+
+    Returns:
+        int: Number of usable CPUs, at least 1
+    """
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as file:
+            quota, period = file.read().split()
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as quota_file, open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as period_file:
+                quota, period = quota_file.read().strip(), period_file.read().strip()
+        except OSError:
+            quota, period = "max", "1"
+
+    if quota not in ("max", "-1"):
+        cpus = min(cpus, int(int(quota) / int(period)))
+
+    return max(cpus, 1)
+
+class WorkerServer(uvicorn.Server):
+    """
+    A uvicorn server that drains its completions before shutting down.
+
+    The first exit signal only stops admitting completions, uvicorn's own
+    shutdown starts once the admitted ones have finished or the drain
+    timeout has passed. The event loop records a heartbeat at every tick,
+    and the worker drains on its own if the supervisor went away.
+    """
+
+    def __init__(self, config: uvicorn.Config, drain_timeout: float, heartbeat: Any):
+        """
+        Args:
+            config: Server configuration
+            drain_timeout: Maximum seconds to wait for admitted completions
+            heartbeat: Shared value updated with the time of every tick
+        """
+
+        super().__init__(config)
+        self.drain_timeout = drain_timeout
+        self.heartbeat = heartbeat
+        self.drain_started: Optional[float] = None
+        self.parent = os.getppid()
+
+    def handle_exit(self, sig: int, frame: Optional[FrameType]):
+        from app.routers.chat import chat_service
+
+        if self.drain_started is None:
+            logger.info("Worker %d draining", os.getpid())
+            self.drain_started = time.monotonic()
+            chat_service.admission.drain()
+        else:
+            self.should_exit = True
+            self.force_exit = True
+
+    async def on_tick(self, counter: int) -> bool:
+        from app.routers.chat import chat_service
+
+        self.heartbeat.value = time.monotonic()
+
+        if self.drain_started is None and os.getppid() != self.parent:
+            self.handle_exit(signal.SIGTERM, None)
+
+        if self.drain_started is not None and not self.should_exit:
+            drained = chat_service.admission.idle
+
+            if drained or time.monotonic() - self.drain_started >= self.drain_timeout:
+                if not drained:
+                    logger.warning("Worker %d drain timed out with completions still running", os.getpid())
+
+                self.should_exit = True
+
+        return await super().on_tick(counter)
+
+def run_worker(settings: ServerSettings, sock: socket.socket, heartbeat: Any):
+    """
+    Serve the application on an inherited socket, in a worker process.
+
+    Workers leave the process group of the supervisor, so terminal signals
+    only reach it and are forwarded once.
+    """
+
+    os.setpgrp()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    config = uvicorn.Config(
+        APP,
+        loop="auto",
+        http="auto",
+        lifespan="on",
+        backlog=settings.backlog,
+        timeout_keep_alive=settings.keepalive_timeout,
+        timeout_graceful_shutdown=settings.shutdown_timeout,
+        log_level=settings.log_level
+    )
+
+    WorkerServer(config, settings.drain_timeout, heartbeat).run(sockets=[sock])
+
+def upgrade_schema():
+    """
+    Bring the database schema up to date, then close the connections so
+    none of them is inherited by the workers.
+    """
+
+    from app.db.connection import dispose_engine
+    from app.db.migrate import migrate
+
+    async def run() -> list[str]:
+        try:
+            return await migrate()
+        finally:
+            await dispose_engine()
+
+    changes = asyncio.run(run())
+
+    for change in changes:
+        logger.info(change)
+
+    logger.info("Schema up to date, %d changes applied", len(changes))
+
+class Supervisor:
+    """
+    Starts the worker processes and keeps them running until a shutdown signal.
+    """
+
+    def __init__(self, settings: ServerSettings):
+        """
+        Args:
+            settings: Server settings
+        """
+
+        self.settings = settings
+        self.workers = settings.workers or available_cpus()
+        self.context = multiprocessing.get_context(
+            "fork" if settings.preload and "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        )
+        self.processes: dict[int, multiprocessing.Process] = {}
+        self.heartbeats: dict[int, Any] = {}
+        self.restarts = 0
+        self.stopping = False
+
+    def run(self):
+        """
+        Bind the socket, start the workers and supervise them until every worker has stopped.
+        """
+
+        if self.settings.migrate:
+            upgrade_schema()
+
+        sock = uvicorn.Config(APP, host=self.settings.host, port=self.settings.port).bind_socket()
+
+        if self.context.get_start_method() == "fork":
+            import_from_string(APP)
+
+        signal.signal(signal.SIGTERM, self.handle_exit)
+        signal.signal(signal.SIGINT, self.handle_exit)
+
+        logger.info(
+            "Starting %d workers (%s) on %s:%d",
+            self.workers, self.context.get_start_method(), self.settings.host, self.settings.port
+        )
+
+        for slot in range(self.workers):
+            self.spawn(slot, sock)
+
+        while not self.stopping:
+            time.sleep(1)
+
+            if not self.stopping:
+                self.check(sock)
+
+        self.stop()
+        sock.close()
+
+    def spawn(self, slot: int, sock: socket.socket):
+        heartbeat = self.context.Value("d", time.monotonic(), lock=False)
+        process = self.context.Process(
+            target=run_worker,
+            args=(self.settings, sock, heartbeat),
+            name=f"worker-{slot}",
+            daemon=False
+        )
+        process.start()
+
+        self.processes[slot] = process
+        self.heartbeats[slot] = heartbeat
+
+    def check(self, sock: socket.socket):
+        """
+        Restart the workers that exited or stopped sending heartbeats.
+        """
+
+        now = time.monotonic()
+
+        for slot, process in list(self.processes.items()):
+            if not process.is_alive():
+                logger.error("Worker %d exited with code %s, restarting", process.pid, process.exitcode)
+
+            elif now - self.heartbeats[slot].value > self.settings.heartbeat_timeout:
+                logger.error(
+                    "Worker %d sent no heartbeat for %.1fs, restarting",
+                    process.pid, now - self.heartbeats[slot].value
+                )
+                process.kill()
+                process.join()
+
+            else:
+                continue
+
+            if self.stopping:
+                return
+
+            self.restarts += 1
+            self.spawn(slot, sock)
+
+    def handle_exit(self, sig: int, frame: Optional[FrameType]):
+        if self.stopping:
+            logger.warning("Forcing shutdown")
+            self.signal_workers(signal.SIGKILL)
+            return
+
+        logger.info("Received %s, draining workers", signal.Signals(sig).name)
+        self.stopping = True
+        self.signal_workers(signal.SIGTERM)
+
+    def signal_workers(self, sig: int):
+        for process in self.processes.values():
+            if process.is_alive():
+                os.kill(process.pid, sig)
+
+    def stop(self):
+        """
+        Wait for the workers to drain and shut down, then kill the ones left.
+        """
+
+        deadline = time.monotonic() + self.settings.drain_timeout + self.settings.shutdown_timeout + 5
+
+        for process in self.processes.values():
+            process.join(max(deadline - time.monotonic(), 0))
+
+            if process.is_alive():
+                logger.error("Worker %d didn't shut down in time, killing it", process.pid)
+                process.kill()
+                process.join()
+
+        logger.info("Stopped after %d worker restarts", self.restarts)
+
+def main():
+    settings = ServerSettings()
+
+    logging.basicConfig(level=settings.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    Supervisor(settings).run()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+import time
+import asyncio
+
+from collections import defaultdict
+from typing import AsyncIterator, TypeVar
+from fastapi import HTTPException, status
+
+T = TypeVar("T")
+
+class Admission:
+    """
+    A generation slot granted by the AdmissionController.
+
+    Releasing is idempotent, so the slot can be released both when the
+    stream ends and when the response is torn down.
+    """
+
+    def __init__(self, controller: "AdmissionController", user_id: str):
+        self.controller = controller
+        self.user_id = user_id
+        self.released = False
+
+    def release(self):
+        """
+        Give the slot back to the controller.
+        """
+
+        if not self.released:
+            self.released = True
+            self.controller._release(self.user_id)
+
+    async def wrap(self, stream: AsyncIterator[T]) -> AsyncIterator[T]:
+        """
+        Release the slot once the stream is exhausted, fails or is closed.
+
+        Args:
+            stream: Response stream generated under this slot
+
+        Yields:
+            The items of the stream
+        """
+
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            self.release()
+
+class AdmissionController:
+    """
+    Limits the number of concurrent model generations of a worker.
+
+    At most `max_concurrent` generations run at once and at most
+    `max_queue` requests wait for a slot, each for up to `queue_timeout`
+    seconds. A user can't hold more than `max_per_user` slots, running or
+    waiting. Requests over any of these limits are rejected with 429.
+    Once draining, new requests are rejected with 503 while admitted ones
+    run to completion.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float, max_per_user: int, retry_after: int = 1):
+        """
+        Args:
+            max_concurrent: Maximum number of generations running at once
+            max_queue: Maximum number of requests waiting for a slot
+            queue_timeout: Maximum seconds a request waits for a slot
+            max_per_user: Maximum number of running or waiting requests of a user
+            retry_after: Seconds suggested to rejected clients before retrying
+        """
+
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_per_user = max_per_user
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.draining = False
+        self.wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._users: dict[str, int] = defaultdict(int)
+
+    async def acquire(self, user_id: str) -> Admission:
+        """
+        Wait for a generation slot.
+
+        Args:
+            user_id: The identifier of the requesting user
+
+        Returns:
+            Admission: The granted slot, to be released when the generation ends
+
+        Raises:
+            HTTPException: 429 if the user or the queue is at its limit, or no slot freed up in time,
+                503 if the controller is draining
+        """
+
+        if self.draining:
+            self.rejected += 1
+
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is shutting down, retry later",
+                headers={ "Retry-After": str(self.retry_after) }
+            )
+
+        if self._users.get(user_id, 0) >= self.max_per_user:
+            raise self._reject("Too many concurrent completions for this user, retry later")
+
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            raise self._reject("Too many concurrent completions, retry later")
+
+        self._users[user_id] += 1
+        self.waiting += 1
+        started = time.monotonic()
+
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._release_user(user_id)
+            self.timeouts += 1
+            raise self._reject("Timed out waiting for a completion slot, retry later")
+        except BaseException:
+            self._release_user(user_id)
+            raise
+        finally:
+            self.waiting -= 1
+
+        waited = (time.monotonic() - started) * 1000
+
+        self.active += 1
+        self.admitted += 1
+        self.wait_ms += waited
+        self.max_wait_ms = max(self.max_wait_ms, waited)
+
+        return Admission(self, user_id)
+
+    def drain(self):
+        """
+        Stop admitting new requests, before the worker shuts down.
+        """
+
+        self.draining = True
+
+    @property
+    def idle(self) -> bool:
+        """
+        Whether no admitted or waiting request is left.
+        """
+
+        return not self.active and not self.waiting
+
+    def stats(self) -> dict:
+        """
+        Get counters of the controller.
+
+        Returns:
+            dict: Active and queued generations, admitted, rejected and timed out
+            requests, average and maximum queue wait, and whether it is draining
+        """
+
+        return {
+            "draining": self.draining,
+            "active": self.active,
+            "queued": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": self.wait_ms / self.admitted if self.admitted else 0.0,
+            "max_wait_ms": self.max_wait_ms,
+        }
+
+    def _release(self, user_id: str):
+        self.active -= 1
+        self._semaphore.release()
+        self._release_user(user_id)
+
+    def _release_user(self, user_id: str):
+        self._users[user_id] -= 1
+
+        if self._users[user_id] <= 0:
+            del self._users[user_id]
+
+    def _reject(self, detail: str) -> HTTPException:
+        self.rejected += 1
+
+        return HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={ "Retry-After": str(self.retry_after) }
+        )
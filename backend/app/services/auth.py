@@ -1,43 +1,65 @@
 import os
 import jwt
+import time
+import hashlib
 
 from uuid import UUID
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Tuple
-from passlib.context import CryptContext
 from fastapi import HTTPException
 
+from app.db.connection import get_db
 from app.db.models import Db
 from app.services.users import Users
+from app.services.cache import LRUCache
+from app.services.hashing import PasswordHasher
 from app.schemas.auth import TokenResponse, RefreshTokenResponse
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 class AuthService:
     def __init__(self):
         self.users = Users()
+        self.hasher = PasswordHasher(
+            workers=int(os.environ.get("PASSWORD_HASH_WORKERS", "2")),
+            max_queue=int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", "32")),
+            rounds=int(os.environ.get("BCRYPT_ROUNDS", "12"))
+        )
         self.auth_algorithm = os.environ.get("AUTH_ALGORITHM", "HS256")
         self.access_token_secret = os.environ.get("ACCESS_TOKEN_SECRET")
         self.access_token_expire_minutes = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
         self.refresh_token_secret = os.environ.get("REFRESH_TOKEN_SECRET")
         self.refresh_token_expire_days = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+        self.token_cache = LRUCache(max_entries=int(os.environ.get("TOKEN_CACHE_MAX_ENTRIES", "10000")))
+        self.revoked_tokens = LRUCache(max_entries=int(os.environ.get("TOKEN_CACHE_MAX_ENTRIES", "10000")))
+        self.revoked_users = LRUCache(
+            max_entries=int(os.environ.get("TOKEN_CACHE_MAX_ENTRIES", "10000")),
+            ttl=max(self.access_token_expire_minutes * 60, self.refresh_token_expire_days * 24 * 60 * 60)
+        )
 
-    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """
         Verify a password against its hash.
         """
-        return pwd_context.verify(plain_password, hashed_password)
+        return await self.hasher.verify(plain_password, hashed_password)
 
-    def hash_password(self, password: str) -> str:
+    async def hash_password(self, password: str) -> str:
         """
         Generate a hash from a password.
         """
-        return pwd_context.hash(password)
+        return await self.hasher.hash(password)
+
+    def close(self):
+        """
+        Release the password hashing threads.
+        """
+        self.hasher.close()
 
-    def create_user(self, username: str, email: str, password: str, db: Db) -> TokenResponse:
+    async def create_user(self, username: str, email: str, password: str) -> TokenResponse:
         """
         Create a new user with a hashed password and generate JWT tokens.
         
+        The password is hashed before a database session is opened, so no
+        pool connection is held while hashing.
+        
         Args:
             username: Username for the new user
             email: Email for the new user
@@ -47,11 +69,13 @@ class AuthService:
             Dict: User details and JWT tokens
         """
         
-        if self.users.user_exists(email, db):
-            raise ValueError("User with this email already exists")
-        
-        password_hash = self.hash_password(password)
-        user = self.users.create_user(username, email, password_hash, db)
+        password_hash = await self.hash_password(password)
+
+        async with get_db() as db:
+            if await self.users.user_exists(email, db):
+                raise ValueError("User with this email already exists")
+
+            user = await self.users.create_user(username, email, password_hash, db)
         
         access_token, refresh_token = self._create_tokens(user.id)
         
@@ -63,10 +87,13 @@ class AuthService:
             refresh_token=refresh_token
         )
     
-    def authenticate_user(self, email: str, password: str, db: Db) -> TokenResponse:
+    async def authenticate_user(self, email: str, password: str) -> TokenResponse:
         """
         Authenticate a user and generate JWT tokens.
         
+        The database session is closed before the password is verified, so
+        no pool connection is held while hashing.
+        
         Args:
             email: User's email
             password: User's password
@@ -78,9 +105,10 @@ class AuthService:
             ValueError: If authentication fails
         """
 
-        user = self.users.get_user_by_email(email, db)
+        async with get_db() as db:
+            user = await self.users.get_user_by_email(email, db)
 
-        if not user or not self.verify_password(password, user.password_hash):
+        if not user or not await self.verify_password(password, user.password_hash):
             raise ValueError("Incorrect email or password")
         
         access_token, refresh_token = self._create_tokens(user.id)
@@ -93,7 +121,53 @@ class AuthService:
             refresh_token=refresh_token
         )
     
-    def refresh_token(self, refresh_token: str, db: Db) -> RefreshTokenResponse:
+    async def change_password(self, user_id: str, current_password: str, new_password: str) -> TokenResponse:
+        """
+        Change the password of a user and generate new JWT tokens.
+        
+        The tokens issued to the user before the change are rejected from
+        now on. Like in `authenticate_user`, no database session is open
+        while hashing.
+        
+        Args:
+            user_id: ID of the user
+            current_password: Current password of the user
+            new_password: Plain text password replacing it
+            
+        Returns:
+            Dict: User details and JWT tokens
+            
+        Raises:
+            ValueError: If the current password is incorrect
+        """
+
+        async with get_db() as db:
+            user = await self.users.get_user_by_id(user_id, db)
+
+        if not user or not await self.verify_password(current_password, user.password_hash):
+            raise ValueError("Incorrect password")
+
+        password_hash = await self.hash_password(new_password)
+
+        async with get_db() as db:
+            user = await self.users.update_password(user_id, password_hash, db)
+
+        if not user:
+            raise ValueError("Incorrect password")
+
+        self.invalidate_user(user_id)
+
+        access_token, refresh_token = self._create_tokens(user.id)
+
+        return TokenResponse(
+            user_id=str(user.id),
+            username=user.username,
+            email=user.email,
+            access_token=access_token,
+            refresh_token=refresh_token
+        )
+
+    async def refresh_token(self, refresh_token: str, db: Db) -> RefreshTokenResponse:
         """
         Generate a new access token using a valid refresh token.
         
@@ -117,8 +191,11 @@ class AuthService:
             
             if not user_id:
                 raise ValueError("Invalid token")
+
+            if self._is_revoked(self._token_key(refresh_token, True), payload):
+                raise ValueError("Invalid or expired refresh token")
             
-            user = self.users.get_user_by_id(user_id, db)
+            user = await self.users.get_user_by_id(user_id, db)
             if not user:
                 raise ValueError("User not found")
             
@@ -136,6 +213,9 @@ class AuthService:
         """
         Validate a JWT token and return the user ID if valid.
         
+        Verified tokens are cached by digest until their own expiry, so
+        repeated requests with the same token skip signature verification.
+        
         Args:
             token: JWT token to validate
             is_refresh_token: Whether the token is a refresh token
@@ -144,6 +224,18 @@ class AuthService:
             str: User ID if token is valid, None otherwise
         """
 
+        if not token:
+            raise HTTPException(status_code=403, detail="Unauthorized access")
+
+        key = self._token_key(token, is_refresh_token)
+        user_id = self.token_cache.get(key)
+
+        if user_id is not None:
+            return user_id
+
+        if self.revoked_tokens.get(key) is not None:
+            raise HTTPException(status_code=403, detail="Unauthorized access")
+
         try:
             secret = self.refresh_token_secret if is_refresh_token else self.access_token_secret
 
@@ -153,11 +245,95 @@ class AuthService:
                 algorithms=[self.auth_algorithm]
             )
             user_id = payload.get("sub")
-            
-            return user_id
-        
+
         except jwt.PyJWTError:
             raise HTTPException(status_code=403, detail="Unauthorized access")
+
+        if self._is_revoked(key, payload):
+            raise HTTPException(status_code=403, detail="Unauthorized access")
+
+        if user_id and "exp" in payload:
+            self.token_cache.set(key, user_id, expires_at=self._monotonic_deadline(payload["exp"]))
+            
+        return user_id
+
+    def revoke_token(self, token: str, is_refresh_token: bool = False):
+        """
+        Reject a token from now on, even if its signature is still valid.
+        
+        Revocations are kept in the memory of this worker process only. The
+        other workers of the server keep accepting the token until it expires.
+        
+        Args:
+            token: JWT token to revoke
+            is_refresh_token: Whether the token is a refresh token
+        """
+
+        key = self._token_key(token, is_refresh_token)
+
+        self.token_cache.delete(key)
+
+        try:
+            payload = jwt.decode(token, options={ "verify_signature": False })
+            expires_at = self._monotonic_deadline(payload["exp"])
+        except (jwt.PyJWTError, KeyError):
+            expires_at = None
+
+        self.revoked_tokens.set(key, True, expires_at=expires_at)
+
+    def invalidate_user(self, user_id: str):
+        """
+        Drop cached tokens and profile of a user and reject the tokens issued to it
+        so far, e.g. after its password was changed. Tokens issued afterwards, on
+        the next login, are accepted.
+        
+        Like `revoke_token`, this only affects the worker process it runs in.
+        The other workers keep accepting the user's access tokens until they
+        expire, ACCESS_TOKEN_EXPIRE_MINUTES at most, and serve its cached
+        profile until USER_CACHE_TTL_SECONDS.
+        
+        Args:
+            user_id: ID of the user
+        """
+
+        self.revoked_users.set(str(user_id), time.time())
+        self.token_cache.evict(lambda key, value: value == str(user_id))
+        self.users.invalidate_user(user_id)
+
+    def cache_stats(self) -> dict:
+        """
+        Get usage counters of the token and user caches.
+        
+        Returns:
+            dict: Counters of the verified token cache and of the user cache
+        """
+
+        return {
+            "token_cache": self.token_cache.stats(),
+            "user_cache": self.users.user_cache.stats()
+        }
+
+    def _is_revoked(self, key: Tuple[bool, bytes], payload: dict) -> bool:
+        """
+        Check whether a decoded token was revoked, by itself or by invalidating
+        its user after it was issued. Tokens without an issue time count as
+        issued before any invalidation.
+        """
+
+        if self.revoked_tokens.get(key) is not None:
+            return True
+
+        revoked_at = self.revoked_users.get(str(payload.get("sub")))
+
+        return revoked_at is not None and payload.get("iat", 0) <= revoked_at
+
+    @staticmethod
+    def _token_key(token: str, is_refresh_token: bool) -> Tuple[bool, bytes]:
+        return is_refresh_token, hashlib.sha256(token.encode()).digest()
+
+    @staticmethod
+    def _monotonic_deadline(exp: float) -> float:
+        return time.monotonic() + (float(exp) - time.time())
     
     def _create_tokens(self, user_id: UUID, refresh: bool = True) -> Tuple[str, Optional[str]]:
         """
@@ -171,9 +347,13 @@ class AuthService:
             Tuple[str, Optional[str]]: The access token and optionally the refresh token
         """
 
+        # Sub-second issue time, so that tokens issued right after an invalidation are told apart
+        issued_at = time.time()
+
         access_token = jwt.encode(
             {
                 "sub": str(user_id),
+                "iat": issued_at,
                 "exp": datetime.now(timezone.utc) + timedelta(minutes=self.access_token_expire_minutes),
                 "type": "access"
             }, 
@@ -187,6 +367,7 @@ class AuthService:
             refresh_token = jwt.encode(
                 {
                     "sub": str(user_id),
+                    "iat": issued_at,
                     "exp": datetime.now(timezone.utc) + timedelta(days=self.refresh_token_expire_days),
                     "type": "refresh"
                 }, 
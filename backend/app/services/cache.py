@@ -0,0 +1,337 @@
+import sys
+import time
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Sequence
+
+class LRUCache:
+    """
+    In-process least-recently-used cache with per-entry expiry.
+
+    The cache is bounded both by number of entries and by the approximate
+    memory footprint of its values, evicting the least recently used entries
+    first. Entries expire after `ttl` seconds, or at an explicit deadline.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = sys.getsizeof
+    ):
+        """
+        Args:
+            max_entries: Maximum number of entries kept in the cache
+            ttl: Default time to live of an entry in seconds, None for no expiry
+            max_bytes: Maximum approximate size of the cached values, None for no limit
+            sizeof: Function estimating the size of a value in bytes
+        """
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, Optional[float], int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Get a value from the cache, marking it as recently used.
+        
+        Args:
+            key: Key of the entry
+            
+        Returns:
+            The cached value, or None if missing or expired
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at, _ = entry
+
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, expires_at: Optional[float] = None):
+        """
+        Store a value in the cache, evicting least recently used entries if needed.
+        
+        Args:
+            key: Key of the entry
+            value: Value to store
+            ttl: Time to live in seconds, defaults to the cache ttl
+            expires_at: Absolute `time.monotonic()` deadline, overrides ttl
+        """
+
+        if expires_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        size = self.sizeof(value)
+
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key: Hashable):
+        """
+        Remove an entry from the cache if present.
+        
+        Args:
+            key: Key of the entry
+        """
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def evict(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """
+        Remove every entry matching a predicate.
+        
+        Args:
+            predicate: Function of the key and value returning True for entries to remove
+            
+        Returns:
+            int: Number of removed entries
+        """
+
+        with self._lock:
+            keys = [key for key, (value, _, _) in self._entries.items() if predicate(key, value)]
+
+            for key in keys:
+                self._remove(key)
+
+        return len(keys)
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Get usage counters of the cache.
+        
+        Returns:
+            dict: Entries, size, hits, misses, evictions and hit rate
+        """
+
+        lookups = self.hits + self.misses
+
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _remove(self, key: Hashable):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+class SemanticCache:
+    """
+    Cache of values keyed by embedding similarity.
+
+    Embeddings are kept L2-normalized in a contiguous float32 matrix, so a
+    lookup is a single matrix-vector product. Entries can be stored under a
+    key, e.g. the parameters the value was computed with, and a lookup only
+    considers the entries of its own key. It hits when the cosine similarity
+    to the closest of them reaches `threshold`. When full, the least recently
+    used slot is overwritten.
+    """
+
+    SIMILARITY_BUCKETS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.97, 0.99, 1.0)
+
+    def __init__(self, max_entries: int, threshold: float, ttl: Optional[float] = None):
+        """
+        Args:
+            max_entries: Maximum number of embeddings kept in the cache
+            threshold: Minimum cosine similarity for a lookup to hit
+            ttl: Time to live of an entry in seconds, None for no expiry
+            
+        Raises:
+            ValueError: If `max_entries` is lower than 1
+        """
+
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._values: list[Any] = [None] * max_entries
+        self._expires_at = np.zeros(max_entries, dtype=np.float64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._used = np.zeros(max_entries, dtype=bool)
+        self._keys: dict[Hashable, int] = {}
+        self._key_ids = np.zeros(max_entries, dtype=np.int64)
+        self._similarities = np.zeros(len(self.SIMILARITY_BUCKETS) + 1, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def get(self, embedding: Sequence[float], key: Hashable = None) -> Optional[Any]:
+        """
+        Get the value stored for the most similar cached embedding.
+        
+        Args:
+            embedding: Query embedding
+            key: Only consider the entries stored under this key
+            
+        Returns:
+            The cached value if its similarity reaches the threshold, None otherwise
+        """
+
+        query = self._normalize(embedding)
+
+        with self._lock:
+            key_id = self._keys.get(key)
+            live = self._live() & (self._key_ids == key_id) if key_id is not None else None
+
+            if self._matrix is None or live is None or not live.any() or query.shape[0] != self._matrix.shape[1]:
+                self.misses += 1
+                return None
+
+            similarities = self._matrix @ query
+            similarities[~live] = -np.inf
+
+            slot = int(np.argmax(similarities))
+            similarity = float(similarities[slot])
+
+            self._similarities[np.searchsorted(self.SIMILARITY_BUCKETS, similarity)] += 1
+
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            self._last_used[slot] = time.monotonic()
+            self.hits += 1
+
+            return self._values[slot]
+
+    def set(self, embedding: Sequence[float], value: Any, generation: Optional[int] = None, key: Hashable = None):
+        """
+        Store a value for an embedding.
+        
+        Args:
+            embedding: Embedding the value was computed for
+            value: Value to store
+            generation: Cache generation observed before computing the value;
+                the value is dropped if the cache was invalidated since then
+            key: Key the value is stored under
+        """
+
+        vector = self._normalize(embedding)
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._used[:] = False
+
+            live = self._live()
+
+            if live.all():
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+            else:
+                slot = int(np.argmin(live))
+
+            now = time.monotonic()
+
+            self._matrix[slot] = vector
+            self._values[slot] = value
+            self._key_ids[slot] = self._keys.setdefault(key, len(self._keys))
+            self._used[slot] = True
+            self._last_used[slot] = now
+            self._expires_at[slot] = now + self.ttl if self.ttl is not None else np.inf
+
+    def invalidate(self):
+        """
+        Drop every entry, e.g. after the underlying data was re-indexed.
+        """
+
+        with self._lock:
+            self._used[:] = False
+            self._values = [None] * self.max_entries
+            self.generation += 1
+
+    def stats(self) -> dict:
+        """
+        Get usage counters of the cache.
+        
+        Returns:
+            dict: Entries, hits, misses, evictions, hit rate and a histogram of
+            the best similarity observed on each lookup
+        """
+
+        lookups = self.hits + self.misses
+        bounds = [f"le_{bound}" for bound in self.SIMILARITY_BUCKETS] + ["gt_1.0"]
+
+        return {
+            "entries": int(self._live().sum()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "generation": self.generation,
+            "similarity": dict(zip(bounds, self._similarities.tolist())),
+        }
+
+    def _live(self) -> np.ndarray:
+        return self._used & (self._expires_at > time.monotonic())
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+
+        return vector / norm if norm else vector
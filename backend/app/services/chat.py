@@ -1,42 +1,202 @@
 import os
 import json
+import time
+import asyncio
+import hashlib
+import logging
 
-from typing import AsyncGenerator, Dict, Any
-from pinecone import Pinecone
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, Callable, Dict, Any, Optional, TypeVar
 
-from langchain_anthropic import ChatAnthropic
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_postgres import PostgresChatMessageHistory
+from fastapi import HTTPException
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
 
-from app.db.connection import get_db
+from app.db.connection import get_db, get_settings
 from app.services.sessions import Sessions
+from app.services.history import HistoryStrategy, HistoryWindow
+from app.services.cache import LRUCache, SemanticCache
+from app.services.embeddings import EMBEDDING_MODEL, Embedder, EmbeddingBatcher, EmbeddingCache, create_shared_cache, normalize_prompt
+from app.services.retrievers import Retriever, create_retriever
+from app.services.streaming import SSEEncoder
+from app.services.admission import AdmissionController
+from app.services.singleflight import SingleFlight
+from app.services.writer import MessageWriter
+from app.services.metrics import metrics, current_trace, stage
 
 # Configuration
 SYSTEM_PROMPT = "You're an assistant. Bold key terms in your responses."
+SUMMARY_SECTION = "# CONVERSATION SUMMARY\n\n"
+CACHE_CONTROL = { "type": "ephemeral" }
 MODEL_CONFIG = {
     "name": "claude-3-5-sonnet-20240620",
     "temperature": 0.2,
     "max_tokens": 1024
 }
 
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+def create_llm() -> BaseChatModel:
+    """
+    Create the Anthropic chat model client.
+    
+    The client library is imported here, as it is by far the slowest
+    import of the application.
+    """
+
+    from langchain_anthropic import ChatAnthropic
+
+    return ChatAnthropic(
+        model_name=MODEL_CONFIG["name"],
+        temperature=MODEL_CONFIG["temperature"],
+        max_tokens=MODEL_CONFIG["max_tokens"]
+    )
+
+def create_pinecone():
+    """
+    Create the Pinecone client used for embeddings and retrieval.
+    """
+
+    from pinecone import Pinecone
+
+    return Pinecone(
+        api_key=os.getenv("PINECONE_API_KEY"), 
+        environment=os.getenv("PINECONE_ENV")
+    )
+
 class ChatService:
     def __init__(self):
         self.sessions = Sessions()
-        self.llm = ChatAnthropic(
-            model_name=MODEL_CONFIG["name"],
-            temperature=MODEL_CONFIG["temperature"],
-            max_tokens=MODEL_CONFIG["max_tokens"]
+        self.llm: Optional[BaseChatModel] = None
+        self.pinecone = None
+        self.embedder: Optional[Embedder] = None
+        self.retriever: Optional[Retriever] = None
+        self.prompt_cache = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+        self.prompt_cache_usage = { "input_tokens": 0, "cache_read_tokens": 0, "cache_creation_tokens": 0 }
+        self.writer = MessageWriter(
+            batch_size=int(os.getenv("HISTORY_WRITE_BATCH_SIZE", "100")),
+            flush_interval=float(os.getenv("HISTORY_WRITE_FLUSH_SECONDS", "0.05")),
+            max_queue=int(os.getenv("HISTORY_WRITE_MAX_QUEUE", "10000"))
+        )
+        self.history = HistoryStrategy(
+            self.sessions,
+            self.writer,
+            None,
+            max_messages=int(os.getenv("HISTORY_MAX_MESSAGES", "20")),
+            token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", "4000")),
+            window_step=int(os.getenv("HISTORY_WINDOW_STEP", "10")),
+            summarize=os.getenv("HISTORY_SUMMARY_ENABLED", "false").lower() == "true",
+            summary_batch=int(os.getenv("HISTORY_SUMMARY_BATCH", "10"))
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("RAG_EXECUTOR_WORKERS", "8")),
+            thread_name_prefix="rag"
+        )
+        self.rag_timeout = float(os.getenv("RAG_TIMEOUT_SECONDS", "10"))
+        self.embedding_cache = EmbeddingCache(
+            model=EMBEDDING_MODEL,
+            max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "10000")),
+            max_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            ttl=float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "86400")),
+            shared=create_shared_cache(os.getenv("EMBEDDING_CACHE_URL"))
+        )
+        self.embedding_batcher = EmbeddingBatcher(
+            lambda prompts: self._run_blocking(self.embedder.embed, prompts, input_type="query"),
+            max_batch=int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32")),
+            window=float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5")) / 1000
+        )
+        self.context_cache = SemanticCache(
+            max_entries=int(os.getenv("CONTEXT_CACHE_MAX_ENTRIES", "1024")),
+            threshold=float(os.getenv("CONTEXT_CACHE_THRESHOLD", "0.97")),
+            ttl=float(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "3600"))
         )
-        self.prompt_template = ChatPromptTemplate.from_messages([
-            ("system", SYSTEM_PROMPT),
-            MessagesPlaceholder(variable_name="history"),
-            ("human", "{input}")
-        ])
-        self.pinecone = Pinecone(
-            api_key=os.getenv("PINECONE_API_KEY"), 
-            environment=os.getenv("PINECONE_ENV")
+        self.answer_cache = LRUCache(
+            max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+            max_bytes=int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+            sizeof=len
+        )
+        self.answer_replay_chunk = int(os.getenv("ANSWER_CACHE_REPLAY_CHUNK_CHARS", "64"))
+        self.knowledge_base_check_interval = float(os.getenv("KNOWLEDGE_BASE_CHECK_SECONDS", "30"))
+        self._watcher: Optional[asyncio.Task] = None
+        self.flights = SingleFlight(enabled=os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true")
+        self.encoder = SSEEncoder(
+            flush_bytes=int(os.getenv("SSE_FLUSH_BYTES", "256")),
+            flush_interval=float(os.getenv("SSE_FLUSH_SECONDS", "0.02")),
+            keepalive_interval=float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+        )
+        self.admission = AdmissionController(
+            max_concurrent=int(os.getenv("COMPLETION_MAX_CONCURRENT", "32")),
+            max_queue=int(os.getenv("COMPLETION_MAX_QUEUE", "64")),
+            queue_timeout=float(os.getenv("COMPLETION_QUEUE_TIMEOUT_SECONDS", "10")),
+            max_per_user=int(os.getenv("COMPLETION_MAX_PER_USER", "2"))
+        )
+
+    async def start(self):
+        """
+        Create the model and knowledge base clients, start the message writer
+        and the knowledge base change checks.
+        
+        Clients are created concurrently on worker threads when the application
+        starts rather than when it is imported. Clients that are already set,
+        such as stand-ins installed by a benchmark, are kept.
+        """
+
+        async def create(client, factory: Callable[[], T]) -> T:
+            return client if client is not None else await asyncio.to_thread(factory)
+
+        async def create_knowledge_base():
+            self.pinecone = await create(self.pinecone, create_pinecone)
+            self.retriever = await create(self.retriever, partial(create_retriever, self.pinecone))
+
+            if self.embedder is None:
+                self.embedder = Embedder(self.pinecone, EMBEDDING_MODEL)
+
+        self.llm, _ = await asyncio.gather(create(self.llm, create_llm), create_knowledge_base())
+        self.history.llm = self.llm
+
+        await self.writer.start()
+
+        if self.knowledge_base_check_interval > 0 and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch_knowledge_base())
+
+    def close(self):
+        """
+        Stop the knowledge base change checks and release the worker threads
+        used for embedding and retrieval calls.
+        """
+
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run_blocking(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Run a blocking client call on the bounded RAG executor.
+        
+        Args:
+            func (Callable): Blocking function to run
+            *args: Positional arguments for the function
+            **kwargs: Keyword arguments for the function
+            
+        Returns:
+            The result of the function call
+            
+        Raises:
+            asyncio.TimeoutError: If the call does not complete within RAG_TIMEOUT_SECONDS
+        """
+
+        loop = asyncio.get_running_loop()
+
+        return await asyncio.wait_for(
+            loop.run_in_executor(self.executor, partial(func, *args, **kwargs)),
+            timeout=self.rag_timeout
         )
-        self.index = self.pinecone.Index(os.getenv("PINECONE_INDEX_NAME"))
 
     def generate_embedding(self, prompt: str) -> list:
         """
@@ -49,105 +209,463 @@ class ChatService:
             list: Vector embedding representation of the prompt
         """
 
-        embedding = self.pinecone.inference.embed(
-            model="llama-text-embed-v2",
-            inputs=[prompt],
-            parameters={ "input_type": "query" }
-        )
+        return self.embedder.embed([prompt], input_type="query")[0]
+
+    async def agenerate_embedding(self, prompt: str) -> list:
+        """
+        Generate embeddings for the given prompt without blocking the event loop.
+        
+        Embeddings are served from the embedding cache when the same normalized
+        prompt was embedded before. Otherwise the prompt is embedded together
+        with the prompts of concurrent requests by the embedding batcher.
+        
+        Args:
+            prompt (str): User prompt to generate embeddings for
+            
+        Returns:
+            list: Vector embedding representation of the prompt
+        """
+
+        embedding = await self.embedding_cache.get(prompt)
+
+        if embedding is None:
+            embedding = await self.embedding_batcher.embed(prompt)
+            await self.embedding_cache.set(prompt, embedding)
 
-        return embedding[0].values
+        return embedding
     
-    def get_relevant_context(self, embedding: list, top_k: int = 3) -> str:
+    def get_relevant_context(self, embedding: list, top_k: int = 3, category: Optional[str] = None) -> str:
         """
         Retrieve relevant context from the vector database based on the prompt embedding.
         
         Args:
             embedding (list): Vector embedding of the user prompt
             top_k (int, optional): Number of most relevant contexts to retrieve. Defaults to 3.
+            category (str, optional): Only retrieve contexts of this category. Defaults to None.
             
         Returns:
             str: Formatted string containing the relevant contexts
         """
 
-        results = self.index.query(
-            vector=embedding,
-            top_k=top_k,
-            include_values=False,
-            include_metadata=True,
-        )
+        matches = self.retriever.query(embedding, top_k, category)
 
         context = "# RELEVANT KNOWLEDGE\n\n" + "\n".join([
             f"Q: {match['metadata']['category']}\nA: {match['metadata']['text']}" 
-            for match in results['matches']
+            for match in matches
         ]) + "\n\n# PROMPT\n\n"
         
         return context
 
-    async def stream_chat_response(self, session_id: str, user_id:str, prompt: str, embedding: list) -> AsyncGenerator[str, None]:
+    async def aget_relevant_context(self, embedding: list, top_k: int = 3, category: Optional[str] = None) -> str:
         """
-        Stream chat responses from the LLM back to the client.
+        Retrieve relevant context without blocking the event loop.
         
-        This method:
-        1. Creates a new session if it doesn't exist
-        2. Retrieves message history for the session
-        3. Gets relevant context based on the prompt embedding
-        4. Combines context with the prompt
-        5. Streams the LLM response back to the client
+        The context of a previous query whose embedding is similar enough is
+        served from the semantic context cache instead of querying the index.
+        
+        Args:
+            embedding (list): Vector embedding of the user prompt
+            top_k (int, optional): Number of most relevant contexts to retrieve. Defaults to 3.
+            category (str, optional): Only retrieve contexts of this category. Defaults to None.
+            
+        Returns:
+            str: Formatted string containing the relevant contexts
+        """
+
+        cached = self.context_cache.get(embedding, key=(top_k, category))
+
+        if cached is not None:
+            return cached
+
+        generation = self.context_cache.generation
+        context = await self._run_blocking(self.get_relevant_context, embedding, top_k, category)
+
+        self.context_cache.set(embedding, context, generation=generation, key=(top_k, category))
+
+        return context
+
+    def invalidate_knowledge_base(self):
+        """
+        Drop cached retrieval results and answers after the knowledge base was re-indexed.
+        """
+
+        self.context_cache.invalidate()
+        self.answer_cache.clear()
+
+    async def refresh_knowledge_base(self) -> bool:
+        """
+        Check whether the knowledge base was re-indexed, and drop the cached
+        retrieval results and answers if it was.
+
+        Returns:
+            bool: Whether the knowledge base changed
+        """
+
+        changed = await self._run_blocking(self.retriever.refresh)
+
+        if changed:
+            logger.info("Knowledge base changed, dropping cached contexts and answers")
+            self.invalidate_knowledge_base()
+
+        return changed
+
+    async def _watch_knowledge_base(self):
+        while True:
+            await asyncio.sleep(self.knowledge_base_check_interval)
+
+            try:
+                await self.refresh_knowledge_base()
+            except Exception:
+                logger.exception("Failed to check the knowledge base for changes")
+
+    def _answer_key(self, prompt: str, context: str, generation: int) -> str:
+        """
+        Get the answer cache key of a first-turn prompt.
+        
+        The knowledge base generation is part of the key, so a prompt asked
+        after a re-index never follows a generation started before it.
+        
+        Args:
+            prompt (str): User's input message
+            context (str): Retrieved context for the prompt
+            generation (int): Knowledge base generation the context was retrieved at
+            
+        Returns:
+            str: Digest of the normalized prompt, the context, the knowledge base
+            generation, the system prompt and the model configuration
+        """
+
+        return hashlib.sha256("\0".join([
+            normalize_prompt(prompt),
+            hashlib.sha256(context.encode()).hexdigest(),
+            str(generation),
+            SYSTEM_PROMPT,
+            json.dumps(MODEL_CONFIG, sort_keys=True)
+        ]).encode()).hexdigest()
+
+    async def _replay_answer(self, answer: str) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Replay a cached answer as the events of a model stream.
+        
+        Args:
+            answer (str): Cached answer
+            
+        Yields:
+            Dict[str, Any]: The same events a model stream produces
+        """
+
+        yield { "event": "on_chat_model_start" }
+
+        for start in range(0, len(answer), self.answer_replay_chunk):
+            yield { "event": "on_chat_model_stream", "data": answer[start:start + self.answer_replay_chunk] }
+
+        yield { "event": "on_chat_model_end", "output": answer }
+
+    def _build_messages(self, window: HistoryWindow, context: str, prompt: str) -> list[BaseMessage]:
+        """
+        Build the model messages for a turn, ordered from most to least stable.
+        
+        The system prompt, the session summary and the history window form a
+        prefix that grows between turns until the window start moves forward
+        by a step or the summary is updated, and the retrieved context only
+        appears in the final user message, so it never invalidates that prefix.
+        When prompt caching is enabled, the end of the system prompt and the
+        end of the history are marked as Anthropic cache breakpoints, so a
+        turn reads the history cached by the previous turn of the session.
+        
+        Args:
+            window (HistoryWindow): History window of the session
+            context (str): Retrieved context for the prompt
+            prompt (str): User's input message
+            
+        Returns:
+            list[BaseMessage]: System message, history and the new user message
+        """
+
+        cache_control = { "cache_control": CACHE_CONTROL } if self.prompt_cache else {}
+
+        system = [{ "type": "text", "text": SYSTEM_PROMPT, **cache_control }]
+
+        if window.summary:
+            system.append({ "type": "text", "text": SUMMARY_SECTION + window.summary })
+
+        history = list(window.messages)
+
+        if history and self.prompt_cache:
+            last = history[-1]
+            blocks = [{ "type": "text", "text": last.content }] if isinstance(last.content, str) else list(last.content)
+            blocks[-1] = { **blocks[-1], **cache_control }
+            history[-1] = last.model_copy(update={ "content": blocks })
+
+        return [
+            SystemMessage(content=system),
+            *history,
+            HumanMessage(content=context + prompt)
+        ]
+
+    async def _generate(self, messages: list[BaseMessage]) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Stream the model answer as start, token and end events.
+        
+        Tokens are read from the model stream directly rather than through
+        astream_events, so no event is built for internal callbacks.
+        
+        Args:
+            messages (list[BaseMessage]): Prompt messages
+            
+        Yields:
+            Dict[str, Any]: Start event, one event per non-empty token and an end
+            event carrying the complete answer in `output`
+        """
+
+        yield { "event": "on_chat_model_start" }
+
+        trace = current_trace.get()
+        started = time.monotonic()
+        parts = []
+
+        async for chunk in self.llm.astream(messages):
+            if chunk.usage_metadata:
+                self._record_usage(chunk.usage_metadata)
+
+            text = chunk.content if isinstance(chunk.content, str) else "".join(
+                block.get("text", "") for block in chunk.content if isinstance(block, dict)
+            )
+
+            if text:
+                if not parts:
+                    trace.record("first_token", time.monotonic() - started)
+
+                parts.append(text)
+                yield { "event": "on_chat_model_stream", "data": text }
+
+        trace.record("generation", time.monotonic() - started)
+
+        yield { "event": "on_chat_model_end", "output": "".join(parts) }
+
+    async def _generate_answer(self, messages: list[BaseMessage], answer_key: str, generation: int) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Stream the model answer to a first-turn prompt and store it in the answer cache.
+        
+        Args:
+            messages (list[BaseMessage]): Prompt messages
+            answer_key (str): Answer cache key of the prompt
+            generation (int): Knowledge base generation the context was retrieved at
+            
+        Yields:
+            Dict[str, Any]: The events of `_generate`
+        """
+
+        async for evt in self._generate(messages):
+            yield evt
+
+            if evt["event"] == "on_chat_model_end" and generation == self.context_cache.generation:
+                self.answer_cache.set(answer_key, evt["output"])
+
+    def _record_usage(self, usage: Dict[str, Any]):
+        """
+        Accumulate input and prompt cache token counts reported by the model.
+        
+        Args:
+            usage (Dict[str, Any]): Usage metadata of a model stream chunk
+        """
+
+        details = usage.get("input_token_details") or {}
+
+        self.prompt_cache_usage["input_tokens"] += usage.get("input_tokens", 0)
+        self.prompt_cache_usage["cache_read_tokens"] += details.get("cache_read", 0) or 0
+        self.prompt_cache_usage["cache_creation_tokens"] += details.get("cache_creation", 0) or 0
+
+    async def stream_chat_response(self, session_id: str, user_id:str, prompt: str, use_cache: bool = True) -> AsyncGenerator[bytes, None]:
+        """
+        Stream chat responses from the LLM back to the client as Server-Sent Events.
+        
+        The response status is sent before the history, the context and the
+        answer are retrieved, so a failure along the way ends the stream with
+        an `error` event carrying the status and detail it would have had,
+        as on the WebSocket endpoint.
         
         Args:
             session_id (str): Unique identifier for the chat session
             user_id (str): Unique identifier for the user
             prompt (str): User's input message
-            embedding (list): Vector embedding of the user prompt
+            use_cache (bool, optional): Whether first-turn answers may be served from
+                and stored in the answer cache. Defaults to True.
             
         Yields:
-            str: JSON-formatted chunks of the LLM response
+            bytes: SSE frames of the chat events, with tokens coalesced and keep-alive comments
         """
 
-        with get_db() as db:
-            if not self.sessions.session_exists(session_id, db):
-                self.sessions.create_session(session_id, user_id, prompt, db)
+        try:
+            async for frame in self.encoder.encode(self.stream_chat_events(session_id, user_id, prompt, use_cache)):
+                yield frame
 
-        history = self.sessions.get_message_history(session_id)
-        context = self.get_relevant_context(embedding)
+        except HTTPException as error:
+            yield self.encoder.frame({ "event": "error", "status": error.status_code, "detail": error.detail })
+
+        except Exception:
+            logger.exception("Completion failed in session %s", session_id)
+            yield self.encoder.frame({ "event": "error", "status": 500, "detail": "Completion failed" })
+
+    async def stream_chat_events(self, session_id: str, user_id:str, prompt: str, use_cache: bool = True) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Stream chat response events from the LLM.
+        
+        This method:
+        1. Concurrently retrieves the recent message history window and gets
+           relevant context for the prompt. The session must have been created
+           and authorized with `ensure_session` beforehand.
+        2. Replays the cached answer of a first-turn prompt if there is one,
+           or follows the generation of an identical first-turn prompt in flight
+        3. Combines context with the prompt
+        4. Streams the LLM response events
+        5. Schedules an update of the session summary if older messages fell out of the window
+        6. Sends the stage timings of the request when metrics are enabled
+        
+        The turn is committed by the message writer after the stream closed,
+        so neither the stream nor its admission slot waits for the database.
+        
+        Args:
+            session_id (str): Unique identifier for the chat session
+            user_id (str): Unique identifier for the user
+            prompt (str): User's input message
+            use_cache (bool, optional): Whether first-turn answers may be served from
+                and stored in the answer cache. Defaults to True.
+            
+        Yields:
+            Dict[str, Any]: Client events, `on_chat_model_stream` events carrying a token in `data`
+        """
 
-        prompt_with_context = context + prompt
+        generation = self.context_cache.generation
 
-        messages = self.prompt_template.format_messages(
-            input=prompt_with_context,
-            history=history.messages
+        window, context = await asyncio.gather(
+            self.history.load(session_id),
+            self._retrieve_context(prompt)
         )
 
-        async for evt in self.llm.astream_events(
-            messages,
-            version="v1",
-            config={"callbacks": []},
-            model=MODEL_CONFIG["name"]
-        ):
-            yield self._process_event(evt, prompt, history)
+        answer_key = None
+        answer = None
+
+        if use_cache and not window.messages and not window.summary:
+            answer_key = self._answer_key(prompt, context, generation)
+            answer = self.answer_cache.get(answer_key)
+
+        if answer is not None:
+            async for evt in self._replay_answer(answer):
+                yield await self._process_event(evt, prompt, session_id)
 
-    def _process_event(self, evt: Dict[str, Any], prompt: str, history: PostgresChatMessageHistory) -> str:
+        else:
+            messages = self._build_messages(window, context, prompt)
+
+            if answer_key:
+                events = self.flights.stream(answer_key, partial(self._generate_answer, messages, answer_key, generation))
+            else:
+                events = self._generate(messages)
+
+            async for evt in events:
+                yield await self._process_event(evt, prompt, session_id)
+
+            self.history.schedule_summary(session_id, window)
+
+        if metrics.enabled:
+            trace = current_trace.get()
+            trace.record("total", trace.elapsed())
+
+            yield { "event": "timing", "data": trace.breakdown() }
+
+    async def ensure_session(self, session_id: str, user_id: str, prompt: str):
         """
-        Process LLM streaming events and format them for the client.
+        Create the chat session if it doesn't exist yet and check that the user owns it.
+        
+        Sessions whose owner is already cached don't reach the database.
         
         Args:
-            evt (Dict[str, Any]): Event data from the LLM
-            prompt (str): Original user prompt
-            history (PostgresChatMessageHistory): Chat history for the session
+            session_id (str): Unique identifier for the chat session
+            user_id (str): Unique identifier for the user
+            prompt (str): User's input message, used as the session title
             
-        Returns:
-            str: JSON-formatted event data for the client
+        Raises:
+            HTTPException: 404 if the session belongs to another user
+        """
+
+        owner = self.sessions.owner_cache.get(session_id)
+
+        if owner is None:
+            with stage("session"):
+                async with get_db() as db:
+                    owner = await self.sessions.upsert_session(session_id, user_id, prompt, db)
+
+        if owner != user_id:
+            raise HTTPException(status_code=404, detail="Session not found")
+
+    async def authorize_session(self, session_id: str, user_id: str):
         """
+        Check that an existing chat session belongs to the user.
         
-        event_type = evt["event"]
+        The owner is read from the replica, and from the primary when the
+        replica doesn't have the session yet, since it may have just been
+        created by a request served by another worker.
         
-        if event_type == "on_chat_model_start":
-            history.add_user_message(prompt)
-            return f"data: {json.dumps({'event': event_type})}\n\n"
+        Args:
+            session_id (str): Unique identifier for the chat session
+            user_id (str): Unique identifier for the user
+            
+        Raises:
+            HTTPException: 404 if the session doesn't exist or belongs to another user
+        """
+
+        owner = self.sessions.owner_cache.get(session_id)
+
+        if owner is None:
+            async with get_db(readonly=True) as db:
+                owner = await self.sessions.get_owner(session_id, db)
+
+        if owner is None and get_settings().replica_url:
+            async with get_db() as db:
+                owner = await self.sessions.get_owner(session_id, db)
+
+        if owner != user_id:
+            raise HTTPException(status_code=404, detail="Session not found")
+
+    async def _retrieve_context(self, prompt: str) -> str:
+        """
+        Embed the prompt and retrieve its relevant context.
         
-        elif event_type == "on_chat_model_stream":
-            return f"data: {json.dumps({'event': event_type, 'data': evt['data']['chunk'].content})}\n\n"
+        Args:
+            prompt (str): User's input message
+            
+        Returns:
+            str: Formatted string containing the relevant contexts
+        """
+
+        with stage("embedding"):
+            embedding = await self.agenerate_embedding(prompt)
+
+        with stage("retrieval"):
+            return await self.aget_relevant_context(embedding)
+
+    async def _process_event(self, evt: Dict[str, Any], prompt: str, session_id: str) -> Dict[str, Any]:
+        """
+        Process LLM streaming events and format them for the client.
         
-        elif event_type == "on_chat_model_end":
-            history.add_ai_message(evt['data']['output'].content)
-            return f"data: {json.dumps({'event': event_type})}\n\n"
+        The prompt and the model answer are queued together on the message
+        writer once the answer is complete, so no database write happens
+        while tokens are streamed.
+        
+        Args:
+            evt (Dict[str, Any]): Event from the model stream
+            prompt (str): Original user prompt
+            session_id (str): Unique identifier for the chat session
+            
+        Returns:
+            Dict[str, Any]: Event data for the client
+        """
+        
+        if evt["event"] == "on_chat_model_end":
+            await self.writer.enqueue(session_id, [
+                HumanMessage(content=prompt),
+                AIMessage(content=evt["output"])
+            ])
+            return { "event": evt["event"] }
+
+        return evt
@@ -0,0 +1,354 @@
+import time
+import asyncio
+import logging
+import hashlib
+
+from array import array
+from typing import Awaitable, Callable, Optional, Protocol
+
+from app.services.cache import LRUCache
+from app.services.metrics import metrics
+
+EMBEDDING_MODEL = "llama-text-embed-v2"
+
+logger = logging.getLogger(__name__)
+
+class Embedder:
+    """
+    Embedding client shared by the chat path and knowledge base ingestion.
+    """
+
+    def __init__(self, pinecone, model: str = EMBEDDING_MODEL):
+        """
+        Args:
+            pinecone: Pinecone client providing the inference API
+            model: Name of the embedding model
+        """
+
+        self.pinecone = pinecone
+        self.model = model
+
+    def embed(self, inputs: list[str], input_type: str = "query") -> list[list]:
+        """
+        Generate embeddings for a batch of texts.
+        
+        Args:
+            inputs: Texts to embed
+            input_type: `query` for user prompts, `passage` for knowledge base chunks
+            
+        Returns:
+            list[list]: One vector embedding per input, in order
+        """
+
+        embeddings = self.pinecone.inference.embed(
+            model=self.model,
+            inputs=inputs,
+            parameters={ "input_type": input_type }
+        )
+
+        return [embedding.values for embedding in embeddings]
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalize a prompt so that trivially different texts share cache entries.
+    
+    Args:
+        prompt: User prompt
+        
+    Returns:
+        str: The prompt with collapsed whitespace, case-folded
+    """
+
+    return " ".join(prompt.split()).casefold()
+
+class SharedCache(Protocol):
+    """
+    Subset of the Redis asyncio client used by the shared cache tier.
+    """
+
+    async def get(self, key: str) -> Optional[bytes]: ...
+
+    async def set(self, key: str, value: bytes, ex: Optional[int] = None): ...
+
+class LocalSharedCache:
+    """
+    In-memory stand-in for a Redis shared cache tier, for local runs and tests.
+    """
+
+    def __init__(self):
+        self._values: dict[str, tuple[bytes, Optional[float]]] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value, expires_at = self._values.get(key, (None, None))
+
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._values.pop(key, None)
+            return None
+
+        return value
+
+    async def set(self, key: str, value: bytes, ex: Optional[int] = None):
+        self._values[key] = (value, time.monotonic() + ex if ex else None)
+
+def create_shared_cache(url: Optional[str]) -> Optional[SharedCache]:
+    """
+    Create the shared cache tier client for a URL.
+    
+    Args:
+        url: Redis URL, `memory://` for a local in-process fake, or None
+        
+    Returns:
+        SharedCache: A client for the shared tier, or None if no URL is set
+    """
+
+    if not url:
+        return None
+
+    if url.startswith("memory://"):
+        return LocalSharedCache()
+
+    from redis.asyncio import Redis
+
+    return Redis.from_url(url)
+
+class EmbeddingCache:
+    """
+    Two-tier cache of prompt embeddings.
+
+    Embeddings are looked up in an in-process LRU first and then in an
+    optional shared tier, keyed on the embedding model and the normalized
+    prompt. Vectors are stored as packed float32 arrays.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        max_entries: int,
+        max_bytes: int,
+        ttl: float,
+        shared: Optional[SharedCache] = None
+    ):
+        """
+        Args:
+            model: Name of the embedding model, part of every key
+            max_entries: Maximum number of embeddings kept in process
+            max_bytes: Maximum memory used by embeddings kept in process
+            ttl: Time to live of an embedding in seconds
+            shared: Optional shared cache tier
+        """
+
+        self.model = model
+        self.ttl = ttl
+        self.shared = shared
+        self.local = LRUCache(
+            max_entries=max_entries,
+            ttl=ttl,
+            max_bytes=max_bytes,
+            sizeof=lambda vector: vector.itemsize * len(vector)
+        )
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    def key(self, prompt: str) -> str:
+        """
+        Get the cache key of a prompt.
+        
+        Args:
+            prompt: User prompt
+            
+        Returns:
+            str: Key combining the model name and a digest of the normalized prompt
+        """
+
+        digest = hashlib.sha256(normalize_prompt(prompt).encode()).hexdigest()
+
+        return f"embedding:{self.model}:{digest}"
+
+    async def get(self, prompt: str) -> Optional[list]:
+        """
+        Get the cached embedding of a prompt.
+        
+        Args:
+            prompt: User prompt
+            
+        Returns:
+            list: The embedding, or None on a miss
+        """
+
+        key = self.key(prompt)
+        vector = self.local.get(key)
+
+        if vector is None and self.shared is not None:
+            try:
+                value = await self.shared.get(key)
+            except Exception:
+                logger.exception("Shared embedding cache lookup failed")
+                self.shared_errors += 1
+                value = None
+
+            if value is not None:
+                vector = array("f")
+                vector.frombytes(value)
+                self.local.set(key, vector)
+                self.shared_hits += 1
+
+        return vector.tolist() if vector is not None else None
+
+    async def set(self, prompt: str, embedding: list):
+        """
+        Store the embedding of a prompt in both tiers.
+        
+        Args:
+            prompt: User prompt
+            embedding: Embedding of the prompt
+        """
+
+        key = self.key(prompt)
+        vector = array("f", embedding)
+
+        self.local.set(key, vector)
+
+        if self.shared is not None:
+            try:
+                await self.shared.set(key, vector.tobytes(), ex=int(self.ttl))
+            except Exception:
+                logger.exception("Shared embedding cache store failed")
+                self.shared_errors += 1
+
+    def stats(self) -> dict:
+        """
+        Get usage counters of the cache.
+        
+        Returns:
+            dict: Local tier counters plus shared tier hits and errors
+        """
+
+        return {
+            **self.local.stats(),
+            "shared_hits": self.shared_hits,
+            "shared_errors": self.shared_errors,
+        }
+
+class EmbeddingBatcher:
+    """
+    Groups concurrent embedding requests into batched embedding calls.
+
+    When no call is in flight, a request is sent on its own right away, so
+    an idle service pays no batching delay. Otherwise requests wait for up
+    to `window` seconds, or until `max_batch` distinct texts are pending,
+    and are embedded together, each caller receiving its own vector.
+    """
+
+    def __init__(self, embed: Callable[[list[str]], Awaitable[list[list]]], max_batch: int, window: float):
+        """
+        Args:
+            embed: Coroutine function embedding a batch of texts
+            max_batch: Maximum number of texts embedded by one call
+            window: Maximum seconds a request waits for other requests
+        """
+
+        self._embed = embed
+        self.max_batch = max_batch
+        self.window = window
+        self.in_flight = 0
+        self.calls = 0
+        self.batched_calls = 0
+        self.inputs = 0
+        self.max_batch_size = 0
+        self.failures = 0
+        self.call_ms = 0.0
+        self._pending: dict[str, list[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def embed(self, text: str) -> list:
+        """
+        Embed a text, batched with concurrent requests.
+        
+        Args:
+            text: Text to embed
+            
+        Returns:
+            list: Vector embedding of the text
+        """
+
+        if self.max_batch <= 1 or self.window <= 0 or (not self.in_flight and not self._pending):
+            return (await self._call([text]))[0]
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(text, []).append(future)
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+        return await future
+
+    def stats(self) -> dict:
+        """
+        Get counters of the batcher.
+        
+        Returns:
+            dict: Embedding calls, batched calls, embedded texts, average and
+            maximum batch size, failures and average call latency
+        """
+
+        return {
+            "calls": self.calls,
+            "batched_calls": self.batched_calls,
+            "inputs": self.inputs,
+            "avg_batch_size": self.inputs / self.calls if self.calls else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "failures": self.failures,
+            "avg_call_ms": self.call_ms / self.calls if self.calls else 0.0,
+        }
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, {}
+
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: dict[str, list[asyncio.Future]]):
+        texts = list(batch)
+
+        try:
+            vectors = await self._call(texts)
+        except Exception as error:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(error)
+            return
+
+        for text, vector in zip(texts, vectors):
+            for future in batch[text]:
+                if not future.done():
+                    future.set_result(vector)
+
+    async def _call(self, texts: list[str]) -> list[list]:
+        self.in_flight += 1
+        started = time.monotonic()
+
+        try:
+            return await self._embed(texts)
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            elapsed = time.monotonic() - started
+
+            self.calls += 1
+            self.batched_calls += len(texts) > 1
+            self.inputs += len(texts)
+            self.max_batch_size = max(self.max_batch_size, len(texts))
+            self.call_ms += elapsed * 1000
+            metrics.observe("embedding_call", elapsed)
@@ -0,0 +1,105 @@
+import time
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+T = TypeVar("T")
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification on a dedicated, bounded thread pool.
+
+    bcrypt releases the GIL while hashing, so worker threads keep the event
+    loop free. When more than `max_queue` calls are already waiting for a
+    worker, new calls are rejected with 503 instead of queueing unboundedly.
+    """
+
+    def __init__(self, workers: int, max_queue: int, rounds: int, retry_after: int = 1):
+        """
+        Args:
+            workers: Number of hashing threads
+            max_queue: Maximum number of calls waiting for a free thread
+            rounds: bcrypt cost factor (log2 of the number of rounds)
+            retry_after: Seconds suggested to rejected clients before retrying
+        """
+
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_ms = 0.0
+        self.hash_ms = 0.0
+
+    async def hash(self, password: str) -> str:
+        """
+        Generate a hash from a password.
+        """
+
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        Verify a password against its hash.
+        """
+
+        return await self._run(self.context.verify, plain_password, hashed_password)
+
+    def close(self):
+        """
+        Release the hashing threads.
+        """
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """
+        Get counters of the hasher.
+        
+        Returns:
+            dict: In-flight and queued calls, completed and rejected calls,
+            average queue wait and hashing time
+        """
+
+        return {
+            "in_flight": self.in_flight,
+            "queued": max(self.in_flight - self.workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": self.wait_ms / self.completed if self.completed else 0.0,
+            "avg_hash_ms": self.hash_ms / self.completed if self.completed else 0.0,
+        }
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, retry later",
+                headers={ "Retry-After": str(self.retry_after) }
+            )
+
+        submitted = time.monotonic()
+
+        def timed():
+            started = time.monotonic()
+            result = func(*args)
+            return result, started - submitted, time.monotonic() - started
+
+        self.in_flight += 1
+        try:
+            result, wait, duration = await asyncio.get_running_loop().run_in_executor(self.executor, timed)
+        finally:
+            self.in_flight -= 1
+
+        self.completed += 1
+        self.wait_ms += wait * 1000
+        self.hash_ms += duration * 1000
+
+        return result
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+
+from dataclasses import dataclass, field
+from typing import Optional
+from langchain_core.messages import BaseMessage, HumanMessage, messages_from_dict
+from langchain_core.language_models import BaseChatModel
+
+from app.db.connection import get_db
+from app.services.sessions import Sessions
+from app.services.writer import MessageWriter
+from app.services.metrics import stage
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below between a user and an assistant in a few sentences, "
+    "keeping facts, decisions and open questions the assistant will need later."
+)
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class HistoryWindow:
+    """
+    Messages of a session sent to the model on a turn.
+    """
+
+    messages: list[BaseMessage] = field(default_factory=list)
+    summary: Optional[str] = None
+    summarized_until: Optional[int] = None
+    first_id: Optional[int] = None
+    truncated: bool = False
+
+def estimate_tokens(message: BaseMessage) -> int:
+    """
+    Roughly estimate the number of tokens of a message.
+
+    Args:
+        message: Chat message
+
+    Returns:
+        int: Estimated token count, about four characters per token
+    """
+
+    return len(str(message.content)) // 4 + 4
+
+class HistoryStrategy:
+    """
+    Selects which part of a session's history is sent to the model.
+
+    At most the last `max_messages` messages are loaded, further trimmed to
+    `token_budget` estimated tokens. The window starts on a multiple of
+    `window_step` messages, so it moves forward by whole steps instead of one
+    turn at a time, and the history sent to the model keeps the same prefix
+    until the next step. When enabled, older messages that fall out of the
+    window are folded into a rolling summary stored on the session.
+    """
+
+    def __init__(
+        self,
+        sessions: Sessions,
+        writer: MessageWriter,
+        llm: Optional[BaseChatModel],
+        max_messages: int,
+        token_budget: int,
+        window_step: int = 10,
+        summarize: bool = False,
+        summary_batch: int = 10
+    ):
+        """
+        Args:
+            sessions: Sessions service
+            writer: Message writer holding turns not yet persisted
+            llm: Chat model used to write summaries, set once the model client is created
+            max_messages: Maximum number of recent messages loaded per turn
+            token_budget: Maximum estimated tokens of the loaded messages
+            window_step: Number of messages the window start moves by, even so
+                the window opens on a user turn
+            summarize: Whether to keep a rolling summary of older messages
+            summary_batch: Minimum number of unsummarized older messages before summarizing
+        """
+
+        self.sessions = sessions
+        self.writer = writer
+        self.llm = llm
+        self.max_messages = max_messages
+        self.token_budget = token_budget
+        self.window_step = max(window_step, 1)
+        self.summarize = summarize
+        self.summary_batch = summary_batch
+        self._tasks: set[asyncio.Task] = set()
+        self._summarizing: set[str] = set()
+
+    async def load(self, session_id: str) -> HistoryWindow:
+        """
+        Load the history window of a session.
+
+        Args:
+            session_id: The identifier of the session
+
+        Returns:
+            HistoryWindow: The recent messages and the summary of older ones
+        """
+
+        # Read before the database, see MessageWriter.pending
+        pending = self.writer.pending(session_id)
+
+        with stage("history"):
+            async with get_db() as db:
+                rows, count = await self.sessions.get_recent_messages_with_count(session_id, self.max_messages, db)
+                summary, summarized_until = (
+                    await self.sessions.get_summary(session_id, db) if self.summarize else (None, None)
+                )
+
+        persisted = messages_from_dict([row.message for row in rows])
+        written = { message.id for message in persisted }
+        pending = [message for message in pending if message.id not in written]
+        messages = persisted + pending
+        ids = [row.id for row in rows] + [None] * len(pending)
+        total = count + len(pending)
+
+        # Index of the first window message in the session, rounded up to a whole step
+        start = -(-max(total - self.max_messages, 0) // self.window_step) * self.window_step
+        skipped = max(start - (total - len(messages)), 0)
+
+        del messages[:skipped], ids[:skipped]
+        truncated = start > 0
+
+        tokens = sum(estimate_tokens(message) for message in messages)
+
+        while messages and tokens > self.token_budget:
+            tokens -= sum(estimate_tokens(message) for message in messages[:self.window_step])
+            del messages[:self.window_step], ids[:self.window_step]
+            truncated = True
+
+        # The window must open on a user turn
+        while messages and not isinstance(messages[0], HumanMessage):
+            messages.pop(0)
+            ids.pop(0)
+            truncated = True
+
+        return HistoryWindow(
+            messages=messages,
+            summary=summary,
+            summarized_until=summarized_until,
+            first_id=next((id for id in ids if id is not None), None),
+            truncated=truncated
+        )
+
+    def schedule_summary(self, session_id: str, window: HistoryWindow):
+        """
+        Update the rolling summary in the background if enough messages fell out of the window.
+
+        Args:
+            session_id: The identifier of the session
+            window: The history window used on this turn
+        """
+
+        if not self.summarize or not window.truncated or window.first_id is None:
+            return
+
+        if session_id in self._summarizing:
+            return
+
+        self._summarizing.add(session_id)
+
+        task = asyncio.create_task(self._summarize(session_id, window))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, session_id: str, window: HistoryWindow):
+        try:
+            async with get_db() as db:
+                pending = await self.sessions.count_messages_between(
+                    session_id, window.summarized_until, window.first_id, db
+                )
+
+                if pending < self.summary_batch:
+                    return
+
+                rows = await self.sessions.get_messages_between(
+                    session_id, window.summarized_until, window.first_id, db
+                )
+
+            transcript = "\n".join(
+                f"{message.type}: {message.content}"
+                for message in messages_from_dict([row.message for row in rows])
+            )
+
+            if window.summary:
+                transcript = f"Summary so far: {window.summary}\n\n{transcript}"
+
+            response = await self.llm.ainvoke([HumanMessage(content=f"{SUMMARY_PROMPT}\n\n{transcript}")])
+
+            async with get_db() as db:
+                await self.sessions.update_summary(session_id, str(response.content), rows[-1].id, db)
+
+        except Exception:
+            logger.exception("Failed to summarize history of session %s", session_id)
+
+        finally:
+            self._summarizing.discard(session_id)
@@ -0,0 +1,272 @@
+import os
+import time
+import bisect
+
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Callable, Iterator
+
+# Upper bounds in seconds, from 1ms to 60s
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram.
+
+    Quantiles are estimated by linear interpolation inside the bucket
+    holding the requested rank, as Prometheus' `histogram_quantile` does.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile of the observed values.
+
+        Args:
+            q: Quantile between 0 and 1
+
+        Returns:
+            float: Estimated value in seconds, 0 if nothing was observed
+        """
+
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+
+            seen += count
+
+        return self.buckets[-1]
+
+class Trace:
+    """
+    Stage timings of a single request.
+    """
+
+    def __init__(self, metrics: "Metrics"):
+        self.metrics = metrics
+        self.started = time.monotonic()
+        self.timings: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time the enclosed block as a stage of the request.
+
+        Args:
+            name: Name of the stage
+        """
+
+        started = time.monotonic()
+
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - started)
+
+    def record(self, name: str, seconds: float):
+        """
+        Record the duration of a stage.
+
+        Args:
+            name: Name of the stage
+            seconds: Duration of the stage
+        """
+
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+        self.metrics.observe(name, seconds)
+
+    def elapsed(self) -> float:
+        """
+        Get the seconds elapsed since the request started.
+        """
+
+        return time.monotonic() - self.started
+
+    def breakdown(self) -> dict[str, float]:
+        """
+        Get the stage timings in milliseconds.
+        """
+
+        return { name: round(seconds * 1000, 3) for name, seconds in self.timings.items() }
+
+    def server_timing(self) -> str:
+        """
+        Format the stage timings as a `Server-Timing` header value.
+        """
+
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.breakdown().items())
+
+class NullTrace:
+    """
+    Trace used when metrics are disabled, ignoring every timing.
+    """
+
+    started = 0.0
+    timings: dict[str, float] = {}
+
+    def stage(self, name: str):
+        return nullcontext()
+
+    def record(self, name: str, seconds: float):
+        pass
+
+    def elapsed(self) -> float:
+        return 0.0
+
+    def breakdown(self) -> dict[str, float]:
+        return {}
+
+    def server_timing(self) -> str:
+        return ""
+
+NULL_TRACE = NullTrace()
+
+current_trace: ContextVar[Trace | NullTrace] = ContextVar("current_trace", default=NULL_TRACE)
+
+class Metrics:
+    """
+    Registry of per-stage latency histograms.
+
+    Requests are timed through a Trace bound to the current context, so
+    stages deep in the call stack are attributed to the request that ran
+    them. When disabled, every request gets the shared NullTrace.
+
+    Every worker process of the server keeps its own registry, and a scrape
+    is answered by whichever worker accepts the connection. Each series
+    carries a `worker` label with the process id, so the series of different
+    workers never overwrite each other and can be summed over that label.
+    """
+
+    def __init__(self, enabled: bool, prefix: str = "chat"):
+        """
+        Args:
+            enabled: Whether stage timings are recorded
+            prefix: Prefix of the exported metric names
+        """
+
+        self.enabled = enabled
+        self.prefix = prefix
+        self.histograms: dict[str, Histogram] = {}
+        self.gauges: dict[str, tuple[str, Callable[[], list[tuple[dict[str, str], float]]]]] = {}
+
+    def trace(self) -> Trace | NullTrace:
+        """
+        Start timing a request and bind it to the current context.
+
+        Returns:
+            Trace | NullTrace: The trace of the request
+        """
+
+        trace = Trace(self) if self.enabled else NULL_TRACE
+        current_trace.set(trace)
+
+        return trace
+
+    def observe(self, stage: str, seconds: float):
+        """
+        Record a stage duration that doesn't belong to a single request.
+
+        Args:
+            stage: Name of the stage
+            seconds: Duration of the stage
+        """
+
+        if not self.enabled:
+            return
+
+        histogram = self.histograms.get(stage)
+
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+
+        histogram.observe(seconds)
+
+    def gauge(self, name: str, description: str, collect: Callable[[], list[tuple[dict[str, str], float]]]):
+        """
+        Register a gauge whose values are collected when metrics are rendered.
+
+        Args:
+            name: Name of the gauge, without the prefix
+            description: Help text of the gauge
+            collect: Function returning the current values with their labels
+        """
+
+        self.gauges[name] = (description, collect)
+
+    def render(self) -> str:
+        """
+        Render the histograms in the Prometheus text exposition format.
+
+        Returns:
+            str: Bucket counts, sums and counts of every stage histogram,
+            followed by their p50, p95 and p99 estimates and the gauges,
+            labelled with the worker process id
+        """
+
+        worker = f'worker="{os.getpid()}"'
+        name = f"{self.prefix}_stage_duration_seconds"
+        lines = [
+            f"# HELP {name} Duration of request pipeline stages.",
+            f"# TYPE {name} histogram"
+        ]
+
+        for stage, histogram in sorted(self.histograms.items()):
+            cumulative = 0
+
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{worker},stage="{stage}",le="{bound}"}} {cumulative}')
+
+            lines.append(f'{name}_bucket{{{worker},stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{{worker},stage="{stage}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{{worker},stage="{stage}"}} {histogram.count}')
+
+        lines += [
+            f"# HELP {name}_quantile Estimated quantiles of the pipeline stage durations.",
+            f"# TYPE {name}_quantile gauge"
+        ]
+
+        for stage, histogram in sorted(self.histograms.items()):
+            for q in QUANTILES:
+                lines.append(f'{name}_quantile{{{worker},stage="{stage}",quantile="{q}"}} {histogram.quantile(q)}')
+
+        for gauge, (description, collect) in sorted(self.gauges.items()):
+            name = f"{self.prefix}_{gauge}"
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge"]
+
+            for labels, value in collect():
+                label_text = ",".join([worker, *(f'{key}="{label}"' for key, label in labels.items())])
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        return "\n".join(lines) + "\n"
+
+def stage(name: str):
+    """
+    Time the enclosed block as a stage of the current request.
+
+    Args:
+        name: Name of the stage
+    """
+
+    return current_trace.get().stage(name)
+
+metrics = Metrics(enabled=os.getenv("METRICS_ENABLED", "true").lower() == "true")
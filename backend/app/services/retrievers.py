@@ -0,0 +1,205 @@
+import os
+import json
+import numpy as np
+
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+
+Match = dict[str, Any]
+
+class Retriever(ABC):
+    """
+    Vector index holding the knowledge base chunks.
+    """
+
+    @abstractmethod
+    def query(self, embedding: list, top_k: int, category: Optional[str] = None) -> list[Match]:
+        """
+        Find the chunks closest to an embedding.
+        
+        Args:
+            embedding: Vector embedding of the query
+            top_k: Number of chunks to return
+            category: Only return chunks of this category, if set
+            
+        Returns:
+            list[Match]: Matches with `id`, `score` and `metadata`, best first
+        """
+
+    def refresh(self) -> bool:
+        """
+        Pick up the changes of a re-indexed knowledge base.
+
+        Returns:
+            bool: Whether the index changed since it was loaded or last refreshed
+        """
+
+        return False
+
+class PineconeRetriever(Retriever):
+    """
+    Retriever backed by a remote Pinecone index.
+
+    The ingestion pipeline stores the time of its last change in a version
+    record, kept in a namespace of its own so queries never match it.
+    """
+
+    VERSION_ID = "knowledge-base-version"
+    VERSION_NAMESPACE = "meta"
+
+    def __init__(self, index):
+        """
+        Args:
+            index: Pinecone index handle
+        """
+
+        self.index = index
+        self.version: Optional[str] = None
+
+    def query(self, embedding: list, top_k: int, category: Optional[str] = None) -> list[Match]:
+        results = self.index.query(
+            vector=embedding,
+            top_k=top_k,
+            include_values=False,
+            include_metadata=True,
+            filter={ "category": { "$eq": category } } if category else None
+        )
+
+        return [
+            {
+                "id": match["id"],
+                "score": match["score"],
+                "metadata": match["metadata"]
+            }
+            for match in results["matches"]
+        ]
+
+    def refresh(self) -> bool:
+        vectors = self.index.fetch(ids=[self.VERSION_ID], namespace=self.VERSION_NAMESPACE).vectors
+        record = vectors.get(self.VERSION_ID)
+        version = str(record.metadata["version"]) if record is not None else None
+        changed = self.version is not None and version != self.version
+
+        self.version = version
+
+        return changed
+
+class LocalRetriever(Retriever):
+    """
+    Retriever backed by an in-process index loaded from disk.
+
+    The index directory holds `vectors.npy`, a float32 matrix of
+    L2-normalized embeddings that is memory-mapped, and `metadata.json`,
+    the list of chunk metadata in the same row order.
+    """
+
+    VECTORS_FILE = "vectors.npy"
+    METADATA_FILE = "metadata.json"
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Directory containing the index files
+            
+        Raises:
+            ValueError: If the vectors and metadata files don't match
+        """
+
+        self.path = path
+        self.version, self.index = self._load()
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self.index[0]
+
+    @property
+    def metadata(self) -> list[dict]:
+        return self.index[1]
+
+    def refresh(self) -> bool:
+        """
+        Reload the index files if they were rewritten since they were loaded.
+
+        The metadata file is replaced last by LocalSink, so a new metadata
+        file means both files are new.
+        """
+
+        if os.stat(os.path.join(self.path, self.METADATA_FILE)).st_mtime_ns == self.version:
+            return False
+
+        self.version, self.index = self._load()
+
+        return True
+
+    def _load(self) -> tuple[int, tuple[np.ndarray, list[dict], np.ndarray]]:
+        metadata_path = os.path.join(self.path, self.METADATA_FILE)
+        version = os.stat(metadata_path).st_mtime_ns
+        vectors = np.load(os.path.join(self.path, self.VECTORS_FILE), mmap_mode="r")
+
+        with open(metadata_path) as file:
+            metadata: list[dict] = json.load(file)
+
+        if vectors.dtype != np.float32 or vectors.ndim != 2:
+            raise ValueError("Local index vectors must be a 2D float32 array")
+
+        if len(metadata) != vectors.shape[0]:
+            raise ValueError("Local index vectors and metadata have different lengths")
+
+        categories = np.array([item.get("category", "") for item in metadata])
+
+        # Swapped as a whole, so queries running on other threads see either index
+        return version, (vectors, metadata, categories)
+
+    def query(self, embedding: list, top_k: int, category: Optional[str] = None) -> list[Match]:
+        vectors, metadata, categories = self.index
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+
+        # Not in place, the embedding may be the caller's own float32 array
+        if norm:
+            query = query / norm
+
+        if category:
+            rows = np.flatnonzero(categories == category)
+            scores = vectors[rows] @ query
+        else:
+            rows = None
+            scores = vectors @ query
+
+        top_k = min(top_k, scores.shape[0])
+
+        if top_k <= 0:
+            return []
+
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+
+        return [
+            {
+                "id": metadata[row]["id"],
+                "score": float(scores[position]),
+                "metadata": metadata[row]
+            }
+            for position, row in zip(best, rows[best] if rows is not None else best)
+        ]
+
+def create_retriever(pinecone) -> Retriever:
+    """
+    Create the knowledge base retriever selected by RETRIEVER_BACKEND.
+    
+    Args:
+        pinecone: Pinecone client, used by the `pinecone` backend
+        
+    Returns:
+        Retriever: A `local` or `pinecone` retriever
+    """
+
+    backend = os.getenv("RETRIEVER_BACKEND", "pinecone")
+
+    if backend == "local":
+        return LocalRetriever(os.getenv("LOCAL_INDEX_PATH", "data/index"))
+
+    if backend == "pinecone":
+        return PineconeRetriever(pinecone.Index(os.getenv("PINECONE_INDEX_NAME")))
+
+    raise ValueError(f"Unknown retriever backend: {backend}")
@@ -1,13 +1,57 @@
-import psycopg
+import os
+import base64
 
+from uuid import UUID
 from datetime import datetime
-from langchain_postgres import PostgresChatMessageHistory
+from typing import Optional, Tuple
+from sqlalchemy import func, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
 
-from app.db.models import Db, Session
-from app.db.connection import connection_url
+from app.db.models import Db, Session, ChatHistory
+from app.services.cache import LRUCache
+
+SessionCursor = Tuple[datetime, str]
+
+def encode_session_cursor(created_at: datetime, session_id: str) -> str:
+    """
+    Encode the position of a session in a user's session list as an opaque cursor.
+    
+    Args:
+        created_at: Creation date of the session
+        session_id: The identifier of the session
+        
+    Returns:
+        str: URL-safe cursor
+    """
+
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{session_id}".encode()).decode()
+
+def decode_session_cursor(cursor: str) -> SessionCursor:
+    """
+    Decode a cursor produced by `encode_session_cursor`.
+    
+    Args:
+        cursor: URL-safe cursor
+        
+    Returns:
+        SessionCursor: Creation date and identifier of the session
+        
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+
+    try:
+        created_at, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), str(UUID(session_id))
+    except Exception:
+        raise ValueError("Invalid cursor")
 
 class Sessions:
-    def create_session(self, session_id, user_id: str, prompt: str, db: Db) -> str:   
+    def __init__(self):
+        # The owner of a session never changes, so entries don't expire
+        self.owner_cache = LRUCache(max_entries=int(os.getenv("SESSION_OWNER_CACHE_MAX_ENTRIES", "100000")))
+
+    async def create_session(self, session_id, user_id: str, prompt: str, db: Db) -> str:   
         """
         Create a new chat session in the database.
         
@@ -31,69 +75,281 @@ class Sessions:
             created_at=datetime.now()
         )
         db.add(new_session)
+        await db.flush()
 
         return new_session.id
 
-    def get_sessions(self, user_id: str, db: Db) -> list[Session]:
+    async def get_sessions(self, user_id: str, limit: int, before: Optional[SessionCursor], db: Db) -> list[Session]:
         """
-        Retrieve all sessions belonging to a specific user.
+        Retrieve a page of the sessions belonging to a specific user.
         
         Args:
             user_id: The identifier of the user whose sessions to retrieve
+            limit: Maximum number of sessions to retrieve
+            before: Only retrieve sessions older than this cursor position, if set
             
         Returns:
             list[Session]: A list of session objects ordered by creation date (newest first)
             
         Note:
             Each session object contains id, title, and created_at information.
+            Pages are served by a range scan on the (user_id, created_at, id) index.
         """
 
-        sessions = (
-            db
-            .query(Session)
+        query = (
+            select(Session.id, Session.title, Session.created_at)
             .filter(Session.user_id == user_id)
-            .order_by(Session.created_at.desc())
-            .all()
         )
+
+        if before is not None:
+            query = query.filter(tuple_(Session.created_at, Session.id) < tuple_(*before))
+
+        sessions = (
+            await db.execute(
+                query
+                .order_by(Session.created_at.desc(), Session.id.desc())
+                .limit(limit)
+            )
+        ).all()
         return sessions
         
-    def session_exists(self, session_id: str, db: Db) -> bool:
+    async def upsert_session(self, session_id: str, user_id: str, prompt: str, db: Db) -> Optional[str]:
         """
-        Check if a session with the given ID exists in the database.
+        Create a session if it doesn't exist and get its owner.
+        
+        On Postgres this is a single `INSERT ... ON CONFLICT DO NOTHING RETURNING`
+        statement, whose result falls back to the existing row on conflict.
+        Other databases read the existing row in a second statement on conflict.
         
         Args:
-            session_id: The session identifier to check
+            session_id: The identifier of the session
+            user_id: The identifier of the user creating the session
+            prompt: The initial prompt, used as the title of a new session
             
         Returns:
-            bool: True if the session exists, False otherwise
+            Optional[str]: The identifier of the user owning the session
         """
 
-        session = (
-            db
-            .query(Session)
-            .filter(Session.id == session_id)
-            .first()
-        )
-        return session is not None
+        values = {
+            "id": session_id,
+            "user_id": user_id,
+            "title": prompt,
+            "created_at": datetime.now()
+        }
+        owner = None
+
+        if db.bind.dialect.name == "postgresql":
+            inserted = (
+                postgresql.insert(Session)
+                .values(**values)
+                .on_conflict_do_nothing(index_elements=[Session.id])
+                .returning(Session.user_id)
+                .cte("inserted")
+            )
+            owner = (
+                await db.execute(
+                    select(inserted.c.user_id)
+                    .union_all(select(Session.user_id).filter(Session.id == session_id))
+                    .limit(1)
+                )
+            ).scalar()
+
+        elif db.bind.dialect.name == "sqlite":
+            owner = (
+                await db.execute(
+                    sqlite.insert(Session)
+                    .values(**values)
+                    .on_conflict_do_nothing(index_elements=[Session.id])
+                    .returning(Session.user_id)
+                )
+            ).scalar()
+
+        else:
+            owner = await self.get_owner(session_id, db)
+
+            if owner is None:
+                await self.create_session(session_id, user_id, prompt, db)
+                owner = user_id
+
+        # The row was inserted by a concurrent transaction after this statement started
+        if owner is None:
+            owner = await self.get_owner(session_id, db)
 
-    def get_message_history(self, session_id: str) -> PostgresChatMessageHistory:
+        if owner is not None:
+            self.owner_cache.set(session_id, owner)
+
+        return owner
+
+    async def get_owner(self, session_id: str, db: Db) -> Optional[str]:
         """
-        Get a message history handler for a specific session.
+        Get the owner of a session.
         
         Args:
-            session_id: The identifier of the session to get history for
+            session_id: The identifier of the session
             
         Returns:
-            PostgresChatMessageHistory: An object that provides access to the 
-            chat message history for the specified session
+            Optional[str]: The identifier of the user owning the session, None if it doesn't exist
+        """
+
+        owner = self.owner_cache.get(session_id)
+
+        if owner is None:
+            owner = (
+                await db.execute(
+                    select(Session.user_id)
+                    .filter(Session.id == session_id)
+                )
+            ).scalar()
+
+            if owner is not None:
+                self.owner_cache.set(session_id, owner)
+
+        return owner
+
+    async def get_recent_messages(self, session_id: str, limit: int, db: Db, before: Optional[int] = None) -> list[ChatHistory]:
+        """
+        Retrieve the most recent messages of a session.
+        
+        Args:
+            session_id: The identifier of the session
+            limit: Maximum number of messages to retrieve
+            before: Only retrieve messages with a lower id than this one, if set
+            
+        Returns:
+            list[ChatHistory]: Up to `limit` message rows in chronological order
             
         Note:
-            This creates a connection to the database that will need to be managed
-            by the caller.
+            Served by a backward range scan on the (session_id, id) index.
+        """
+
+        query = (
+            select(ChatHistory)
+            .filter(ChatHistory.session_id == session_id)
+        )
+
+        if before is not None:
+            query = query.filter(ChatHistory.id < before)
+
+        messages = (
+            await db.execute(
+                query
+                .order_by(ChatHistory.id.desc())
+                .limit(limit)
+            )
+        ).scalars().all()
+        return list(reversed(messages))
+
+    async def get_recent_messages_with_count(self, session_id: str, limit: int, db: Db) -> Tuple[list[ChatHistory], int]:
+        """
+        Retrieve the most recent messages of a session and count all its messages.
+        
+        Both come from the same statement, so they agree with each other
+        even while messages are being written.
+        
+        Args:
+            session_id: The identifier of the session
+            limit: Maximum number of messages to retrieve
+            
+        Returns:
+            Tuple[list[ChatHistory], int]: Up to `limit` message rows in chronological
+            order and the number of messages of the session
+        """
+
+        rows = (
+            await db.execute(
+                select(ChatHistory, func.count().over())
+                .filter(ChatHistory.session_id == session_id)
+                .order_by(ChatHistory.id.desc())
+                .limit(limit)
+            )
+        ).all()
+
+        return [row[0] for row in reversed(rows)], rows[0][1] if rows else 0
+
+    async def get_messages_between(self, session_id: str, after_id: Optional[int], before_id: int, db: Db) -> list[ChatHistory]:
+        """
+        Retrieve the messages of a session within an id range.
+        
+        Args:
+            session_id: The identifier of the session
+            after_id: Exclusive lower bound of the message ids, None for the start of the session
+            before_id: Exclusive upper bound of the message ids
+            
+        Returns:
+            list[ChatHistory]: The message rows in chronological order
+        """
+
+        query = (
+            select(ChatHistory)
+            .filter(ChatHistory.session_id == session_id)
+            .filter(ChatHistory.id < before_id)
+        )
+
+        if after_id is not None:
+            query = query.filter(ChatHistory.id > after_id)
+
+        messages = (
+            await db.execute(query.order_by(ChatHistory.id))
+        ).scalars().all()
+        return list(messages)
+
+    async def count_messages_between(self, session_id: str, after_id: Optional[int], before_id: int, db: Db) -> int:
+        """
+        Count the messages of a session within an id range.
+        
+        Args:
+            session_id: The identifier of the session
+            after_id: Exclusive lower bound of the message ids, None for the start of the session
+            before_id: Exclusive upper bound of the message ids
+            
+        Returns:
+            int: Number of messages in the range
         """
+
+        query = (
+            select(func.count())
+            .select_from(ChatHistory)
+            .filter(ChatHistory.session_id == session_id)
+            .filter(ChatHistory.id < before_id)
+        )
+
+        if after_id is not None:
+            query = query.filter(ChatHistory.id > after_id)
+
+        return (await db.execute(query)).scalar_one()
+
+    async def get_summary(self, session_id: str, db: Db) -> Tuple[Optional[str], Optional[int]]:
+        """
+        Get the rolling summary of the older messages of a session.
         
-        return PostgresChatMessageHistory(
-            'chat_history',
-            session_id,
-            sync_connection=psycopg.connect(connection_url)
+        Args:
+            session_id: The identifier of the session
+            
+        Returns:
+            Tuple[Optional[str], Optional[int]]: The summary and the id of the
+            last message it covers, or None values if there is no summary
+        """
+
+        row = (
+            await db.execute(
+                select(Session.summary, Session.summarized_until)
+                .filter(Session.id == session_id)
+            )
+        ).first()
+        return (row.summary, row.summarized_until) if row else (None, None)
+
+    async def update_summary(self, session_id: str, summary: str, summarized_until: int, db: Db):
+        """
+        Store the rolling summary of the older messages of a session.
+        
+        Args:
+            session_id: The identifier of the session
+            summary: The summary text
+            summarized_until: The id of the last message covered by the summary
+        """
+
+        await db.execute(
+            update(Session)
+            .filter(Session.id == session_id)
+            .values(summary=summary, summarized_until=summarized_until)
         )
@@ -0,0 +1,152 @@
+import asyncio
+
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+Event = Dict[str, Any]
+
+class Flight:
+    """
+    A single generation shared by every request with the same key.
+
+    The events are produced by a task of their own and buffered, so
+    subscribers joining late replay the events produced so far and then
+    follow the live stream. The task is cancelled when every subscriber has
+    left before it finished.
+    """
+
+    def __init__(self, events: AsyncIterator[Event], on_close: Callable[["Flight"], None]):
+        """
+        Args:
+            events: Events of the generation
+            on_close: Called once the flight stops accepting subscribers
+        """
+
+        self.events: list[Event] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._on_close = on_close
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._run(events))
+
+    async def subscribe(self) -> AsyncIterator[Event]:
+        """
+        Follow the events of the generation from the start.
+
+        Yields:
+            Event: Every event of the generation, in order
+
+        Raises:
+            Exception: The error that ended the generation, if any
+        """
+
+        self.subscribers += 1
+        index = 0
+
+        try:
+            while True:
+                changed = self._changed
+
+                while index < len(self.events):
+                    yield self.events[index]
+                    index += 1
+
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+
+                await changed.wait()
+
+        finally:
+            self.subscribers -= 1
+
+            if not self.subscribers and not self.done:
+                self._close()
+                self._task.cancel()
+
+    async def _run(self, events: AsyncIterator[Event]):
+        try:
+            async for event in events:
+                self.events.append(event)
+                self._notify()
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            self.error = error
+        finally:
+            self.done = True
+            self._close()
+            self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _close(self):
+        if self._on_close is not None:
+            self._on_close(self)
+            self._on_close = None
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight generations.
+
+    The first request for a key starts the generation, later requests for
+    the same key subscribe to it until it completes.
+    """
+
+    def __init__(self, enabled: bool = True):
+        """
+        Args:
+            enabled: Whether generations are shared, each request generates its own otherwise
+        """
+
+        self.enabled = enabled
+        self.generations = 0
+        self.coalesced = 0
+        self._flights: dict[str, Flight] = {}
+
+    def stream(self, key: str, generate: Callable[[], AsyncIterator[Event]]) -> AsyncIterator[Event]:
+        """
+        Stream the events of the generation for a key, starting it if none is in flight.
+
+        Args:
+            key: Key identifying identical generations
+            generate: Function starting a new generation
+
+        Returns:
+            AsyncIterator[Event]: The events of the shared generation
+        """
+
+        if not self.enabled:
+            self.generations += 1
+            return generate()
+
+        flight = self._flights.get(key)
+
+        if flight is None:
+            flight = self._flights[key] = Flight(generate(), lambda closed: self._remove(key, closed))
+            self.generations += 1
+        else:
+            self.coalesced += 1
+
+        return flight.subscribe()
+
+    def stats(self) -> dict:
+        """
+        Get counters of the single-flight layer.
+
+        Returns:
+            dict: In-flight generations, started generations and coalesced requests
+        """
+
+        return {
+            "in_flight": len(self._flights),
+            "generations": self.generations,
+            "coalesced": self.coalesced,
+        }
+
+    def _remove(self, key: str, flight: Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
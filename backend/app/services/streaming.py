@@ -0,0 +1,144 @@
+import asyncio
+import orjson
+
+from typing import Any, AsyncIterator, Optional
+
+STREAM_EVENT = "on_chat_model_stream"
+KEEP_ALIVE = b": keep-alive\n\n"
+
+class SSEEncoder:
+    """
+    Encodes chat events as Server-Sent Events frames.
+
+    Consecutive token events are coalesced into a single frame until
+    `flush_bytes` characters are buffered or `flush_interval` seconds have
+    passed since the first buffered token. A comment frame is sent when no
+    event was produced for `keepalive_interval` seconds.
+    """
+
+    def __init__(self, flush_bytes: int, flush_interval: float, keepalive_interval: float, max_pending: int = 256):
+        """
+        Args:
+            flush_bytes: Number of buffered token characters that triggers a frame
+            flush_interval: Maximum seconds a token is buffered before being sent
+            keepalive_interval: Seconds of silence before a keep-alive comment is sent
+            max_pending: Maximum number of events produced ahead of the client
+        """
+
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.keepalive_interval = keepalive_interval
+        self.max_pending = max_pending
+
+    @staticmethod
+    def frame(event: dict[str, Any]) -> bytes:
+        """
+        Encode a single event as an SSE data frame.
+
+        Args:
+            event: Event payload
+
+        Returns:
+            bytes: The `data:` frame
+        """
+
+        return b"data: " + orjson.dumps(event) + b"\n\n"
+
+    async def encode(self, events: AsyncIterator[dict[str, Any]]) -> AsyncIterator[bytes]:
+        """
+        Encode a stream of chat events as SSE frames.
+
+        Args:
+            events: Chat events, token events carrying their text in `data`
+
+        Yields:
+            bytes: SSE frames
+        """
+
+        async for event in self.coalesce(events):
+            yield KEEP_ALIVE if event is None else self.frame(event)
+
+    async def coalesce(self, events: AsyncIterator[dict[str, Any]]) -> AsyncIterator[Optional[dict[str, Any]]]:
+        """
+        Merge consecutive token events of a stream of chat events.
+
+        Events are produced by a separate task, so the time-based flushes and
+        keep-alives don't depend on when the next event arrives. Closing the
+        returned generator cancels the producer.
+
+        Args:
+            events: Chat events, token events carrying their text in `data`
+
+        Yields:
+            Optional[dict[str, Any]]: Chat events, or None when a keep-alive is due
+        """
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_pending)
+        done = object()
+
+        async def produce():
+            try:
+                async for event in events:
+                    await queue.put(event)
+                await queue.put(done)
+            except Exception as error:
+                await queue.put(error)
+
+        producer = asyncio.create_task(produce())
+        buffer: list[str] = []
+        buffered = 0
+        deadline = 0.0
+
+        try:
+            while True:
+                timeout = deadline - loop.time() if buffer else self.keepalive_interval
+
+                try:
+                    item = await asyncio.wait_for(queue.get(), max(timeout, 0))
+                except asyncio.TimeoutError:
+                    if buffer:
+                        yield { "event": STREAM_EVENT, "data": "".join(buffer) }
+                        buffer, buffered = [], 0
+                    else:
+                        yield None
+                    continue
+
+                if item is done:
+                    break
+
+                if isinstance(item, Exception):
+                    if buffer:
+                        yield { "event": STREAM_EVENT, "data": "".join(buffer) }
+
+                    raise item
+
+                if item["event"] == STREAM_EVENT:
+                    if not buffer:
+                        deadline = loop.time() + self.flush_interval
+
+                    buffer.append(item["data"])
+                    buffered += len(item["data"])
+
+                    if buffered >= self.flush_bytes or self.flush_interval <= 0:
+                        yield { "event": STREAM_EVENT, "data": "".join(buffer) }
+                        buffer, buffered = [], 0
+
+                    continue
+
+                if buffer:
+                    yield { "event": STREAM_EVENT, "data": "".join(buffer) }
+                    buffer, buffered = [], 0
+
+                yield item
+
+            if buffer:
+                yield { "event": STREAM_EVENT, "data": "".join(buffer) }
+
+        finally:
+            producer.cancel()
+
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
@@ -1,10 +1,20 @@
+import os
+
 from uuid import uuid4
 from datetime import datetime
+from sqlalchemy import select
 
 from app.db.models import User, Db
+from app.services.cache import LRUCache
 
 class Users:
-    def create_user(self, username: str, email: str, password_hash: str, db: Db) -> User:
+    def __init__(self):
+        self.user_cache = LRUCache(
+            max_entries=int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000")),
+            ttl=float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+        )
+
+    async def create_user(self, username: str, email: str, password_hash: str, db: Db) -> User:
         """
         Create a new user in the database
         
@@ -25,10 +35,11 @@ class Users:
             created_at=datetime.now()
         )
         db.add(new_user)
+        await db.flush()
 
         return new_user
     
-    def user_exists(self, email: str, db: Db) -> bool:
+    async def user_exists(self, email: str, db: Db) -> bool:
         """
         Check if a user with the given email already exists
         
@@ -40,14 +51,14 @@ class Users:
         """
 
         user = (
-            db
-            .query(User)
-            .filter(User.email == email)
-            .first()
-        )
+            await db.execute(
+                select(User)
+                .filter(User.email == email)
+            )
+        ).scalars().first()
         return user is not None
         
-    def get_user_by_id(self, user_id: str, db: Db) -> User:
+    async def get_user_by_id(self, user_id: str, db: Db) -> User:
         """
         Get user by ID
         
@@ -56,17 +67,66 @@ class Users:
             
         Returns:
             User: The user object if found, None otherwise
+            
+        Note:
+            Found users are cached for USER_CACHE_TTL_SECONDS.
         """
 
+        user = self.user_cache.get(str(user_id))
+
+        if user is not None:
+            return user
+
         user = (
-            db
-            .query(User)
-            .filter(User.id == user_id)
-            .first()
-        )
+            await db.execute(
+                select(User)
+                .filter(User.id == user_id)
+            )
+        ).scalars().first()
+
+        if user is not None:
+            self.user_cache.set(str(user_id), user)
+
+        return user
+
+    async def update_password(self, user_id: str, password_hash: str, db: Db) -> User:
+        """
+        Replace the password hash of a user
+        
+        Args:
+            user_id: ID of the user
+            password_hash: New hashed password of the user
+            
+        Returns:
+            User: The updated user object if found, None otherwise
+        """
+
+        user = (
+            await db.execute(
+                select(User)
+                .filter(User.id == user_id)
+            )
+        ).scalars().first()
+
+        if user is not None:
+            user.password_hash = password_hash
+            await db.flush()
+
+        self.invalidate_user(user_id)
+
         return user
+
+    def invalidate_user(self, user_id: str):
+        """
+        Drop a user from the user cache, e.g. after it was updated or deleted
         
-    def get_user_by_email(self, email: str, db: Db) -> User:
+        Args:
+            user_id: ID of the user
+        """
+
+        self.user_cache.delete(str(user_id))
+        
+    async def get_user_by_email(self, email: str, db: Db) -> User:
         """
         Get user by Email
         
@@ -78,9 +138,9 @@ class Users:
         """
 
         user = (
-            db
-            .query(User)
-            .filter(User.email == email)
-            .first()
-        )
+            await db.execute(
+                select(User)
+                .filter(User.email == email)
+            )
+        ).scalars().first()
         return user
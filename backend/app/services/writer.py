@@ -0,0 +1,254 @@
+import time
+import uuid
+import asyncio
+import logging
+
+from collections import defaultdict
+from typing import Optional
+from sqlalchemy import insert
+from langchain_core.messages import BaseMessage, message_to_dict
+
+from app.db.connection import SessionLocal, get_engine
+from app.db.models import ChatHistory
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class MessageWriter:
+    """
+    Write-behind queue persisting chat messages outside of the response stream.
+
+    Each enqueued item holds all the messages of one turn. Items from many
+    sessions are grouped into a single multi-row INSERT, flushed when
+    `batch_size` items are queued or `flush_interval` seconds have passed,
+    so the messages of a turn are always committed together. A batch that
+    keeps failing is retried one session at a time, so a bad turn only
+    drops its own messages.
+
+    Queued turns are only visible to `pending` in this process. Requests
+    served by other workers read them from the database, so they only see
+    a turn once its batch is committed, `flush_interval` seconds after the
+    stream ended at most while the database keeps up.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float, max_queue: int, max_retries: int = 3):
+        """
+        Args:
+            batch_size: Maximum number of turns written by one INSERT
+            flush_interval: Maximum seconds a turn waits in the queue
+            max_queue: Maximum number of queued turns before enqueueing waits
+            max_retries: Number of attempts to write a batch before dropping it
+        """
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.flush_ms = 0.0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._pending: dict[str, list[BaseMessage]] = defaultdict(list)
+        self._written: dict[str, list[asyncio.Future]] = defaultdict(list)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """
+        Start the background flushing task.
+        """
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Flush every queued turn and stop the background task.
+        """
+
+        if self._task is None:
+            return
+
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def enqueue(self, session_id: str, messages: list[BaseMessage]) -> asyncio.Future:
+        """
+        Queue the messages of a turn for persistence.
+
+        Messages without an id are given one, so they can be told apart from
+        their persisted copy once written.
+
+        Args:
+            session_id: The identifier of the session
+            messages: Messages of the turn, written atomically and in order
+
+        Returns:
+            asyncio.Future: Resolved with whether the turn was written once it was committed or dropped
+        """
+
+        messages = [
+            message if message.id else message.model_copy(update={ "id": str(uuid.uuid4()) })
+            for message in messages
+        ]
+        written = asyncio.get_running_loop().create_future()
+
+        self._pending[session_id].extend(messages)
+        self._written[session_id].append(written)
+        await self._queue.put((session_id, messages, written))
+
+        return written
+
+    async def wait(self, session_id: str):
+        """
+        Wait until the turns of a session queued so far are committed or dropped.
+
+        Args:
+            session_id: The identifier of the session
+        """
+
+        written = list(self._written.get(session_id, []))
+
+        if written:
+            await asyncio.wait(written)
+
+    def pending(self, session_id: str) -> list[BaseMessage]:
+        """
+        Get the messages of a session that are queued but not yet written.
+
+        Messages leave the queue in the same step their batch is committed,
+        so a caller reading the queue before the database sees each message
+        at least once, and can drop duplicates by message id.
+
+        Args:
+            session_id: The identifier of the session
+
+        Returns:
+            list[BaseMessage]: Unwritten messages in chronological order
+        """
+
+        return list(self._pending.get(session_id, []))
+
+    def stats(self) -> dict:
+        """
+        Get counters of the writer.
+
+        Returns:
+            dict: Queue depth, written messages, batches, failures and flush time
+        """
+
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "avg_flush_ms": self.flush_ms / self.batches if self.batches else 0.0,
+        }
+
+    async def _run(self):
+        stopping = False
+
+        while not stopping:
+            item = await self._queue.get()
+
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout) if timeout > 0 else self._queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+
+                if item is None:
+                    stopping = True
+                    break
+
+                batch.append(item)
+
+            await self._flush(batch)
+
+        while not self._queue.empty():
+            items = [item for item in (self._queue.get_nowait() for _ in range(self._queue.qsize())) if item]
+
+            for start in range(0, len(items), self.batch_size):
+                await self._flush(items[start:start + self.batch_size])
+
+    async def _flush(self, batch: list[tuple[str, list[BaseMessage], asyncio.Future]]):
+        for attempt in range(self.max_retries):
+            if await self._write(batch, attempt):
+                return
+
+            await asyncio.sleep(0.1 * 2 ** attempt)
+
+        sessions: dict[str, list] = defaultdict(list)
+
+        for item in batch:
+            sessions[item[0]].append(item)
+
+        for session_id, items in sessions.items():
+            if len(sessions) == 1 or not await self._write(items, self.max_retries):
+                logger.error("Dropped %d chat messages of session %s", sum(len(item[1]) for item in items), session_id)
+                self.dropped += sum(len(item[1]) for item in items)
+                self._settle(items, False)
+
+    async def _write(self, batch: list[tuple[str, list[BaseMessage], asyncio.Future]], attempt: int) -> bool:
+        rows = [
+            { "session_id": session_id, "message": message_to_dict(message) }
+            for session_id, messages, _ in batch
+            for message in messages
+        ]
+        started = time.monotonic()
+        db = SessionLocal(bind=get_engine())
+
+        try:
+            await db.execute(insert(ChatHistory), rows)
+            await db.commit()
+
+            # Settled before any other await, so no reader sees the rows
+            # neither in the database nor in the queue
+            self._settle(batch, True)
+
+        except Exception:
+            self.failures += 1
+            logger.exception("Failed to write %d chat messages (attempt %d)", len(rows), attempt + 1)
+            return False
+
+        finally:
+            await db.close()
+
+        metrics.observe("db_write", time.monotonic() - started)
+        self.flush_ms += (time.monotonic() - started) * 1000
+        self.batches += 1
+        self.written += len(rows)
+
+        return True
+
+    def _settle(self, batch: list[tuple[str, list[BaseMessage], asyncio.Future]], written: bool):
+        for session_id, messages, future in batch:
+            pending = self._pending.get(session_id)
+
+            if pending is not None:
+                ids = { message.id for message in messages }
+                pending[:] = [message for message in pending if message.id not in ids]
+
+                if not pending:
+                    del self._pending[session_id]
+
+            futures = self._written.get(session_id)
+
+            if futures is not None:
+                futures.remove(future)
+
+                if not futures:
+                    del self._written[session_id]
+
+            if not future.done():
+                future.set_result(written)
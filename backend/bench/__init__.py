@@ -0,0 +1,13 @@
+import subprocess
+
+from typing import Optional
+
+def commit() -> Optional[str]:
+    """
+    Get the commit the benchmark runs on, to compare results across commits.
+    """
+
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
@@ -0,0 +1,286 @@
+"""
+Backend load test.
+
+Boots `app.main:app` on a local port with fake Anthropic and Pinecone
+clients and a SQLite database (or the database at `--database-url`), then
+drives concurrent signups, logins, completion streams and history reads.
+Throughput, time to first token and latency percentiles per endpoint are
+printed as JSON, so runs can be compared across commits.
+
+Usage:
+    python -m bench --concurrency 32 --sessions 4 --turns 3 --output bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+
+from collections import defaultdict
+from typing import Optional
+
+from bench import commit
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+def summarize(values: list[float]) -> dict:
+    """
+    Get latency percentiles in milliseconds.
+    """
+
+    if not values:
+        return {}
+
+    return {
+        "p50": round(percentile(values, 0.5) * 1000, 3),
+        "p95": round(percentile(values, 0.95) * 1000, 3),
+        "p99": round(percentile(values, 0.99) * 1000, 3),
+        "max": round(max(values) * 1000, 3),
+        "mean": round(sum(values) / len(values) * 1000, 3)
+    }
+
+class Recorder:
+    """
+    Collects latencies and errors per endpoint.
+    """
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.statuses: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.ttft: list[float] = []
+        self.started = time.monotonic()
+
+    def record(self, endpoint: str, seconds: float, status: Optional[int]):
+        ok = status is not None and status < 400
+        self.statuses[endpoint][str(status or "error")] += 1
+
+        if ok:
+            self.latencies[endpoint].append(seconds)
+        else:
+            self.errors[endpoint] += 1
+
+    def report(self) -> dict:
+        elapsed = time.monotonic() - self.started
+
+        return {
+            endpoint: {
+                "requests": len(self.latencies[endpoint]) + self.errors[endpoint],
+                "errors": self.errors[endpoint],
+                "statuses": dict(self.statuses[endpoint]),
+                "rps": round(len(self.latencies[endpoint]) / elapsed, 2) if elapsed else 0.0,
+                "latency_ms": summarize(self.latencies[endpoint]),
+                **({ "ttft_ms": summarize(self.ttft) } if endpoint == "/chat/completion" else {})
+            }
+            for endpoint in sorted(set(self.latencies) | set(self.errors))
+        }
+
+def configure(args: argparse.Namespace, workdir: str):
+    """
+    Point the application at the local stand-ins, before it is imported.
+    """
+
+    os.environ["POSTGRES_URL"] = args.database_url or f"sqlite+aiosqlite:///{workdir}/bench.db"
+    os.environ["RETRIEVER_BACKEND"] = "local"
+    os.environ["LOCAL_INDEX_PATH"] = os.path.join(workdir, "index")
+    os.environ["EMBEDDING_CACHE_URL"] = ""
+    os.environ.setdefault("ANTHROPIC_API_KEY", "bench")
+    os.environ.setdefault("PINECONE_API_KEY", "bench")
+    os.environ.setdefault("AUTH_ALGORITHM", "HS256")
+    os.environ.setdefault("ACCESS_TOKEN_SECRET", "bench-access")
+    os.environ.setdefault("REFRESH_TOKEN_SECRET", "bench-refresh")
+    os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+    os.environ.setdefault("REFRESH_TOKEN_EXPIRE_DAYS", "7")
+
+def build_index(args: argparse.Namespace):
+    from bench.fakes import fake_documents, fake_embedding
+    from app.ingest import LocalSink
+
+    sink = LocalSink(os.environ["LOCAL_INDEX_PATH"])
+    chunks = [
+        { "id": str(number), **document }
+        for number, document in enumerate(fake_documents(args.documents))
+    ]
+
+    sink.upsert(chunks, [fake_embedding(chunk["text"], args.dimension) for chunk in chunks])
+    sink.close()
+
+def install_fakes(args: argparse.Namespace):
+    from bench.fakes import FakeChatModel, FakePinecone
+    from app.services.embeddings import EMBEDDING_MODEL, Embedder
+    from app.services.retrievers import PineconeRetriever
+    from app.routers.chat import chat_service
+
+    llm = FakeChatModel(args.ttft, args.token_rate, args.answer_tokens)
+    pinecone = FakePinecone(os.environ["LOCAL_INDEX_PATH"], args.dimension, args.embed_latency, args.query_latency)
+
+    chat_service.llm = llm
+    chat_service.history.llm = llm
+    chat_service.pinecone = pinecone
+    chat_service.embedder = Embedder(pinecone, EMBEDDING_MODEL)
+    chat_service.retriever = PineconeRetriever(pinecone.Index())
+
+async def timed(recorder: Recorder, endpoint: str, request) -> Optional[object]:
+    started = time.monotonic()
+
+    try:
+        response = await request
+    except Exception:
+        response = None
+
+    recorder.record(endpoint, time.monotonic() - started, response.status_code if response else None)
+
+    return response
+
+async def stream_completion(client, recorder: Recorder, session_id: str, prompt: str, use_cache: bool):
+    started = time.monotonic()
+    first_token = None
+    status = None
+
+    try:
+        async with client.stream("POST", "/chat/completion", json={
+            "content": prompt,
+            "sessionId": session_id,
+            "noCache": not use_cache
+        }) as response:
+            status = response.status_code
+
+            async for line in response.aiter_lines():
+                if first_token is None and line.startswith("data: ") and '"on_chat_model_stream"' in line:
+                    first_token = time.monotonic() - started
+
+    except Exception:
+        status = None
+
+    recorder.record("/chat/completion", time.monotonic() - started, status)
+
+    if status == 200 and first_token is not None:
+        recorder.ttft.append(first_token)
+
+async def run_user(base_url: str, number: int, args: argparse.Namespace, recorder: Recorder, signups: asyncio.Semaphore):
+    import httpx
+
+    from bench.fakes import WORDS
+
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    password = "bench-password"
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as client:
+        async with signups:
+            await timed(recorder, "/auth/signup", client.post("/auth/signup", json={
+                "username": email.split("@")[0],
+                "email": email,
+                "password": password
+            }))
+
+            for _ in range(args.logins):
+                await timed(recorder, "/auth/token", client.post("/auth/token", data={
+                    "username": email,
+                    "password": password
+                }))
+
+        if "access_token" not in client.cookies:
+            return
+
+        for session in range(args.sessions):
+            session_id = str(uuid.uuid4())
+
+            for turn in range(args.turns):
+                if args.shared_prompts and turn == 0:
+                    prompt = f"Why is my {WORDS[session % len(WORDS)]} pending?"
+                else:
+                    prompt = f"How do I change my {WORDS[(number + session + turn) % len(WORDS)]} settings? ({number}.{session}.{turn})"
+
+                await stream_completion(client, recorder, session_id, prompt, args.answer_cache)
+
+                await timed(recorder, "/chat/history", client.get(f"/chat/history/{session_id}"))
+
+async def run(args: argparse.Namespace) -> dict:
+    import httpx
+    import uvicorn
+
+    from app.main import app
+    from app.db.migrate import migrate
+
+    install_fakes(args)
+    await migrate()
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning", lifespan="on"))
+    serving = asyncio.create_task(server.serve())
+
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.05)
+
+    port = server.servers[0].sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    recorder = Recorder()
+    signups = asyncio.Semaphore(args.signup_concurrency)
+
+    await asyncio.gather(*(
+        run_user(base_url, number, args, recorder, signups)
+        for number in range(args.concurrency)
+    ))
+
+    report = recorder.report()
+
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        server_stats = (await client.get("/stats")).json()
+
+    server.should_exit = True
+    await serving
+
+    return {
+        "commit": commit(),
+        "seconds": round(time.monotonic() - recorder.started, 3),
+        "config": vars(args),
+        "endpoints": report,
+        "server": server_stats
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the backend against local stand-ins of its external services.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Number of simulated users running at once")
+    parser.add_argument("--sessions", type=int, default=2, help="Chat sessions per user")
+    parser.add_argument("--turns", type=int, default=3, help="Completions per session")
+    parser.add_argument("--logins", type=int, default=1, help="Logins per user")
+    parser.add_argument("--signup-concurrency", type=int, default=8)
+    parser.add_argument("--answer-cache", action="store_true", help="Allow first-turn answers to be served from the answer cache or shared with identical prompts in flight")
+    parser.add_argument("--shared-prompts", action="store_true", help="Send the same first-turn prompt from every user")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Model time to first token, in seconds")
+    parser.add_argument("--token-rate", type=float, default=200, help="Model tokens per second after the first one")
+    parser.add_argument("--answer-tokens", type=int, default=100)
+    parser.add_argument("--embed-latency", type=float, default=0.03, help="Embedding call latency, in seconds")
+    parser.add_argument("--query-latency", type=float, default=0.02, help="Index query latency, in seconds")
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--documents", type=int, default=1000, help="Knowledge base size")
+    parser.add_argument("--database-url", default=None, help="Database to use instead of a temporary SQLite file")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", default=None, help="Write the results to this file instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        configure(args, workdir)
+        build_index(args)
+
+        results = asyncio.run(run(args))
+
+    output = json.dumps(results, indent=2)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Local stand-ins for the external services used by the chat backend.
+
+They reproduce the interfaces the services call and a configurable
+latency, so the backend can be benchmarked offline.
+"""
+
+import time
+import asyncio
+import hashlib
+import numpy as np
+
+from types import SimpleNamespace
+from typing import AsyncIterator, Optional
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+
+from app.services.retrievers import LocalRetriever
+
+WORDS = (
+    "account billing card transfer balance statement payment limit branch loan "
+    "interest savings deposit fraud alert login password support fee mobile app"
+).split()
+
+def fake_embedding(text: str, dimension: int) -> list[float]:
+    """
+    Get a deterministic unit vector for a text.
+
+    Args:
+        text: Text to embed
+        dimension: Number of dimensions of the vector
+
+    Returns:
+        list[float]: The same vector for the same text
+    """
+
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+
+    return (vector / np.linalg.norm(vector)).tolist()
+
+def fake_documents(count: int, seed: int = 0) -> list[dict]:
+    """
+    Generate knowledge base documents of random words.
+
+    Args:
+        count: Number of documents
+        seed: Random seed
+
+    Returns:
+        list[dict]: Documents with `text`, `category` and `source`
+    """
+
+    rng = np.random.default_rng(seed)
+
+    return [
+        {
+            "text": " ".join(rng.choice(WORDS, size=60)),
+            "category": " ".join(rng.choice(WORDS, size=5)) + "?",
+            "source": f"bench:{number}"
+        }
+        for number in range(count)
+    ]
+
+class FakeChatModel:
+    """
+    Chat model streaming a fixed-length answer at a configurable pace.
+    """
+
+    def __init__(self, ttft: float, tokens_per_second: float, answer_tokens: int):
+        """
+        Args:
+            ttft: Seconds before the first token
+            tokens_per_second: Rate at which the following tokens are streamed
+            answer_tokens: Number of tokens of every answer
+        """
+
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+
+    async def astream(self, messages: list[BaseMessage]) -> AsyncIterator[AIMessageChunk]:
+        input_tokens = sum(len(str(message.content)) // 4 for message in messages)
+
+        await asyncio.sleep(self.ttft)
+
+        for index in range(self.answer_tokens):
+            if index and self.tokens_per_second > 0:
+                await asyncio.sleep(1 / self.tokens_per_second)
+
+            yield AIMessageChunk(content=WORDS[index % len(WORDS)] + " ")
+
+        yield AIMessageChunk(
+            content="",
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": self.answer_tokens,
+                "total_tokens": input_tokens + self.answer_tokens
+            }
+        )
+
+    async def ainvoke(self, messages: list[BaseMessage]) -> AIMessage:
+        await asyncio.sleep(self.ttft + self.answer_tokens / max(self.tokens_per_second, 1))
+
+        return AIMessage(content=" ".join(WORDS[:self.answer_tokens]))
+
+class FakeIndex:
+    """
+    Pinecone index answering queries from a local index after a fixed delay.
+    """
+
+    def __init__(self, retriever: LocalRetriever, latency: float):
+        self.retriever = retriever
+        self.latency = latency
+
+    def query(self, vector: list, top_k: int, include_values: bool = False, include_metadata: bool = True, filter: Optional[dict] = None) -> dict:
+        time.sleep(self.latency)
+
+        category = filter["category"]["$eq"] if filter else None
+
+        return { "matches": self.retriever.query(vector, top_k, category) }
+
+    def fetch(self, ids: list[str], namespace: str = "") -> SimpleNamespace:
+        return SimpleNamespace(vectors={})
+
+class FakeInference:
+    """
+    Pinecone inference API returning deterministic embeddings after a fixed delay.
+    """
+
+    def __init__(self, dimension: int, latency: float):
+        self.dimension = dimension
+        self.latency = latency
+        self.calls = 0
+
+    def embed(self, model: str, inputs: list[str], parameters: Optional[dict] = None) -> list:
+        self.calls += 1
+        time.sleep(self.latency)
+
+        return [SimpleNamespace(values=fake_embedding(text, self.dimension)) for text in inputs]
+
+class FakePinecone:
+    """
+    Pinecone client exposing the fake inference API and index.
+    """
+
+    def __init__(self, index_path: str, dimension: int, embed_latency: float, query_latency: float):
+        """
+        Args:
+            index_path: Directory of the local index served by the fake index
+            dimension: Number of dimensions of the embeddings
+            embed_latency: Seconds taken by every embedding call
+            query_latency: Seconds taken by every index query
+        """
+
+        self.inference = FakeInference(dimension, embed_latency)
+        self.index = FakeIndex(LocalRetriever(index_path), query_latency)
+
+    def Index(self, name: Optional[str] = None) -> FakeIndex:
+        return self.index
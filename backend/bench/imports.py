@@ -0,0 +1,85 @@
+"""
+Import time profile of the application.
+
+Imports `app.main` in fresh interpreters with `-X importtime` and reports
+the median wall-clock import time and the slowest top-level packages, as
+JSON. Cold starts pay this cost before the server can accept requests.
+
+Usage:
+    python -m bench.imports --runs 5 --top 15
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+from collections import defaultdict
+
+from bench import commit
+
+def profile(module: str) -> tuple[float, dict[str, float]]:
+    """
+    Import a module in a fresh interpreter.
+
+    Args:
+        module: Module to import
+
+    Returns:
+        tuple[float, dict[str, float]]: Wall-clock seconds of the import and
+        seconds spent importing the modules of each top-level package
+    """
+
+    environment = { **os.environ, "PYTHONDONTWRITEBYTECODE": "1" }
+    environment.pop("POSTGRES_URL", None)
+
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=environment,
+        check=True
+    )
+    elapsed = time.perf_counter() - started
+
+    packages: dict[str, float] = defaultdict(float)
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        self_time, _, name = line.split("|")
+        packages[name.strip().split(".")[0]] += int(self_time.removeprefix("import time:")) / 1e6
+
+    return elapsed, packages
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the import time of the application.")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest packages to report")
+    args = parser.parse_args()
+
+    runs = [profile(args.module) for _ in range(args.runs)]
+    packages = {
+        name: statistics.median(run[1].get(name, 0.0) for run in runs)
+        for name in set().union(*(run[1] for run in runs))
+    }
+
+    print(json.dumps({
+        "commit": commit(),
+        "module": args.module,
+        "runs": args.runs,
+        "median_seconds": round(statistics.median(run[0] for run in runs), 3),
+        "packages": {
+            name: round(seconds, 3)
+            for name, seconds in sorted(packages.items(), key=lambda item: -item[1])[:args.top]
+        }
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import os
+
+os.environ.setdefault("METRICS_ENABLED", "false")
+
+import pytest
+
+from contextlib import asynccontextmanager
+
+from app.db import connection
+from app.db.migrate import migrate
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """
+    Point the application at an empty SQLite database.
+
+    Returns a context manager creating the schema on enter and disposing
+    the engines on exit, to be used inside the event loop of the test.
+    """
+
+    monkeypatch.setenv("POSTGRES_URL", f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.delenv("POSTGRES_REPLICA_URL", raising=False)
+    monkeypatch.setattr(connection, "_settings", None)
+
+    @asynccontextmanager
+    async def open_database():
+        await migrate()
+
+        try:
+            yield
+        finally:
+            await connection.dispose_engine()
+
+    return open_database
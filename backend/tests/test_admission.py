@@ -0,0 +1,136 @@
+import asyncio
+
+from importlib import import_module
+from types import SimpleNamespace
+
+import pytest
+
+from fastapi import HTTPException
+
+from app.schemas import Prompt
+from app.services.admission import AdmissionController
+from app.services.chat import ChatService
+
+def create_controller(**limits) -> AdmissionController:
+    return AdmissionController(**{ "max_concurrent": 1, "max_queue": 1, "queue_timeout": 1, "max_per_user": 2, **limits })
+
+def test_waiting_request_is_admitted_when_a_slot_is_released():
+    async def scenario():
+        controller = create_controller()
+        first = await controller.acquire("alice")
+        waiting = asyncio.create_task(controller.acquire("bob"))
+
+        await asyncio.sleep(0)
+        assert controller.stats()["queued"] == 1
+
+        first.release()
+        first.release()
+        second = await waiting
+
+        assert controller.active == 1
+        second.release()
+        assert controller.idle
+
+    asyncio.run(scenario())
+
+def test_requests_over_the_queue_or_user_limit_are_rejected():
+    async def scenario():
+        controller = create_controller(max_per_user=1)
+        admission = await controller.acquire("alice")
+
+        with pytest.raises(HTTPException) as error:
+            await controller.acquire("alice")
+
+        assert error.value.status_code == 429
+        assert error.value.headers["Retry-After"] == "1"
+
+        waiting = asyncio.create_task(controller.acquire("bob"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(HTTPException) as error:
+            await controller.acquire("carol")
+
+        assert error.value.status_code == 429
+        assert controller.stats()["rejected"] == 2
+
+        admission.release()
+        (await waiting).release()
+
+    asyncio.run(scenario())
+
+def test_waiting_request_times_out_and_frees_its_user_slot():
+    async def scenario():
+        controller = create_controller(queue_timeout=0.01, max_per_user=1)
+        admission = await controller.acquire("alice")
+
+        with pytest.raises(HTTPException) as error:
+            await controller.acquire("bob")
+
+        assert error.value.status_code == 429
+        assert controller.stats()["timeouts"] == 1
+
+        admission.release()
+        (await controller.acquire("bob")).release()
+
+    asyncio.run(scenario())
+
+def test_draining_rejects_new_requests_and_lets_admitted_ones_finish():
+    async def scenario():
+        controller = create_controller()
+        admission = await controller.acquire("alice")
+
+        controller.drain()
+
+        with pytest.raises(HTTPException) as error:
+            await controller.acquire("bob")
+
+        assert error.value.status_code == 503
+        assert not controller.idle
+
+        async def stream():
+            yield "token"
+
+        assert [item async for item in admission.wrap(stream())] == ["token"]
+        assert controller.idle
+
+    asyncio.run(scenario())
+
+def test_completion_route_admits_before_creating_the_session(monkeypatch):
+    routes = import_module("app.routers.chat.router")
+    service = ChatService()
+    service.admission = create_controller(max_per_user=1)
+    sessions = []
+
+    async def ensure_session(session_id, user_id, prompt):
+        sessions.append(session_id)
+
+        if session_id == "foreign":
+            raise HTTPException(status_code=404, detail="Session not found")
+
+    service.ensure_session = ensure_session
+    monkeypatch.setattr(routes, "chat_service", service)
+    monkeypatch.setattr(routes.auth_service, "validate_token", lambda token: "alice")
+
+    request = SimpleNamespace(cookies={ "access_token": "token" })
+
+    async def scenario():
+        held = await service.admission.acquire("alice")
+
+        with pytest.raises(HTTPException) as error:
+            await routes.chat_completion(Prompt(content="question", sessionId="shed"), request)
+
+        assert error.value.status_code == 429
+        assert sessions == []
+
+        held.release()
+
+        with pytest.raises(HTTPException) as error:
+            await routes.chat_completion(Prompt(content="question", sessionId="foreign"), request)
+
+        assert error.value.status_code == 404
+        assert sessions == ["foreign"]
+        assert service.admission.idle
+
+        (await service.admission.acquire("alice")).release()
+
+    asyncio.run(scenario())
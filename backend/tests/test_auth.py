@@ -0,0 +1,129 @@
+import asyncio
+
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+
+import pytest
+
+from fastapi import HTTPException, Response
+
+from app.schemas.auth import PasswordChange
+from app.services.auth import AuthService
+
+routes = import_module("app.routers.auth.router")
+
+@pytest.fixture
+def auth(monkeypatch) -> AuthService:
+    monkeypatch.setenv("ACCESS_TOKEN_SECRET", "access secret")
+    monkeypatch.setenv("REFRESH_TOKEN_SECRET", "refresh secret")
+    monkeypatch.setenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+    monkeypatch.setenv("BCRYPT_ROUNDS", "4")
+
+    service = AuthService()
+    yield service
+    service.close()
+
+def cookies(response: Response) -> dict[str, str]:
+    jar = SimpleCookie()
+
+    for name, header in response.raw_headers:
+        if name == b"set-cookie":
+            jar.load(header.decode())
+
+    return { key: morsel.value for key, morsel in jar.items() }
+
+def test_validated_token_is_cached(auth):
+    access_token, _ = auth._create_tokens("user")
+
+    assert auth.validate_token(access_token) == "user"
+    assert auth.validate_token(access_token) == "user"
+
+    assert auth.token_cache.stats()["hits"] == 1
+
+def test_revoked_token_is_rejected(auth):
+    access_token, refresh_token = auth._create_tokens("user")
+    other_token, _ = auth._create_tokens("user")
+
+    auth.validate_token(access_token)
+    auth.revoke_token(access_token)
+
+    with pytest.raises(HTTPException) as error:
+        auth.validate_token(access_token)
+
+    assert error.value.status_code == 403
+    assert auth.validate_token(other_token) == "user"
+
+    auth.revoke_token(refresh_token, is_refresh_token=True)
+
+    with pytest.raises(ValueError):
+        asyncio.run(auth.refresh_token(refresh_token, db=None))
+
+def test_invalidated_user_accepts_only_tokens_issued_afterwards(auth):
+    issued_before, refresh_before = auth._create_tokens("user")
+    other_user, _ = auth._create_tokens("other")
+
+    auth.validate_token(issued_before)
+    auth.invalidate_user("user")
+
+    issued_after, _ = auth._create_tokens("user")
+
+    with pytest.raises(HTTPException):
+        auth.validate_token(issued_before)
+
+    with pytest.raises(ValueError):
+        asyncio.run(auth.refresh_token(refresh_before, db=None))
+
+    assert auth.validate_token(issued_after) == "user"
+    assert auth.validate_token(other_user) == "other"
+
+def test_logout_revokes_the_access_token(auth, monkeypatch):
+    monkeypatch.setattr(routes, "auth_service", auth)
+
+    access_token, _ = auth._create_tokens("user")
+    auth.validate_token(access_token)
+
+    response = Response()
+    asyncio.run(routes.logout(SimpleNamespace(cookies={"access_token": access_token}), response))
+
+    assert cookies(response) == {"access_token": "", "refresh_token": ""}
+
+    with pytest.raises(HTTPException):
+        auth.validate_token(access_token)
+
+def test_password_change_signs_out_other_sessions(auth, database, monkeypatch):
+    monkeypatch.setattr(routes, "auth_service", auth)
+
+    async def scenario():
+        async with database():
+            user = await auth.create_user("user", "user@example.com", "old password")
+            other_session = (await auth.authenticate_user("user@example.com", "old password")).access_token
+
+            with pytest.raises(HTTPException) as error:
+                await routes.change_password(
+                    PasswordChange(current_password="wrong", new_password="new password"),
+                    SimpleNamespace(cookies={"access_token": user.access_token}),
+                    Response()
+                )
+
+            assert error.value.status_code == 401
+            assert auth.validate_token(other_session) == user.user_id
+
+            response = Response()
+            await routes.change_password(
+                PasswordChange(current_password="old password", new_password="new password"),
+                SimpleNamespace(cookies={"access_token": user.access_token}),
+                response
+            )
+
+            with pytest.raises(HTTPException):
+                auth.validate_token(other_session)
+
+            assert auth.validate_token(cookies(response)["access_token"]) == user.user_id
+
+            with pytest.raises(ValueError):
+                await auth.authenticate_user("user@example.com", "old password")
+
+            await auth.authenticate_user("user@example.com", "new password")
+
+    asyncio.run(scenario())
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from app.services.cache import SemanticCache
+
+def rotated(similarity: float) -> list[float]:
+    """
+    Get a unit vector whose cosine similarity to [1, 0] is `similarity`.
+    """
+
+    return [similarity, float(np.sqrt(1 - similarity ** 2))]
+
+def test_lookup_hits_from_the_similarity_threshold():
+    cache = SemanticCache(max_entries=4, threshold=0.97)
+    cache.set([2.0, 0.0], "context")
+
+    assert cache.get(rotated(0.995)) == "context"
+    assert cache.get(rotated(0.98)) == "context"
+    assert cache.get(rotated(0.93)) is None
+
+    stats = cache.stats()
+
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert stats["similarity"]["le_0.95"] == 1
+    assert stats["similarity"]["le_0.99"] == 1
+    assert stats["similarity"]["le_1.0"] == 1
+
+def test_lookup_returns_the_most_similar_entry():
+    cache = SemanticCache(max_entries=4, threshold=0.9)
+    cache.set([1.0, 0.0], "first")
+    cache.set(rotated(0.95), "second")
+
+    assert cache.get(rotated(0.96)) == "second"
+    assert cache.get([1.0, 0.0]) == "first"
+
+def test_least_recently_used_entry_is_overwritten_when_full():
+    cache = SemanticCache(max_entries=2, threshold=0.99)
+    cache.set([1.0, 0.0], "first")
+    cache.set([0.0, 1.0], "second")
+    cache.get([1.0, 0.0])
+    cache.set([-1.0, 0.0], "third")
+
+    assert cache.get([1.0, 0.0]) == "first"
+    assert cache.get([0.0, 1.0]) is None
+    assert cache.get([-1.0, 0.0]) == "third"
+    assert cache.stats()["evictions"] == 1
+
+def test_invalidation_drops_entries_and_values_computed_before_it():
+    cache = SemanticCache(max_entries=4, threshold=0.99)
+    cache.set([1.0, 0.0], "stale")
+    generation = cache.generation
+
+    cache.invalidate()
+    cache.set([0.0, 1.0], "computed before the invalidation", generation=generation)
+
+    assert cache.get([1.0, 0.0]) is None
+    assert cache.get([0.0, 1.0]) is None
+    assert cache.stats()["entries"] == 0
+
+def test_expired_entries_and_other_dimensions_miss():
+    cache = SemanticCache(max_entries=4, threshold=0.99, ttl=0)
+    cache.set([1.0, 0.0], "expired")
+
+    assert cache.get([1.0, 0.0]) is None
+
+    cache = SemanticCache(max_entries=4, threshold=0.99)
+    cache.set([1.0, 0.0], "context")
+
+    assert cache.get([1.0, 0.0, 0.0]) is None
+
+def test_lookup_only_considers_entries_of_its_key():
+    cache = SemanticCache(max_entries=4, threshold=0.9)
+    cache.set([1.0, 0.0], "three chunks", key=(3, None))
+    cache.set(rotated(0.95), "five chunks", key=(5, None))
+
+    assert cache.get([1.0, 0.0], key=(5, None)) == "five chunks"
+    assert cache.get([1.0, 0.0], key=(3, "other")) is None
+    assert cache.get([1.0, 0.0]) is None
+
+    stats = cache.stats()
+
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+
+def test_cache_needs_at_least_one_entry():
+    with pytest.raises(ValueError):
+        SemanticCache(max_entries=0, threshold=0.9)
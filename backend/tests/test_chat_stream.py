@@ -0,0 +1,41 @@
+import asyncio
+
+from langchain_core.messages import AIMessageChunk
+
+from app.services.chat import ChatService
+from app.services.history import HistoryWindow
+
+class AnsweringModel:
+    """
+    Chat model stub answering every prompt at once.
+    """
+
+    async def astream(self, messages):
+        yield AIMessageChunk(content="answer")
+
+def test_stream_closes_before_the_turn_is_committed():
+    service = ChatService()
+    service.llm = AnsweringModel()
+
+    async def load(session_id):
+        return HistoryWindow(messages=[])
+
+    async def retrieve_context(prompt):
+        return ""
+
+    service.history.load = load
+    service._retrieve_context = retrieve_context
+
+    async def stream():
+        return [event async for event in service.stream_chat_events("session", "user", "question", use_cache=False)]
+
+    # The writer isn't started, so the turn is never committed
+    async def run():
+        events = await asyncio.wait_for(stream(), 1)
+
+        return events, service.writer.pending("session")
+
+    events, pending = asyncio.run(run())
+
+    assert events[-1] == { "event": "on_chat_model_end" }
+    assert [message.content for message in pending] == ["question", "answer"]
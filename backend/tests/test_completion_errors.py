@@ -0,0 +1,60 @@
+import asyncio
+import orjson
+
+from fastapi import HTTPException
+from langchain_core.messages import AIMessageChunk
+
+from app.services.chat import ChatService
+from app.services.history import HistoryWindow
+
+class FailingModel:
+    """
+    Chat model stub failing after its first token.
+    """
+
+    async def astream(self, messages):
+        yield AIMessageChunk(content="partial")
+        raise RuntimeError("model failed")
+
+def create_service(retrieve_context) -> ChatService:
+    service = ChatService()
+    service.llm = FailingModel()
+
+    async def load(session_id):
+        return HistoryWindow(messages=[])
+
+    service.history.load = load
+    service._retrieve_context = retrieve_context
+
+    return service
+
+async def events(service: ChatService) -> list[dict]:
+    frames = [frame async for frame in service.stream_chat_response("session", "user", "question", use_cache=False)]
+
+    return [orjson.loads(frame[len(b"data: "):]) for frame in frames if frame.startswith(b"data: ")]
+
+def test_retrieval_failure_ends_the_stream_with_an_error_event():
+    async def retrieve_context(prompt):
+        raise asyncio.TimeoutError()
+
+    received = asyncio.run(events(create_service(retrieve_context)))
+
+    assert received == [{ "event": "error", "status": 500, "detail": "Completion failed" }]
+
+def test_http_errors_keep_their_status():
+    async def retrieve_context(prompt):
+        raise HTTPException(status_code=503, detail="Knowledge base unavailable")
+
+    received = asyncio.run(events(create_service(retrieve_context)))
+
+    assert received == [{ "event": "error", "status": 503, "detail": "Knowledge base unavailable" }]
+
+def test_model_failure_after_tokens_ends_the_stream_with_an_error_event():
+    async def retrieve_context(prompt):
+        return ""
+
+    received = asyncio.run(events(create_service(retrieve_context)))
+
+    assert received[0] == { "event": "on_chat_model_start" }
+    assert "".join(event.get("data", "") for event in received[1:-1]) == "partial"
+    assert received[-1] == { "event": "error", "status": 500, "detail": "Completion failed" }
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.db.connection import TimedQueuePool
+
+def create_engine(tmp_path, **options):
+    return create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=TimedQueuePool,
+        **{ "pool_size": 1, "max_overflow": 0, **options }
+    )
+
+def test_pool_counts_checkouts_waiting_for_a_connection(tmp_path):
+    async def scenario():
+        engine = create_engine(tmp_path)
+        pool = engine.pool
+
+        async def query():
+            async with engine.connect() as connection:
+                await connection.execute(text("select 1"))
+
+        async with engine.connect() as held:
+            await held.execute(text("select 1"))
+            waiter = asyncio.create_task(query())
+
+            while not pool.waiting:
+                await asyncio.sleep(0.01)
+
+            await asyncio.sleep(0.05)
+
+        await waiter
+
+        assert pool.waiting == 0
+        assert pool.acquired == 2
+        assert pool.acquire_seconds >= 0.05
+
+        await engine.dispose()
+
+    asyncio.run(scenario())
+
+def test_pool_counts_checkout_timeouts(tmp_path):
+    async def scenario():
+        engine = create_engine(tmp_path, pool_timeout=0.05)
+        pool = engine.pool
+
+        async with engine.connect():
+            with pytest.raises(PoolTimeoutError):
+                async with engine.connect():
+                    pass
+
+        assert pool.waiting == 0
+        assert pool.acquire_timeouts == 1
+        assert pool.acquired == 1
+
+        await engine.dispose()
+
+    asyncio.run(scenario())
+
+def test_pool_only_counts_checkouts_without_a_connection_to_use(tmp_path):
+    async def scenario():
+        engine = create_engine(tmp_path, max_overflow=1)
+        pool = engine.pool
+        observed = []
+
+        event.listen(pool, "checkout", lambda *args: observed.append(pool.waiting))
+
+        async def query():
+            async with engine.connect() as connection:
+                await connection.execute(text("select 1"))
+
+        # Checkouts opening a connection or reusing an idle one don't wait, only the last one does
+        await query()
+        await query()
+
+        async with engine.connect():
+            await query()
+
+            async with engine.connect():
+                waiter = asyncio.create_task(query())
+
+                while not pool.waiting:
+                    await asyncio.sleep(0.01)
+
+            await waiter
+
+        await engine.dispose()
+
+        assert observed == [0, 0, 0, 0, 0, 1]
+        assert pool.waiting == 0
+
+    asyncio.run(scenario())
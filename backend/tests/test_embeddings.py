@@ -0,0 +1,128 @@
+import asyncio
+
+from app.services.embeddings import EmbeddingBatcher, EmbeddingCache, LocalSharedCache
+
+class RecordingEmbedder:
+    """
+    Embedding stub recording the batches it's called with.
+    """
+
+    def __init__(self, error: Exception = None):
+        self.batches: list[list[str]] = []
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def __call__(self, texts: list[str]) -> list[list]:
+        self.batches.append(texts)
+        await self.release.wait()
+
+        if self.error is not None:
+            raise self.error
+
+        return [[float(len(text))] for text in texts]
+
+def test_idle_request_is_embedded_right_away():
+    async def scenario():
+        embedder = RecordingEmbedder()
+        embedder.release.set()
+        batcher = EmbeddingBatcher(embedder, max_batch=8, window=10)
+
+        assert await batcher.embed("abc") == [3.0]
+        assert embedder.batches == [["abc"]]
+
+    asyncio.run(scenario())
+
+def test_requests_arriving_during_a_call_are_batched_and_deduplicated():
+    async def scenario():
+        embedder = RecordingEmbedder()
+        batcher = EmbeddingBatcher(embedder, max_batch=8, window=0.01)
+
+        first = asyncio.create_task(batcher.embed("a"))
+        await asyncio.sleep(0)
+
+        batched = [asyncio.create_task(batcher.embed(text)) for text in ("bb", "ccc", "bb")]
+        embedder.release.set()
+
+        assert await first == [1.0]
+        assert await asyncio.gather(*batched) == [[2.0], [3.0], [2.0]]
+        assert embedder.batches == [["a"], ["bb", "ccc"]]
+        assert batcher.stats()["batched_calls"] == 1
+
+    asyncio.run(scenario())
+
+def test_full_batch_is_sent_before_the_window_ends():
+    async def scenario():
+        embedder = RecordingEmbedder()
+        embedder.release.set()
+        batcher = EmbeddingBatcher(embedder, max_batch=2, window=10)
+        batcher.in_flight = 1
+
+        vectors = await asyncio.wait_for(asyncio.gather(batcher.embed("a"), batcher.embed("bb")), 1)
+
+        assert vectors == [[1.0], [2.0]]
+        assert embedder.batches == [["a", "bb"]]
+
+    asyncio.run(scenario())
+
+def test_failed_call_fails_every_request_of_the_batch():
+    async def scenario():
+        embedder = RecordingEmbedder(error=RuntimeError("embedding failed"))
+        batcher = EmbeddingBatcher(embedder, max_batch=8, window=0.01)
+        batcher.in_flight = 1
+
+        results = asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True)
+        embedder.release.set()
+
+        assert [str(result) for result in await results] == ["embedding failed"] * 2
+        assert batcher.stats()["failures"] == 1
+
+    asyncio.run(scenario())
+
+class FailingSharedCache:
+    """
+    Shared cache tier stub whose every call fails.
+    """
+
+    async def get(self, key):
+        raise ConnectionError("shared cache down")
+
+    async def set(self, key, value, ex=None):
+        raise ConnectionError("shared cache down")
+
+def create_cache(shared=None, model: str = "model") -> EmbeddingCache:
+    return EmbeddingCache(model=model, max_entries=10, max_bytes=1024, ttl=60, shared=shared)
+
+def test_prompts_differing_in_case_and_whitespace_share_an_entry():
+    async def scenario():
+        cache = create_cache()
+        await cache.set("What is  RAG?", [0.5, 0.25])
+
+        assert await cache.get(" what is rag? ") == [0.5, 0.25]
+        assert await cache.get("what is a rag?") is None
+        assert create_cache(model="other").key("what is rag?") != cache.key("what is rag?")
+
+    asyncio.run(scenario())
+
+def test_shared_tier_fills_the_local_tier_of_another_worker():
+    async def scenario():
+        shared = LocalSharedCache()
+        await create_cache(shared).set("prompt", [0.5, 0.25])
+
+        cache = create_cache(shared)
+
+        assert await cache.get("prompt") == [0.5, 0.25]
+        assert await cache.get("prompt") == [0.5, 0.25]
+        assert cache.stats()["shared_hits"] == 1
+
+    asyncio.run(scenario())
+
+def test_shared_tier_failures_fall_back_to_the_local_tier():
+    async def scenario():
+        cache = create_cache(FailingSharedCache())
+        await cache.set("prompt", [0.5])
+
+        assert await cache.get("prompt") == [0.5]
+        assert await cache.get("other") is None
+        assert cache.stats()["shared_errors"] == 2
+
+    asyncio.run(scenario())
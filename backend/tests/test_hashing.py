@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+import pytest
+
+from fastapi import HTTPException
+
+from app.services.auth import AuthService
+from app.services.hashing import PasswordHasher
+
+class BlockingContext:
+    """
+    CryptContext stub whose hashing blocks until `release` is set.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def hash(self, password: str) -> str:
+        self.release.wait(5)
+        return f"hashed {password}"
+
+def test_saturated_hasher_rejects_calls_with_503():
+    hasher = PasswordHasher(workers=1, max_queue=1, rounds=4, retry_after=3)
+    hasher.context = BlockingContext()
+
+    async def scenario():
+        running = asyncio.create_task(hasher.hash("first"))
+        queued = asyncio.create_task(hasher.hash("second"))
+        await asyncio.sleep(0)
+
+        assert hasher.stats()["queued"] == 1
+
+        with pytest.raises(HTTPException) as error:
+            await hasher.hash("third")
+
+        assert error.value.status_code == 503
+        assert error.value.headers["Retry-After"] == "3"
+
+        hasher.context.release.set()
+
+        assert await asyncio.gather(running, queued) == ["hashed first", "hashed second"]
+        assert await hasher.hash("fourth") == "hashed fourth"
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        hasher.close()
+
+    assert hasher.stats()["rejected"] == 1
+    assert hasher.stats()["completed"] == 3
+    assert hasher.in_flight == 0
+
+def test_rounds_are_configurable(monkeypatch):
+    monkeypatch.setenv("BCRYPT_ROUNDS", "5")
+    auth = AuthService()
+
+    async def scenario():
+        password_hash = await auth.hash_password("password")
+
+        assert password_hash.split("$")[2] == "05"
+        assert await auth.verify_password("password", password_hash)
+        assert not await auth.verify_password("other", password_hash)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        auth.close()
@@ -0,0 +1,68 @@
+import asyncio
+
+from importlib import import_module
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.services.chat import ChatService
+
+# The package re-exports the APIRouter under the name of its module
+routes = import_module("app.routers.chat.router")
+
+USER_ID = str(uuid4())
+
+@pytest.fixture
+def service(monkeypatch) -> ChatService:
+    service = ChatService()
+
+    monkeypatch.setattr(routes, "chat_service", service)
+    monkeypatch.setattr(routes.auth_service, "validate_token", lambda token: USER_ID)
+
+    return service
+
+def turn(number: int) -> list:
+    return [HumanMessage(content=f"question {number}"), AIMessage(content=f"answer {number}")]
+
+async def history(session_id: str, limit: int, before: int = None) -> tuple[list, str]:
+    request = SimpleNamespace(cookies={ "access_token": "token" })
+    page = await routes.get_chat_history(session_id, request, limit=limit, before=before)
+
+    return [(message.id, message.content) for message in page.messages], page.next_cursor
+
+def test_unwritten_messages_count_against_the_limit_and_have_no_id(database, service):
+    session_id = str(uuid4())
+
+    async def scenario():
+        async with database():
+            await service.ensure_session(session_id, USER_ID, "question 0")
+            await service.writer.start()
+
+            for number in range(3):
+                await service.writer.enqueue(session_id, turn(number))
+
+            await service.writer.wait(session_id)
+            await service.writer.stop()
+
+            # Queued while the writer is stopped, so it stays unwritten
+            await service.writer.enqueue(session_id, turn(3))
+
+            messages, cursor = await history(session_id, limit=4)
+
+            assert [content for _, content in messages] == ["question 2", "answer 2", "question 3", "answer 3"]
+            assert [id for id, _ in messages[2:]] == [None, None]
+            assert cursor == messages[0][0]
+
+            messages, cursor = await history(session_id, limit=2)
+
+            assert messages == [(None, "question 3"), (None, "answer 3")]
+
+            messages, cursor = await history(session_id, limit=10, before=int(cursor))
+
+            assert [content for _, content in messages][-2:] == ["question 2", "answer 2"]
+            assert len(messages) == 6 and cursor is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from app.ingest import LocalSink, chunk_document, ingest
+from app.services.retrievers import LocalRetriever
+
+class CountingEmbedder:
+    """
+    Embedder stub returning a vector per text and recording what it embedded.
+    """
+
+    def __init__(self):
+        self.texts: list[str] = []
+
+    def embed(self, inputs: list[str], input_type: str = "query") -> list[list]:
+        self.texts.extend(inputs)
+        return [[float(len(text)), 1.0] for text in inputs]
+
+def document(*paragraphs: str) -> dict:
+    return { "text": "\n\n".join(paragraphs), "category": "faq", "source": "faq.md", "file": "faq.md" }
+
+def run(paths: list, index, embedder: CountingEmbedder = None) -> dict:
+    return ingest(
+        [str(path) for path in paths],
+        embedder or CountingEmbedder(),
+        LocalSink(str(index)),
+        batch_size=8,
+        workers=1,
+        chunk_size=100,
+        chunk_overlap=20
+    )
+
+def test_chunks_never_exceed_the_chunk_size():
+    chunks = list(chunk_document(document("a" * 90, "b" * 100, "c" * 100), chunk_size=100, chunk_overlap=20))
+
+    assert [len(chunk["text"]) for chunk in chunks] == [90, 100, 100]
+
+@pytest.mark.parametrize("paragraphs", [
+    ("a" * 30, "b" * 30, "c" * 30, "d" * 30),
+    ("a" * 250,),
+    ("a" * 10, "b" * 95, "c" * 60, "d" * 77),
+])
+def test_chunks_overlap_within_the_chunk_size(paragraphs):
+    chunks = [chunk["text"] for chunk in chunk_document(document(*paragraphs), chunk_size=100, chunk_overlap=20)]
+
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert all(paragraph in "".join(chunks) or len(paragraph) > 100 for paragraph in paragraphs)
+
+def test_overlap_is_kept_when_it_fits():
+    chunks = [chunk["text"] for chunk in chunk_document(document("a" * 30, "b" * 30, "c" * 30, "d" * 30), chunk_size=100, chunk_overlap=20)]
+
+    assert chunks == ["\n\n".join(["a" * 30, "b" * 30, "c" * 30]), "c" * 20 + "\n\n" + "d" * 30]
+
+def test_chunk_overlap_must_be_smaller_than_the_chunk_size(tmp_path):
+    with pytest.raises(ValueError):
+        ingest([], CountingEmbedder(), LocalSink(str(tmp_path)), batch_size=8, workers=1, chunk_size=100, chunk_overlap=100)
+
+def test_unchanged_chunks_are_not_embedded_again(tmp_path):
+    docs, index = tmp_path / "docs", tmp_path / "index"
+    docs.mkdir()
+    (docs / "a.md").write_text("first answer\n\nsecond answer")
+
+    assert run([docs], index)["written"] == 1
+
+    embedder = CountingEmbedder()
+    stats = run([docs], index, embedder)
+
+    assert (stats["read"], stats["skipped"], stats["written"], stats["deleted"]) == (1, 1, 0, 0)
+    assert embedder.texts == []
+
+def test_chunks_of_edited_and_deleted_documents_are_removed(tmp_path):
+    docs, index = tmp_path / "docs", tmp_path / "index"
+    docs.mkdir()
+    (docs / "a.md").write_text("old answer")
+    (docs / "b.md").write_text("removed answer")
+    (tmp_path / "other.md").write_text("untouched answer")
+
+    run([docs, tmp_path / "other.md"], index)
+
+    (docs / "a.md").write_text("new answer")
+    (docs / "b.md").unlink()
+
+    stats = run([docs], index)
+
+    assert (stats["written"], stats["deleted"]) == (1, 2)
+    assert sorted(chunk["text"] for chunk in LocalRetriever(str(index)).metadata) == ["new answer", "untouched answer"]
+
+def test_chunks_with_ids_from_before_the_file_prefix_are_removed(tmp_path):
+    index = tmp_path / "index"
+    faq = tmp_path / "faq.jsonl"
+    faq.write_text(json.dumps({ "text": "current answer" }) + "\n")
+
+    sink = LocalSink(str(index))
+    sink.upsert([
+        { "id": "legacy", "text": "old answer", "category": "faq", "source": f"{faq}:1" },
+        { "id": "unrelated", "text": "other answer", "category": "faq", "source": f"{tmp_path / 'other.jsonl'}:1" },
+    ], [[1.0, 0.0], [0.0, 1.0]])
+    sink.close()
+
+    stats = run([faq], index)
+
+    assert stats["deleted"] == 1
+    assert sorted(chunk["text"] for chunk in LocalRetriever(str(index)).metadata) == ["current answer", "other answer"]
@@ -0,0 +1,139 @@
+import asyncio
+
+from langchain_core.messages import AIMessageChunk
+
+from app.services.chat import ChatService
+from app.services.history import HistoryWindow
+from app.services.retrievers import Retriever
+
+class ReindexedRetriever(Retriever):
+    """
+    Retriever stub reporting a re-index on demand.
+    """
+
+    def __init__(self):
+        self.changed = False
+
+    def query(self, embedding, top_k, category=None):
+        return []
+
+    def refresh(self) -> bool:
+        changed, self.changed = self.changed, False
+        return changed
+
+class CountingModel:
+    """
+    Chat model stub counting its calls, optionally running a hook while streaming.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.during_stream = None
+
+    async def astream(self, messages):
+        self.calls += 1
+
+        if self.during_stream is not None:
+            await self.during_stream()
+
+        yield AIMessageChunk(content=f"answer {self.calls}")
+
+def create_service() -> ChatService:
+    service = ChatService()
+    service.llm = CountingModel()
+    service.retriever = ReindexedRetriever()
+
+    async def load(session_id):
+        return HistoryWindow(messages=[])
+
+    async def retrieve_context(prompt):
+        return "context "
+
+    async def enqueue(session_id, messages):
+        pass
+
+    async def wait(session_id):
+        pass
+
+    service.history.load = load
+    service._retrieve_context = retrieve_context
+    service.writer.enqueue = enqueue
+    service.writer.wait = wait
+
+    return service
+
+async def ask(service: ChatService, prompt: str) -> list[dict]:
+    return [event async for event in service.stream_chat_events("session", "user", prompt)]
+
+def test_refresh_drops_cached_answers_and_contexts():
+    service = create_service()
+
+    async def scenario():
+        await ask(service, "question")
+        await ask(service, "question")
+
+        assert service.llm.calls == 1
+
+        assert not await service.refresh_knowledge_base()
+        assert len(service.answer_cache) == 1
+
+        service.retriever.changed = True
+        generation = service.context_cache.generation
+
+        assert await service.refresh_knowledge_base()
+        assert len(service.answer_cache) == 0
+        assert service.context_cache.generation == generation + 1
+
+        await ask(service, "question")
+
+        assert service.llm.calls == 2
+
+    asyncio.run(scenario())
+
+def test_answer_generated_across_a_refresh_is_not_cached():
+    service = create_service()
+
+    async def reindex():
+        service.retriever.changed = True
+        await service.refresh_knowledge_base()
+
+    service.llm.during_stream = reindex
+
+    async def scenario():
+        await ask(service, "question")
+
+        assert len(service.answer_cache) == 0
+
+    asyncio.run(scenario())
+
+def test_prompt_asked_after_a_refresh_does_not_follow_an_older_generation():
+    service = create_service()
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def block():
+        if service.llm.calls == 1:
+            started.set()
+            await release.wait()
+
+    service.llm.during_stream = block
+
+    async def scenario():
+        first = asyncio.create_task(ask(service, "question"))
+        await started.wait()
+
+        service.retriever.changed = True
+        await service.refresh_knowledge_base()
+
+        second = asyncio.create_task(ask(service, "question"))
+
+        while service.flights.generations + service.flights.coalesced < 2:
+            await asyncio.sleep(0)
+
+        release.set()
+
+        await asyncio.gather(first, second)
+
+        assert service.llm.calls == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,16 @@
+import os
+
+from app.services.metrics import Metrics
+
+def test_every_series_is_labelled_with_the_worker():
+    metrics = Metrics(enabled=True)
+    metrics.observe("retrieval", 0.02)
+    metrics.gauge("pool", "Pool connections.", lambda: [({ "state": "idle" }, 3), ({}, 1)])
+
+    series = [line for line in metrics.render().splitlines() if not line.startswith("#")]
+    worker = f'worker="{os.getpid()}"'
+
+    assert series
+    assert all(line.split("{", 1)[1].startswith(worker) for line in series)
+    assert f'chat_pool{{{worker},state="idle"}} 3' in series
+    assert f'chat_pool{{{worker}}} 1' in series
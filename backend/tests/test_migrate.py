@@ -0,0 +1,34 @@
+import asyncio
+
+from sqlalchemy import inspect
+from sqlalchemy.dialects import postgresql
+
+from app.db.connection import get_engine
+from app.db.migrate import create_index_concurrently_sql, upgrade
+from app.db.models import Base
+
+def test_indexes_of_existing_tables_can_be_deferred(database):
+    async def scenario():
+        async with database():
+            async with get_engine().begin() as connection:
+                await connection.exec_driver_sql("DROP INDEX ix_chat_history_session_id_id")
+
+                deferred = []
+                changes = await connection.run_sync(upgrade, deferred)
+                indexes = await connection.run_sync(lambda sync: inspect(sync).get_indexes("chat_history"))
+
+            assert changes == []
+            assert [index.name for index in deferred] == ["ix_chat_history_session_id_id"]
+            assert "ix_chat_history_session_id_id" not in { index["name"] for index in indexes }
+
+            async with get_engine().begin() as connection:
+                assert await connection.run_sync(upgrade) == ["create index ix_chat_history_session_id_id"]
+
+    asyncio.run(scenario())
+
+def test_deferred_indexes_are_built_concurrently_on_postgres():
+    index = next(index for index in Base.metadata.tables["chat_history"].indexes if index.name == "ix_chat_history_session_id_id")
+
+    assert create_index_concurrently_sql(index, postgresql.dialect()) == (
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_history_session_id_id ON chat_history (session_id, id)"
+    )
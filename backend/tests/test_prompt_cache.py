@@ -0,0 +1,111 @@
+import asyncio
+
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+
+from app.services.chat import ChatService
+from app.services.history import HistoryWindow
+
+class RecordingModel:
+    """
+    Chat model stub recording the messages of every call.
+    """
+
+    def __init__(self):
+        self.calls: list[list[BaseMessage]] = []
+
+    async def astream(self, messages: list[BaseMessage]):
+        self.calls.append(messages)
+        yield AIMessageChunk(content="answer")
+
+def cached_blocks(messages: list[BaseMessage]) -> list[tuple[int, int]]:
+    """
+    Get the (message, block) positions carrying a cache breakpoint.
+    """
+
+    return [
+        (index, block)
+        for index, message in enumerate(messages)
+        if isinstance(message.content, list)
+        for block, content in enumerate(message.content)
+        if "cache_control" in content
+    ]
+
+def cached_prefix(messages: list[BaseMessage]) -> list[tuple[str, str]]:
+    """
+    Get the messages up to the last cache breakpoint, without the breakpoint markers.
+    """
+
+    end = cached_blocks(messages)[-1][0]
+
+    return [
+        (
+            message.type,
+            message.content if isinstance(message.content, str)
+            else "".join(block["text"] for block in message.content)
+        )
+        for message in messages[:end + 1]
+    ]
+
+async def generate(service: ChatService, messages: list[BaseMessage]) -> list[BaseMessage]:
+    async for _ in service._generate(messages):
+        pass
+
+    return service.llm.calls[-1]
+
+def test_breakpoints_on_system_prompt_and_last_history_message():
+    service = ChatService()
+    service.llm = RecordingModel()
+
+    window = HistoryWindow(messages=[HumanMessage(content="hi"), AIMessage(content="hello")], summary="earlier")
+    messages = asyncio.run(generate(service, service._build_messages(window, "context ", "question")))
+
+    assert cached_blocks(messages) == [(0, 0), (2, 0)]
+    assert messages[0].content[1]["text"].endswith("earlier")
+    assert messages[-1].content == "context question"
+
+def test_no_breakpoints_when_prompt_caching_is_disabled():
+    service = ChatService()
+    service.llm = RecordingModel()
+    service.prompt_cache = False
+
+    window = HistoryWindow(messages=[HumanMessage(content="hi"), AIMessage(content="hello")])
+    messages = asyncio.run(generate(service, service._build_messages(window, "", "question")))
+
+    assert cached_blocks(messages) == []
+
+def test_cached_history_prefix_survives_until_the_window_steps(database, monkeypatch):
+    monkeypatch.setenv("HISTORY_MAX_MESSAGES", "8")
+    monkeypatch.setenv("HISTORY_WINDOW_STEP", "4")
+    monkeypatch.setenv("HISTORY_WRITE_FLUSH_SECONDS", "0")
+
+    service = ChatService()
+    service.llm = RecordingModel()
+
+    session_id = str(uuid4())
+
+    async def scenario() -> list[list[tuple[str, str]]]:
+        async with database():
+            await service.writer.start()
+            prefixes = []
+
+            for turn in range(20):
+                window = await service.history.load(session_id)
+                messages = await generate(service, service._build_messages(window, "", f"question {turn}"))
+                prefixes.append(cached_prefix(messages))
+
+                await service.writer.enqueue(session_id, [HumanMessage(content=f"question {turn}"), AIMessage(content="answer")])
+                await service.writer.wait(session_id)
+
+            await service.writer.stop()
+
+            return prefixes
+
+    prefixes = asyncio.run(scenario())
+    hits = [previous == current[:len(previous)] for previous, current in zip(prefixes, prefixes[1:])]
+
+    # Two turns per step of 4 messages: the previous prefix is cached on every other turn once the window slides
+    assert all(hits[:3])
+    assert hits.count(False) == len(hits[3:]) // 2
+    assert max(len(prefix) for prefix in prefixes) <= 1 + 8
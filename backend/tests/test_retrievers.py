@@ -0,0 +1,68 @@
+import os
+import json
+
+import numpy as np
+
+from app.services.retrievers import LocalRetriever
+
+def write_index(path, rows: list[tuple[str, str, list[float]]]):
+    vectors = np.array([vector for _, _, vector in rows], dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    np.save(os.path.join(path, LocalRetriever.VECTORS_FILE), vectors)
+
+    with open(os.path.join(path, LocalRetriever.METADATA_FILE), "w") as file:
+        json.dump([{ "id": id, "category": category } for id, category, _ in rows], file)
+
+ROWS = [
+    ("north", "maps", [0, 1, 0]),
+    ("north-east", "maps", [1, 1, 0]),
+    ("east", "weather", [1, 0, 0]),
+    ("up", "weather", [0, 0, 1]),
+]
+
+def ids(matches) -> list[str]:
+    return [match["id"] for match in matches]
+
+def test_matches_are_ordered_by_score(tmp_path):
+    write_index(tmp_path, ROWS)
+    retriever = LocalRetriever(str(tmp_path))
+
+    matches = retriever.query([2, 0.5, 0], top_k=3)
+
+    assert ids(matches) == ["east", "north-east", "north"]
+    assert matches[0]["score"] > matches[1]["score"] > matches[2]["score"]
+    assert matches[0]["metadata"] == { "id": "east", "category": "weather" }
+    assert ids(retriever.query([2, 0.5, 0.1], top_k=10)) == ["east", "north-east", "north", "up"]
+
+def test_category_filter(tmp_path):
+    write_index(tmp_path, ROWS)
+    retriever = LocalRetriever(str(tmp_path))
+
+    assert ids(retriever.query([1, 0, 0], top_k=2, category="maps")) == ["north-east", "north"]
+    assert ids(retriever.query([1, 0, 0], top_k=5, category="weather")) == ["east", "up"]
+    assert retriever.query([1, 0, 0], top_k=5, category="unknown") == []
+
+def test_query_leaves_the_embedding_untouched(tmp_path):
+    write_index(tmp_path, ROWS)
+    retriever = LocalRetriever(str(tmp_path))
+    embedding = np.array([3, 4, 0], dtype=np.float32)
+
+    retriever.query(embedding, top_k=1)
+
+    assert embedding.tolist() == [3, 4, 0]
+
+def test_refresh_reloads_a_rewritten_index(tmp_path):
+    write_index(tmp_path, ROWS)
+    retriever = LocalRetriever(str(tmp_path))
+
+    assert not retriever.refresh()
+
+    write_index(tmp_path, [("west", "maps", [-1, 0, 0]), *ROWS])
+    metadata_path = os.path.join(tmp_path, LocalRetriever.METADATA_FILE)
+    stat = os.stat(metadata_path)
+    os.utime(metadata_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert retriever.refresh()
+    assert not retriever.refresh()
+    assert ids(retriever.query([-1, 0, 0], top_k=1)) == ["west"]
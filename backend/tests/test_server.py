@@ -0,0 +1,95 @@
+import io
+import asyncio
+
+from importlib import import_module
+from types import SimpleNamespace
+
+import pytest
+import uvicorn
+
+from fastapi.testclient import TestClient
+
+from app import server
+from app.main import app
+from app.routers.chat import chat_service
+from app.services.admission import AdmissionController
+
+@pytest.fixture
+def admission(monkeypatch) -> AdmissionController:
+    admission = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=1, max_per_user=1)
+    monkeypatch.setattr(import_module("app.routers.chat"), "chat_service", SimpleNamespace(admission=admission))
+
+    return admission
+
+def create_worker(drain_timeout: float) -> server.WorkerServer:
+    return server.WorkerServer(uvicorn.Config(server.APP), drain_timeout, SimpleNamespace(value=0.0))
+
+def tick(worker: server.WorkerServer) -> bool:
+    return asyncio.run(worker.on_tick(1))
+
+def test_health_check_fails_while_draining(monkeypatch):
+    client = TestClient(app)
+
+    assert client.get("/").status_code == 200
+
+    monkeypatch.setattr(chat_service.admission, "draining", True)
+    response = client.get("/")
+
+    assert response.status_code == 503
+    assert response.json()["status"] == "Draining"
+
+def test_worker_exits_once_its_completions_finished(admission):
+    worker = create_worker(drain_timeout=60)
+    running = asyncio.run(admission.acquire("user"))
+
+    assert not tick(worker)
+
+    worker.handle_exit(server.signal.SIGTERM, None)
+
+    assert admission.draining
+    assert not tick(worker)
+    assert not worker.should_exit
+
+    running.release()
+
+    assert tick(worker)
+    assert not worker.force_exit
+
+def test_worker_exits_after_the_drain_timeout(admission):
+    worker = create_worker(drain_timeout=0)
+    asyncio.run(admission.acquire("user"))
+
+    worker.handle_exit(server.signal.SIGTERM, None)
+
+    assert tick(worker)
+
+def test_second_signal_exits_right_away(admission):
+    worker = create_worker(drain_timeout=60)
+    asyncio.run(admission.acquire("user"))
+
+    worker.handle_exit(server.signal.SIGTERM, None)
+    worker.handle_exit(server.signal.SIGTERM, None)
+
+    assert worker.should_exit and worker.force_exit
+
+@pytest.mark.parametrize("files, expected", [
+    ({}, 8),
+    ({ "/sys/fs/cgroup/cpu.max": "max 100000\n" }, 8),
+    ({ "/sys/fs/cgroup/cpu.max": "400000 100000\n" }, 4),
+    ({ "/sys/fs/cgroup/cpu.max": "250000 100000\n" }, 2),
+    ({ "/sys/fs/cgroup/cpu.max": "50000 100000\n" }, 1),
+    ({ "/sys/fs/cgroup/cpu.max": "1600000 100000\n" }, 8),
+    ({ "/sys/fs/cgroup/cpu/cpu.cfs_quota_us": "300000\n", "/sys/fs/cgroup/cpu/cpu.cfs_period_us": "100000\n" }, 3),
+    ({ "/sys/fs/cgroup/cpu/cpu.cfs_quota_us": "-1\n", "/sys/fs/cgroup/cpu/cpu.cfs_period_us": "100000\n" }, 8),
+])
+def test_available_cpus_follow_the_cgroup_quota(monkeypatch, files, expected):
+    def fake_open(path, *args, **kwargs):
+        if path not in files:
+            raise FileNotFoundError(path)
+
+        return io.StringIO(files[path])
+
+    monkeypatch.setattr(server, "open", fake_open, raising=False)
+    monkeypatch.setattr(server.os, "sched_getaffinity", lambda pid: set(range(8)), raising=False)
+
+    assert server.available_cpus() == expected
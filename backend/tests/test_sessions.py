@@ -0,0 +1,151 @@
+import asyncio
+
+from datetime import datetime, timedelta
+from importlib import import_module
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from fastapi import HTTPException
+
+from app.db import connection
+from app.db.connection import get_db, get_engine
+from app.db.migrate import upgrade
+from app.db.models import ChatHistory, Session
+from app.services.chat import ChatService
+from app.services.sessions import decode_session_cursor, encode_session_cursor
+
+routes = import_module("app.routers.chat.router")
+
+def test_upsert_creates_the_session_and_keeps_its_owner(database):
+    session_id, owner, other = str(uuid4()), str(uuid4()), str(uuid4())
+    service = ChatService()
+
+    async def scenario():
+        async with database():
+            await service.ensure_session(session_id, owner, "first prompt")
+            service.sessions.owner_cache.clear()
+            await service.ensure_session(session_id, owner, "second prompt")
+
+            service.sessions.owner_cache.clear()
+
+            with pytest.raises(HTTPException) as error:
+                await service.ensure_session(session_id, other, "third prompt")
+
+            assert error.value.status_code == 404
+
+            async with get_db() as db:
+                sessions = await service.sessions.get_sessions(owner, 10, None, db)
+
+            assert [(session.id, session.title) for session in sessions] == [(session_id, "first prompt")]
+
+    asyncio.run(scenario())
+
+def test_history_is_only_authorized_for_the_owner(database):
+    session_id, owner, other = str(uuid4()), str(uuid4()), str(uuid4())
+    service = ChatService()
+
+    async def scenario():
+        async with database():
+            await service.ensure_session(session_id, owner, "prompt")
+            service.sessions.owner_cache.clear()
+
+            await service.authorize_session(session_id, owner)
+
+            for user_id, requested in ((other, session_id), (owner, str(uuid4()))):
+                with pytest.raises(HTTPException) as error:
+                    await service.authorize_session(requested, user_id)
+
+                assert error.value.status_code == 404
+
+    asyncio.run(scenario())
+
+def test_session_missing_from_a_lagging_replica_is_read_from_the_primary(database, tmp_path, monkeypatch):
+    session_id, owner = str(uuid4()), str(uuid4())
+    creating, reading = ChatService(), ChatService()
+
+    monkeypatch.setenv("POSTGRES_REPLICA_URL", f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    monkeypatch.setattr(connection, "_settings", None)
+
+    async def scenario():
+        async with database():
+            async with get_engine(readonly=True).begin() as replica:
+                await replica.run_sync(upgrade)
+
+            await creating.ensure_session(session_id, owner, "prompt")
+            await reading.authorize_session(session_id, owner)
+
+    asyncio.run(scenario())
+
+def test_session_cursor_round_trip():
+    created_at, session_id = datetime(2024, 5, 1, 12, 30, 15, 250), str(uuid4())
+
+    assert decode_session_cursor(encode_session_cursor(created_at, session_id)) == (created_at, session_id)
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", encode_session_cursor(datetime(2024, 5, 1), "not a uuid")])
+def test_malformed_session_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_session_cursor(cursor)
+
+def test_session_pages_follow_the_cursor_across_equal_creation_dates(database, monkeypatch):
+    owner, other = str(uuid4()), str(uuid4())
+    service = ChatService()
+
+    monkeypatch.setattr(routes, "chat_service", service)
+    monkeypatch.setattr(routes.auth_service, "validate_token", lambda token: owner)
+
+    # Pairs of sessions share their creation date, so the id breaks the tie
+    start = datetime(2024, 5, 1)
+    sessions = [
+        Session(id=str(uuid4()), user_id=owner, title=f"session {number}", created_at=start + timedelta(minutes=number // 2))
+        for number in range(7)
+    ]
+    expected = [session.id for session in sorted(sessions, key=lambda session: (session.created_at, session.id), reverse=True)]
+
+    async def scenario():
+        async with database():
+            async with get_db() as db:
+                db.add_all(sessions)
+                db.add(Session(id=str(uuid4()), user_id=other, title="other", created_at=start))
+
+            request = SimpleNamespace(cookies={ "access_token": "token" })
+            pages, cursor = [], None
+
+            while True:
+                page = await routes.get_sessions(request, limit=3, before=cursor)
+                pages.append([str(session.id) for session in page.sessions])
+                cursor = page.next_cursor
+
+                if cursor is None:
+                    break
+
+            assert [len(page) for page in pages] == [3, 3, 1]
+            assert [session_id for page in pages for session_id in page] == expected
+
+            with pytest.raises(HTTPException) as error:
+                await routes.get_sessions(request, limit=3, before="not a cursor")
+
+            assert error.value.status_code == 400
+
+    asyncio.run(scenario())
+
+def test_recent_messages_are_read_backwards_from_the_cursor(database):
+    session_id = str(uuid4())
+    service = ChatService()
+
+    async def scenario():
+        async with database():
+            async with get_db() as db:
+                db.add(Session(id=session_id, user_id=str(uuid4()), title="session", created_at=datetime.now()))
+                await db.flush()
+                db.add_all(ChatHistory(session_id=session_id, message={ "number": number }) for number in range(5))
+
+            async with get_db() as db:
+                latest = await service.sessions.get_recent_messages(session_id, 2, db)
+                earlier = await service.sessions.get_recent_messages(session_id, 2, db, before=latest[0].id)
+                first = await service.sessions.get_recent_messages(session_id, 2, db, before=earlier[0].id)
+
+            assert [[row.message["number"] for row in page] for page in (latest, earlier, first)] == [[3, 4], [1, 2], [0]]
+
+    asyncio.run(scenario())
@@ -0,0 +1,121 @@
+import asyncio
+
+from app.services.singleflight import SingleFlight
+
+class Generation:
+    """
+    Event stream stub producing its tokens one at a time, when released.
+    """
+
+    def __init__(self, tokens: list[str], error: Exception = None):
+        self.tokens = tokens
+        self.error = error
+        self.started = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.started += 1
+
+        try:
+            for token in self.tokens:
+                await self.release.wait()
+                yield { "event": "on_chat_model_stream", "data": token }
+
+            if self.error is not None:
+                raise self.error
+
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+async def collect(events) -> list[str]:
+    return [event["data"] async for event in events]
+
+def test_identical_requests_share_one_generation():
+    async def scenario():
+        flights = SingleFlight()
+        generation = Generation(["a", "b"])
+
+        first = asyncio.create_task(collect(flights.stream("key", generation)))
+        second = asyncio.create_task(collect(flights.stream("key", generation)))
+        other = asyncio.create_task(collect(flights.stream("other", generation)))
+
+        await asyncio.sleep(0)
+        generation.release.set()
+
+        assert await asyncio.gather(first, second, other) == [["a", "b"]] * 3
+        assert generation.started == 2
+        assert flights.stats() == { "in_flight": 0, "generations": 2, "coalesced": 1 }
+
+    asyncio.run(scenario())
+
+def test_late_subscriber_replays_the_events_produced_so_far():
+    async def scenario():
+        flights = SingleFlight()
+        generation = Generation(["a", "b", "c"])
+
+        first = flights.stream("key", generation)
+        generation.release.set()
+
+        assert (await anext(first))["data"] == "a"
+
+        second = flights.stream("key", generation)
+
+        assert await collect(second) == ["a", "b", "c"]
+        assert await collect(first) == ["b", "c"]
+
+    asyncio.run(scenario())
+
+def test_errors_reach_every_subscriber():
+    async def scenario():
+        flights = SingleFlight()
+        generation = Generation(["a"], error=RuntimeError("model failed"))
+        generation.release.set()
+
+        results = await asyncio.gather(
+            collect(flights.stream("key", generation)),
+            collect(flights.stream("key", generation)),
+            return_exceptions=True
+        )
+
+        assert [str(result) for result in results] == ["model failed"] * 2
+        assert generation.started == 1
+
+    asyncio.run(scenario())
+
+def test_generation_is_cancelled_once_every_subscriber_left():
+    async def scenario():
+        flights = SingleFlight()
+        generation = Generation(["a", "b"])
+
+        first = flights.stream("key", generation)
+        second = flights.stream("key", generation)
+        waiting = [asyncio.create_task(anext(stream)) for stream in (first, second)]
+
+        await asyncio.sleep(0)
+
+        for task in waiting:
+            task.cancel()
+
+        await asyncio.gather(*waiting, return_exceptions=True)
+        await first.aclose()
+        await second.aclose()
+        await asyncio.sleep(0)
+
+        assert generation.cancelled
+        assert flights.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+def test_disabled_single_flight_generates_for_every_request():
+    async def scenario():
+        flights = SingleFlight(enabled=False)
+        generation = Generation(["a"])
+        generation.release.set()
+
+        await asyncio.gather(collect(flights.stream("key", generation)), collect(flights.stream("key", generation)))
+
+        assert generation.started == 2
+
+    asyncio.run(scenario())
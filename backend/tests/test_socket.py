@@ -0,0 +1,204 @@
+import asyncio
+import orjson
+
+from importlib import import_module
+
+import pytest
+
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.main import app
+from app.routers.auth import auth_service
+from app.routers.chat.socket import ChatSocket
+from app.services.admission import AdmissionController
+from app.services.streaming import SSEEncoder, STREAM_EVENT
+
+routes = import_module("app.routers.chat.router")
+
+class FakeChatService:
+    """
+    Chat service stub whose prompts script the stream:
+
+        "wait:<name>"   streams a token, then waits until <name> is set
+        "set:<name>"    streams a token and sets <name>
+        "count:<n>"     streams n tokens
+    """
+
+    def __init__(self):
+        self.encoder = SSEEncoder(flush_bytes=1, flush_interval=0, keepalive_interval=60, max_pending=1)
+        self.admission = AdmissionController(max_concurrent=8, max_queue=8, queue_timeout=1, max_per_user=8)
+        self.signals: dict[str, asyncio.Event] = {}
+        self.cancelled: list[str] = []
+        self.produced = 0
+
+    async def ensure_session(self, session_id, user_id, prompt):
+        pass
+
+    async def stream_chat_events(self, session_id, user_id, prompt, use_cache=True):
+        action, argument = prompt.split(":")
+
+        try:
+            if action == "count":
+                for _ in range(int(argument)):
+                    self.produced += 1
+                    yield { "event": STREAM_EVENT, "data": "token" }
+            else:
+                yield { "event": STREAM_EVENT, "data": prompt }
+
+                signal = self.signals.setdefault(argument, asyncio.Event())
+
+                if action == "wait":
+                    await signal.wait()
+                else:
+                    signal.set()
+
+            yield { "event": "on_chat_model_end" }
+
+        except asyncio.CancelledError:
+            self.cancelled.append(prompt)
+            raise
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(auth_service, "validate_token", lambda token: "user")
+
+    return TestClient(app, cookies={ "access_token": "token" })
+
+@pytest.fixture
+def service(monkeypatch) -> FakeChatService:
+    service = FakeChatService()
+    monkeypatch.setattr(routes, "chat_service", service)
+
+    return service
+
+def connect(client: TestClient):
+    return client.websocket_connect("/chat/ws", headers={ "origin": "http://localhost:3000" })
+
+def completion(stream_id: str, prompt: str) -> dict:
+    return { "type": "completion", "id": stream_id, "sessionId": "session", "content": prompt }
+
+def receive_until_end(websocket, stream_ids: set[str]) -> list[tuple[str, str]]:
+    """
+    Receive messages until all the given streams ended, as (id, event) pairs.
+    """
+
+    received = []
+
+    while stream_ids:
+        message = websocket.receive_json()
+        received.append((message["id"], message["event"]))
+
+        if message["event"] in ("on_chat_model_end", "error", "cancelled"):
+            stream_ids.discard(message["id"])
+
+    return received
+
+def test_handshake_from_allowed_origin_is_accepted(client):
+    with client.websocket_connect("/chat/ws", headers={ "origin": "http://localhost:3000" }) as websocket:
+        websocket.send_json({ "type": "cancel" })
+
+        assert websocket.receive_json()["status"] == 422
+
+@pytest.mark.parametrize("headers", [{ "origin": "https://attacker.example" }, {}])
+def test_handshake_from_other_origin_is_refused(client, headers):
+    with pytest.raises(WebSocketDisconnect) as error:
+        with client.websocket_connect("/chat/ws", headers=headers):
+            pass
+
+    assert error.value.code == 1008
+
+def test_completions_are_multiplexed_on_one_connection(client, service):
+    with connect(client) as websocket:
+        websocket.send_json(completion("1", "wait:go"))
+        assert websocket.receive_json() == { "id": "1", "event": STREAM_EVENT, "data": "wait:go" }
+
+        # The second completion streams while the first one is still open, and releases it
+        websocket.send_json(completion("2", "set:go"))
+
+        received = receive_until_end(websocket, {"1", "2"})
+
+    assert received.index(("2", STREAM_EVENT)) < received.index(("1", "on_chat_model_end"))
+    assert ("2", "on_chat_model_end") in received
+    assert service.admission.idle
+
+def test_cancel_aborts_the_generation(client, service):
+    with connect(client) as websocket:
+        websocket.send_json(completion("1", "wait:never"))
+        websocket.receive_json()
+
+        websocket.send_json({ "type": "cancel", "id": "1" })
+        assert websocket.receive_json() == { "id": "1", "event": "cancelled" }
+
+        websocket.send_json(completion("2", "set:other"))
+        assert ("2", "on_chat_model_end") in receive_until_end(websocket, {"2"})
+
+    assert service.cancelled == ["wait:never"]
+    assert service.admission.idle
+
+def test_completions_over_the_stream_limit_are_rejected(client, service, monkeypatch):
+    monkeypatch.setenv("WS_MAX_STREAMS", "1")
+
+    with connect(client) as websocket:
+        websocket.send_json(completion("1", "wait:go"))
+        websocket.receive_json()
+
+        websocket.send_json(completion("1", "set:go"))
+        assert websocket.receive_json()["status"] == 409
+
+        websocket.send_json(completion("2", "set:go"))
+        assert websocket.receive_json()["status"] == 429
+
+        websocket.send_json({ "type": "cancel", "id": "1" })
+        assert websocket.receive_json()["event"] == "cancelled"
+
+        websocket.send_json(completion("3", "set:go"))
+        assert ("3", "on_chat_model_end") in receive_until_end(websocket, {"3"})
+
+class SlowWebSocket:
+    """
+    WebSocket stub whose client only reads once `reading` is set.
+    """
+
+    def __init__(self):
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.reading = asyncio.Event()
+        self.sent: list[dict] = []
+
+    async def receive(self) -> dict:
+        return await self.incoming.get()
+
+    async def send_text(self, text: str):
+        await self.reading.wait()
+        self.sent.append(orjson.loads(text))
+
+def test_slow_client_holds_back_the_generation(monkeypatch):
+    monkeypatch.setattr(auth_service, "validate_token", lambda token: "user")
+
+    service = FakeChatService()
+    websocket = SlowWebSocket()
+
+    async def scenario():
+        socket = ChatSocket(websocket, service, "user", "token", max_streams=8, max_pending=2)
+        serving = asyncio.create_task(socket.serve())
+
+        await websocket.incoming.put({ "type": "websocket.receive", "text": orjson.dumps(completion("1", "count:100")).decode() })
+
+        for _ in range(100):
+            await asyncio.sleep(0)
+
+        # Only the bounded queues between the model and the client fill up
+        assert 0 < service.produced <= 8
+
+        websocket.reading.set()
+
+        while not websocket.sent or websocket.sent[-1]["event"] != "on_chat_model_end":
+            await asyncio.sleep(0.01)
+
+        await websocket.incoming.put({ "type": "websocket.disconnect" })
+        await serving
+
+    asyncio.run(scenario())
+
+    assert service.produced == 100
+    assert sum(message["event"] == STREAM_EVENT for message in websocket.sent) == 100
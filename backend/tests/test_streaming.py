@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from app.services.streaming import KEEP_ALIVE, SSEEncoder
+
+def token(text: str) -> dict:
+    return { "event": "on_chat_model_stream", "data": text }
+
+async def stream(*events, delay: float = 0):
+    for event in events:
+        if delay:
+            await asyncio.sleep(delay)
+
+        if isinstance(event, Exception):
+            raise event
+
+        yield event
+
+async def collect(events) -> list:
+    return [event async for event in events]
+
+def test_tokens_are_coalesced_until_the_byte_threshold_and_other_events():
+    encoder = SSEEncoder(flush_bytes=4, flush_interval=10, keepalive_interval=10)
+    events = stream({ "event": "on_chat_model_start" }, token("ab"), token("cd"), token("e"), { "event": "on_chat_model_end" })
+
+    assert asyncio.run(collect(encoder.coalesce(events))) == [
+        { "event": "on_chat_model_start" },
+        token("abcd"),
+        token("e"),
+        { "event": "on_chat_model_end" },
+    ]
+
+def test_buffered_tokens_are_flushed_after_the_interval():
+    encoder = SSEEncoder(flush_bytes=1024, flush_interval=0.01, keepalive_interval=10)
+    events = stream(token("a"), token("b"), token("c"), delay=0.03)
+
+    assert asyncio.run(collect(encoder.coalesce(events))) == [token("a"), token("b"), token("c")]
+
+def test_silence_produces_keep_alive_comments():
+    encoder = SSEEncoder(flush_bytes=1024, flush_interval=0.01, keepalive_interval=0.01)
+    frames = asyncio.run(collect(encoder.encode(stream({ "event": "timing" }, delay=0.05))))
+
+    assert KEEP_ALIVE in frames
+    assert frames[-1] == b'data: {"event":"timing"}\n\n'
+
+def test_buffered_tokens_are_sent_before_an_error():
+    encoder = SSEEncoder(flush_bytes=1024, flush_interval=10, keepalive_interval=10)
+    received = []
+
+    async def scenario():
+        async for event in encoder.coalesce(stream(token("partial"), RuntimeError("model failed"))):
+            received.append(event)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
+
+    assert received == [token("partial")]
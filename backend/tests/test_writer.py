@@ -0,0 +1,96 @@
+import asyncio
+
+from uuid import uuid4
+from sqlalchemy import select, text
+from langchain_core.messages import AIMessage, HumanMessage, messages_from_dict
+
+from app.db.connection import get_db
+from app.db.models import ChatHistory
+from app.services.writer import MessageWriter
+
+def turn(prompt: str) -> list:
+    return [HumanMessage(content=prompt), AIMessage(content=f"answer to {prompt}")]
+
+async def persisted(session_id: str) -> list[str]:
+    async with get_db() as db:
+        rows = await db.scalars(select(ChatHistory).where(ChatHistory.session_id == session_id).order_by(ChatHistory.id))
+
+        return [message.content for message in messages_from_dict([row.message for row in rows])]
+
+def test_turns_are_pending_until_committed_in_one_batch(database):
+    first, second = str(uuid4()), str(uuid4())
+
+    async def scenario():
+        async with database():
+            writer = MessageWriter(batch_size=10, flush_interval=0.05, max_queue=10)
+            await writer.start()
+
+            written = [
+                await writer.enqueue(first, turn("one")),
+                await writer.enqueue(second, turn("two")),
+                await writer.enqueue(first, turn("three")),
+            ]
+
+            assert [message.content for message in writer.pending(first)] == ["one", "answer to one", "three", "answer to three"]
+            assert all(message.id for message in writer.pending(first))
+
+            await writer.wait(first)
+
+            assert all(future.result() for future in written)
+            assert writer.pending(first) == [] and writer.pending(second) == []
+            assert writer.stats()["batches"] == 1
+            assert await persisted(first) == ["one", "answer to one", "three", "answer to three"]
+            assert await persisted(second) == ["two", "answer to two"]
+
+            await writer.stop()
+
+    asyncio.run(scenario())
+
+def test_failing_batch_is_retried_one_session_at_a_time(database):
+    valid, rejected = uuid4(), uuid4()
+
+    async def scenario():
+        async with database():
+            async with get_db() as db:
+                await db.execute(text(
+                    "CREATE TRIGGER reject_session BEFORE INSERT ON chat_history "
+                    f"WHEN NEW.session_id IN ('{rejected}', '{rejected.hex}') "
+                    "BEGIN SELECT RAISE(ABORT, 'rejected'); END"
+                ))
+
+            writer = MessageWriter(batch_size=10, flush_interval=0.05, max_queue=10, max_retries=1)
+            await writer.start()
+
+            written = await writer.enqueue(str(valid), turn("kept"))
+            dropped = await writer.enqueue(str(rejected), turn("lost"))
+
+            await asyncio.gather(writer.wait(str(valid)), writer.wait(str(rejected)))
+
+            assert written.result() is True
+            assert dropped.result() is False
+            assert writer.pending(str(rejected)) == []
+            assert writer.stats()["dropped"] == 2
+            assert await persisted(str(valid)) == ["kept", "answer to kept"]
+            assert await persisted(str(rejected)) == []
+
+            await writer.stop()
+
+    asyncio.run(scenario())
+
+def test_stop_flushes_queued_turns(database):
+    session_id = str(uuid4())
+
+    async def scenario():
+        async with database():
+            writer = MessageWriter(batch_size=2, flush_interval=10, max_queue=10)
+            await writer.start()
+
+            for prompt in ("one", "two", "three"):
+                await writer.enqueue(session_id, turn(prompt))
+
+            await writer.stop()
+
+            assert writer.pending(session_id) == []
+            assert len(await persisted(session_id)) == 6
+
+    asyncio.run(scenario())
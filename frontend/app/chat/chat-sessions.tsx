@@ -28,16 +28,27 @@ export function ChatSessions() {
   const setSessionId = useChatStore((state) => state.setSessionId)
   
   const [sessions, setSessions] = useState<Session[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
 
   useEffect(() => {
     const loadSessionsHistory = async () => {
-      const sessions = await getSessions()
-      setSessions(sessions)
+      const page = await getSessions()
+      setSessions(page.sessions)
+      setNextCursor(page.next_cursor ?? null)
     }
 
     loadSessionsHistory()
   }, [sessionId])
 
+  const handleLoadMore = async () => {
+    if (!nextCursor) return
+
+    const page = await getSessions(nextCursor)
+
+    setSessions((sessions) => [...sessions, ...page.sessions])
+    setNextCursor(page.next_cursor ?? null)
+  }
+
   const handleSessionClick = (sessionId: string) => {
     const params = new URLSearchParams(searchParams.toString())
 
@@ -75,6 +86,14 @@ export function ChatSessions() {
           {title}
         </div>
       ))}
+      {nextCursor && (
+        <div
+          className='text-sm text-gray-500 hover:text-gray-800 px-4 py-3 cursor-pointer transition-colors'
+          onClick={handleLoadMore}
+        >
+          Load more
+        </div>
+      )}
     </div> 
   )
 }
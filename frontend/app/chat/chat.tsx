@@ -1,7 +1,7 @@
 'use client'
 
 // react
-import { useEffect } from 'react'
+import { useEffect, useRef, useState } from 'react'
 
 // next
 import { useSearchParams } from 'next/navigation'
@@ -28,6 +28,9 @@ export function Chat() {
 
   const sessionId = params.get('sessionId')
 
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const loadedEarlier = useRef(false)
+
   const { messagesRef, scrollRef, scrollToBottom } = useScrollAnchor()
 
   useEffect(() => {
@@ -37,9 +40,11 @@ export function Chat() {
         
         setSessionId(sessionId)
         setMessages(history.messages)
+        setNextCursor(history.next_cursor ?? null)
       } else {
         setSessionId()
         setMessages([])
+        setNextCursor(null)
       }
     }
 
@@ -47,9 +52,25 @@ export function Chat() {
   }, [sessionId, setMessages, setSessionId])
 
   useEffect(() => {
+    // Earlier messages are prepended, keep the reader where they are
+    if (loadedEarlier.current) {
+      loadedEarlier.current = false
+      return
+    }
+
     scrollToBottom()
   }, [messages, scrollToBottom])
 
+  const handleLoadEarlier = async () => {
+    if (!sessionId || !nextCursor) return
+
+    const history = await getHistory(sessionId, nextCursor)
+
+    loadedEarlier.current = true
+    setMessages([...history.messages, ...useChatStore.getState().messages])
+    setNextCursor(history.next_cursor ?? null)
+  }
+
   return (
     <div className="relative h-full w-full flex flex-col">
       <div
@@ -57,6 +78,14 @@ export function Chat() {
         ref={scrollRef}
       >
         <div className='pt-16 pb-[200px]' ref={messagesRef}>
+          {nextCursor && (
+            <div
+              className='text-center text-sm text-gray-500 hover:text-gray-800 mb-4 cursor-pointer transition-colors'
+              onClick={handleLoadEarlier}
+            >
+              Load earlier messages
+            </div>
+          )}
           {messages.length ? <ChatList /> : <EmptyScreen />}
         </div>
       </div>
@@ -4,7 +4,7 @@ import { messageId } from '@/lib/utils'
 import { processStreamRecursively } from '@/lib/stream'
 
 // types
-import { History, Session, User } from '@/types/chat'
+import { History, Message, SessionPage, User } from '@/types/chat'
 
 /**
  * Initiates a chat conversation with the AI using the provided prompt
@@ -50,14 +50,16 @@ export async function chat(sessionId: string, prompt: string) {
 }
 
 /**
- * Retrieves chat history for a given session
+ * Retrieves a page of chat history for a given session
  * @param sessionId The ID of the chat session to fetch history for
- * @returns Promise containing an array of chat messages
+ * @param before Cursor of the page to fetch, the latest messages if omitted
+ * @returns Promise containing an array of chat messages and the cursor of the older ones
  * @throws {Error} When the fetch request fails
  */
-export async function getHistory(sessionId: string): Promise<History> {
+export async function getHistory(sessionId: string, before?: string): Promise<History> {
   try {
-    const response = await fetch(`/api/chat/history/${sessionId}`, 
+    const query = before ? `?${new URLSearchParams({ before })}` : ''
+    const response = await fetch(`/api/chat/history/${sessionId}${query}`, 
       {
         method: 'GET',
         credentials: 'include',
@@ -74,7 +76,14 @@ export async function getHistory(sessionId: string): Promise<History> {
 
     const history = await response.json()
 
-    return history
+    // Messages that are not written yet have no id
+    return {
+      ...history,
+      messages: history.messages.map((message: Message) => ({
+        ...message,
+        id: message.id ?? messageId(),
+      })),
+    }
   } 
   catch (error) {
     console.error('Error fetching session history:', error)
@@ -85,13 +94,15 @@ export async function getHistory(sessionId: string): Promise<History> {
 }
 
 /**
- * Retrieves all available chat sessions
- * @returns Promise containing an array of session IDs
+ * Retrieves a page of the available chat sessions
+ * @param before Cursor of the page to fetch, the newest sessions if omitted
+ * @returns Promise containing an array of sessions and the cursor of the older ones
  * @throws {Error} When the fetch request fails
  */
-export async function getSessions(): Promise<Session[]> {
+export async function getSessions(before?: string): Promise<SessionPage> {
   try {
-    const response = await fetch('/api/chat/sessions', 
+    const query = before ? `?${new URLSearchParams({ before })}` : ''
+    const response = await fetch(`/api/chat/sessions${query}`, 
       {
         method: 'GET',
         credentials: 'include',
@@ -106,13 +117,15 @@ export async function getSessions(): Promise<Session[]> {
       throw new Error(error.detail)
     }
 
-    const sessions = await response.json()
+    const page = await response.json()
     
-    return sessions
+    return page
   } 
   catch (error) {
     console.error('Error fetching sessions:', error)
-    return []
+    return {
+      sessions: []
+    }
   }
 }
 
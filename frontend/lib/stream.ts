@@ -95,7 +95,24 @@ export function handleStreamEvent(
       content: accMessage.content,
     })
     break
+  case 'error':
+    if (store.messages.some((message) => message.id === aiMessageId)) {
+      store.editMessage({
+        id: aiMessageId,
+        content: accMessage.content || parsedChunk.detail,
+        error: parsedChunk.detail,
+      })
+    } else {
+      store.addMessage({
+        id: aiMessageId,
+        content: parsedChunk.detail,
+        type: Type.AI,
+        error: parsedChunk.detail,
+      })
+    }
+    break
   case 'on_chat_model_end':
+  case 'timing':
     break
   default:
     console.error('Unknown event:', parsedChunk.event)
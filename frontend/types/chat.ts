@@ -28,6 +28,8 @@ export interface Message {
 export interface History {
   /** Array of chat messages in chronological order */
   messages: Message[];
+  /** Cursor of the page of older messages, if any */
+  next_cursor?: string | null;
 }
 
 /**
@@ -40,6 +42,16 @@ export interface Session {
   title: string;
 }
 
+/**
+ * Represents a page of chat sessions, newest first.
+ */
+export interface SessionPage {
+  /** Array of chat sessions */
+  sessions: Session[];
+  /** Cursor of the page of older sessions, if any */
+  next_cursor?: string | null;
+}
+
 /**
  * Represents user information.
  */